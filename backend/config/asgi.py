@@ -2,6 +2,9 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with e.g. ``uvicorn config.asgi:application`` and ASYNC_READ_VIEWS=true
+to serve the cashier read paths from crm/async_views.py.
+Set DB_CONNECTION_MODE to "none" or "pool" here, not "persistent".
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 
+import importlib.util
 from pathlib import Path
-from decouple import AutoConfig
+import tempfile
+from decouple import AutoConfig, Csv
+from django.core.exceptions import ImproperlyConfigured
 
 from dotenv import load_dotenv
 
@@ -57,6 +60,8 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
+    # Lists are paged by cursor; see crm.pagination.
+    "DEFAULT_PAGINATION_CLASS": "crm.pagination.KeysetPagination",
     "DEFAULT_THROTTLE_RATES": {
         "scan": "30/min",
         "qr": "30/min",
@@ -78,6 +83,68 @@ MIDDLEWARE = [
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Upper bound, in seconds, on how long a worker serves ProgramSettings before
+# checking the stored version again.
+PROGRAM_SETTINGS_CACHE_SECONDS = config("PROGRAM_SETTINGS_CACHE_SECONDS", default=30, cast=int)
+
+# Shared cache for all workers, e.g. REDIS_URL=redis://127.0.0.1:6379/1 (needs the
+# redis package). Without it each worker gets its own in-memory cache.
+REDIS_URL = config("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        },
+    }
+
+# Lifetime of cached scan/lookup/history payloads. Writes invalidate them in the
+# shared cache, so the payload cache is off (0) unless REDIS_URL is set: with
+# per-worker caches the other workers would keep serving stale stamps.
+MEMBERSHIP_CACHE_SECONDS = config("MEMBERSHIP_CACHE_SECONDS", default=60 if REDIS_URL else 0, cast=int)
+
+# Serve scan, lookup and history-summary from the native async views in
+# crm/async_views.py. Meant for ASGI deployments (uvicorn config.asgi:application);
+# under WSGI each call would be run through a per-request event loop instead.
+ASYNC_READ_VIEWS = config("ASYNC_READ_VIEWS", default=False, cast=bool)
+
+# Rendered card QR codes: number of images kept in memory per worker, and an
+# optional directory shared by all workers.
+QR_CACHE_SIZE = config("QR_CACHE_SIZE", default=1024, cast=int)
+QR_CACHE_DIR = config("QR_CACHE_DIR", default="") or None
+
+# Country calling code given to local 0-prefixed phone numbers in lookup keys.
+# Run refresh_phone_keys after changing it.
+PHONE_COUNTRY_CODE = config("PHONE_COUNTRY_CODE", default="62")
+
+# Card numbers each worker reserves from the database at a time.
+CARD_NUMBER_BLOCK_SIZE = config("CARD_NUMBER_BLOCK_SIZE", default=100, cast=int)
+
+# Throttle buckets (see crm/throttles.py): "cache" keeps them in the shared
+# cache (the default with REDIS_URL); "file" in a SQLite file shared by the
+# workers of one host (the default without it, since the in-memory cache is per
+# worker); "db" in the main database, shared across hosts at the cost of a
+# primary write on every scan, QR and report request.
+THROTTLE_STORE = config("THROTTLE_STORE", default="cache" if REDIS_URL else "file")
+THROTTLE_STORE_PATH = config(
+    "THROTTLE_STORE_PATH",
+    default=str(Path(tempfile.gettempdir()) / "kopihub_throttle.sqlite3"),
+)
+# Comma-separated X-Device-ID values of the tills; each gets its own bucket.
+# Other device ids are ignored and only the per-cashier bucket applies.
+THROTTLE_DEVICE_IDS = config("THROTTLE_DEVICE_IDS", default="", cast=Csv())
+
+# Buffered audit log writes: flush after this many entries or once the oldest
+# entry is this many seconds old.
+AUDIT_BUFFER_SIZE = config("AUDIT_BUFFER_SIZE", default=100, cast=int)
+AUDIT_FLUSH_SECONDS = config("AUDIT_FLUSH_SECONDS", default=2.0, cast=float)
+
+# Scans are counted per card, cashier and hour instead of audited one by one;
+# set AUDIT_SCAN_MODE=full to write an audit row per scan again.
+AUDIT_SCAN_MODE = config("AUDIT_SCAN_MODE", default="aggregate")
+SCAN_STATS_FLUSH_SECONDS = config("SCAN_STATS_FLUSH_SECONDS", default=30.0, cast=float)
+SCAN_STATS_MAX_KEYS = config("SCAN_STATS_MAX_KEYS", default=1000, cast=int)
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -112,6 +179,46 @@ DATABASES = {
     }
 }
 
+# How connections are reused between requests:
+#   "none"       - a new connection per request (Django's default).
+#   "persistent" - keep each worker thread's connection for DB_CONN_MAX_AGE
+#                  seconds and check it is alive before reuse.
+#   "pool"       - psycopg 3's connection pool (requires psycopg[pool]).
+# Under ASGI (see crm/async_views.py) use "none" or "pool"; Django does not
+# support persistent connections there.
+DB_CONNECTION_MODE = config("DB_CONNECTION_MODE", default="persistent")
+if DB_CONNECTION_MODE == "pool":
+    # requirements only pin psycopg2, which Django's pool does not support.
+    if importlib.util.find_spec("psycopg") is None or importlib.util.find_spec("psycopg_pool") is None:
+        raise ImproperlyConfigured(
+            'DB_CONNECTION_MODE "pool" needs psycopg 3 and its pool: pip install "psycopg[pool]", '
+            'or use "persistent" or "none".'
+        )
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": config("DB_POOL_MIN_SIZE", default=2, cast=int),
+            "max_size": config("DB_POOL_MAX_SIZE", default=10, cast=int),
+            "timeout": config("DB_POOL_TIMEOUT", default=10, cast=int),
+        },
+    }
+elif DB_CONNECTION_MODE == "persistent":
+    DATABASES["default"]["CONN_MAX_AGE"] = config("DB_CONN_MAX_AGE", default=60, cast=int)
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+elif DB_CONNECTION_MODE != "none":
+    raise ImproperlyConfigured(f"Unknown DB_CONNECTION_MODE {DB_CONNECTION_MODE!r}")
+
+# Optional streaming replica for reports and exports (see crm/routers.py).
+# It shares the primary's credentials and connection settings.
+REPLICA_DB_HOST = config("REPLICA_DB_HOST", default="")
+if REPLICA_DB_HOST:
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": REPLICA_DB_HOST,
+        "PORT": config("REPLICA_DB_PORT", DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["crm.routers.ReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
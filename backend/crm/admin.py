@@ -1,6 +1,16 @@
 from django.contrib import admin
 
-from .models import AuditLog, Customer, Membership, MembershipCard, ProgramSettings, Stamp, StampCycle
+from .models import (
+    AuditLog,
+    Customer,
+    DailyStampRollup,
+    Membership,
+    MembershipCard,
+    ProgramSettings,
+    ScanStat,
+    Stamp,
+    StampCycle,
+)
 
 
 @admin.register(Customer)
@@ -25,7 +35,7 @@ class MembershipCardAdmin(admin.ModelAdmin):
 
 @admin.register(StampCycle)
 class StampCycleAdmin(admin.ModelAdmin):
-    list_display = ("membership", "cycle_number", "is_closed")
+    list_display = ("membership", "cycle_number", "stamp_count", "is_closed")
     list_filter = ("is_closed",)
 
 
@@ -35,6 +45,20 @@ class StampAdmin(admin.ModelAdmin):
     list_filter = ("reward_type", "redeemed_at")
 
 
+@admin.register(DailyStampRollup)
+class DailyStampRollupAdmin(admin.ModelAdmin):
+    list_display = ("day", "stamp_count", "total_transaction_amount")
+    date_hierarchy = "day"
+
+
+@admin.register(ScanStat)
+class ScanStatAdmin(admin.ModelAdmin):
+    list_display = ("hour", "card", "user", "count")
+    list_filter = ("hour",)
+    search_fields = ("card__card_number", "user__username")
+    show_full_result_count = False
+
+
 @admin.register(ProgramSettings)
 class ProgramSettingsAdmin(admin.ModelAdmin):
     list_display = (
@@ -44,6 +68,7 @@ class ProgramSettingsAdmin(admin.ModelAdmin):
         "min_amount_for_stamp",
         "reward_stamp_1_type",
         "reward_stamp_10_type",
+        "version",
     )
 
 
@@ -52,3 +77,5 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_display = ("action", "user", "membership", "card", "created_at")
     list_filter = ("action", "created_at")
     search_fields = ("membership__card_number", "card__card_number", "user__username")
+    # Skip the unfiltered COUNT(*) over the whole table on every page.
+    show_full_result_count = False
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from django.core.signals import request_finished
+
+        from .audit import audit_buffer, scan_counter
+
+        request_finished.connect(audit_buffer.flush_if_due, dispatch_uid="crm.audit.flush_if_due")
+        request_finished.connect(scan_counter.flush_if_due, dispatch_uid="crm.audit.scan_counter")
@@ -0,0 +1,163 @@
+"""Native async versions of the cashier read paths: scan, lookup and history-summary.
+
+With ``ASYNC_READ_VIEWS`` enabled they replace the DRF actions at the same URLs.
+Under ASGI (``uvicorn config.asgi:application``) a request waiting on the
+database or cache then no longer holds a worker thread. Authentication,
+permissions, throttling, rendering and error bodies go through the same DRF
+classes as the sync views.
+
+ASGI deployments should set ``DB_CONNECTION_MODE`` to ``none`` or ``pool``.
+Django advises against persistent connections under ASGI: ORM calls run on
+executor threads outside the request cycle that would close or recycle them.
+"""
+from functools import wraps
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.db.models import aprefetch_related_objects
+from rest_framework import exceptions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import audit
+from . import cache as membership_cache
+from .models import Membership, MembershipCard, StampCycle
+from .serializers import MembershipSerializer, parse_sparse_params, shape_membership_payload
+from .services import afind_membership_by_identifier
+from .throttles import ScanRateThrottle
+from .views import _membership_queryset, history_summary_data
+from users.permissions import IsCashierOrAdminRole
+
+_record_scan = sync_to_async(audit.record_scan)
+
+
+class _CashierAPIView(APIView):
+    """Holds the DRF policy of the sync cashier actions; never dispatched itself."""
+
+    permission_classes = [IsCashierOrAdminRole]
+
+
+def cashier_view(throttle_class=None):
+    """GET-only async view behind the DRF authentication, ``IsCashierOrAdminRole`` and ``throttle_class``."""
+    policy = {"throttle_classes": [throttle_class]} if throttle_class is not None else {}
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            api_view = _CashierAPIView(**policy)
+            api_view.args, api_view.kwargs = args, kwargs
+            request = api_view.initialize_request(request, *args, **kwargs)
+            api_view.request = request
+            api_view.headers = api_view.default_response_headers
+            try:
+                # Authentication and the throttle stores block, so they run off the loop.
+                await sync_to_async(api_view.initial)(request, *args, **kwargs)
+                if request.method != "GET":
+                    raise exceptions.MethodNotAllowed(request.method)
+                response = await view(request, *args, **kwargs)
+            except Exception as exc:
+                response = api_view.handle_exception(exc)
+            return api_view.finalize_response(request, response, *args, **kwargs).render()
+
+        return wrapper
+
+    return decorator
+
+
+def _public_uuid(value) -> uuid.UUID:
+    if not value:
+        raise exceptions.ParseError("public_id is required")
+    try:
+        return uuid.UUID(str(value))
+    except (ValueError, TypeError):
+        raise exceptions.ParseError("Invalid public_id")
+
+
+def _shaped(payload, sparse):
+    fields, expand = sparse
+    if fields is None and expand is None:
+        return payload
+    return shape_membership_payload(payload, fields, expand)
+
+
+async def _membership_payload(membership, sparse) -> dict:
+    """Same payload as ``MembershipViewSet._cached_payload``."""
+    payload = await membership_cache.aget_membership_payload(membership.pk)
+    if payload is not None:
+        return _shaped(payload, sparse)
+    fields, expand = sparse
+    if fields is None and expand is None:
+        await aprefetch_related_objects([membership], "cycles__stamps")
+        payload = MembershipSerializer(membership).data
+        await membership_cache.aset_membership_payload(membership.pk, payload)
+        return payload
+    # Partial payloads are not cached; only the requested relations are loaded.
+    membership = await _membership_queryset(fields, expand).aget(pk=membership.pk)
+    return MembershipSerializer(membership, context={"fields": fields, "expand": expand}).data
+
+
+@cashier_view(throttle_class=ScanRateThrottle)
+async def scan(request):
+    public_uuid = _public_uuid(request.GET.get("public_id"))
+    sparse = parse_sparse_params(request.GET)
+    metadata = {"public_id": str(public_uuid)}
+
+    entry = await membership_cache.aget_card_entry(public_uuid)
+    if entry is not None:
+        card_id, membership_id = entry
+        payload = await membership_cache.aget_membership_payload(membership_id)
+        if payload is not None:
+            await _record_scan(request, card_id, membership_id, metadata=metadata)
+            return Response(_shaped(payload, sparse))
+
+    card = await (
+        MembershipCard.objects.select_related("membership__customer", "membership__active_cycle")
+        .filter(public_id=public_uuid)
+        .afirst()
+    )
+    if card is None or card.membership is None:
+        raise exceptions.NotFound("Membership not found")
+
+    # Awaited one after another: these all run on the single thread-sensitive
+    # executor, so gathering them would not overlap anything.
+    await _record_scan(request, card.pk, card.membership_id, metadata=metadata)
+    await membership_cache.aset_card_entry(public_uuid, card.pk, card.membership_id)
+    return Response(await _membership_payload(card.membership, sparse))
+
+
+@cashier_view()
+async def lookup(request):
+    identifier = request.GET.get("q")
+    if not identifier:
+        raise exceptions.ParseError("q is required")
+    sparse = parse_sparse_params(request.GET)
+    membership = await afind_membership_by_identifier(
+        identifier, Membership.objects.select_related("customer", "active_cycle")
+    )
+    if membership is None:
+        raise exceptions.NotFound("Membership not found")
+    return Response(await _membership_payload(membership, sparse))
+
+
+@cashier_view()
+async def history_summary(request):
+    card_number = request.GET.get("card_number")
+    public_id = request.GET.get("public_id")
+    active_only = request.GET.get("active_only") in {"1", "true", "yes"}
+    if not (card_number or public_id):
+        raise exceptions.ParseError("card_number or public_id is required")
+
+    cards = MembershipCard.objects.only("membership")
+    card = None
+    if card_number:
+        card = await cards.filter(card_number=card_number).afirst()
+    if card is None and public_id:
+        card = await cards.filter(public_id=_public_uuid(public_id)).afirst()
+    if card is None or card.membership_id is None:
+        raise exceptions.NotFound("Membership not found")
+
+    cycles = StampCycle.objects.filter(membership_id=card.membership_id).order_by("cycle_number")
+    cycle = await cycles.filter(is_closed=False).alast()
+    if cycle is None and not active_only:
+        cycle = await cycles.alast()
+    return Response(history_summary_data(card.membership_id, cycle))
@@ -0,0 +1,226 @@
+"""Buffered audit log writer.
+
+Entries are queued once the surrounding transaction commits and written with
+``bulk_create`` when the buffer reaches ``AUDIT_BUFFER_SIZE`` entries or its
+oldest entry is ``AUDIT_FLUSH_SECONDS`` old. The thresholds are checked on
+every new entry and after every request; whatever is left is flushed when the
+worker exits. Pass ``strict=True`` for actions that must be written in the
+caller's transaction.
+
+Scans are only counted: per card, cashier and hour in memory, added to
+``ScanStat`` every ``SCAN_STATS_FLUSH_SECONDS`` unless ``AUDIT_SCAN_MODE`` is
+``"full"``.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, transaction
+from django.utils import timezone
+
+from .models import AuditAction, AuditLog, ScanStat
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._oldest = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, entry: AuditLog) -> None:
+        with self._lock:
+            if not self._entries:
+                self._oldest = time.monotonic()
+            self._entries.append(entry)
+        self.flush_if_due()
+
+    def is_due(self) -> bool:
+        size = getattr(settings, "AUDIT_BUFFER_SIZE", 100)
+        max_age = getattr(settings, "AUDIT_FLUSH_SECONDS", 2.0)
+        with self._lock:
+            if not self._entries:
+                return False
+            return len(self._entries) >= size or time.monotonic() - self._oldest >= max_age
+
+    def flush_if_due(self, **kwargs) -> None:
+        # Also connected to request_finished, hence **kwargs.
+        if self.is_due():
+            self.flush()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = []
+            self._oldest = None
+
+    def flush(self) -> int:
+        with self._lock:
+            entries, self._entries = self._entries, []
+            self._oldest = None
+        if not entries:
+            return 0
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(entries)
+        except OperationalError:
+            logger.exception("Failed to write %s audit log entries, retrying on next flush", len(entries))
+            self._requeue(entries)
+            return 0
+        except DatabaseError:
+            # Typically an entry whose membership or card was deleted before the
+            # flush; write the rest one by one so it cannot block the buffer.
+            return self._write_each(entries)
+        return len(entries)
+
+    def _write_each(self, entries) -> int:
+        written = 0
+        for index, entry in enumerate(entries):
+            entry.pk = None
+            try:
+                with transaction.atomic():
+                    entry.save(force_insert=True)
+            except OperationalError:
+                logger.exception("Failed to write %s audit log entries, retrying on next flush", len(entries) - index)
+                self._requeue(entries[index:])
+                break
+            except DatabaseError:
+                logger.exception(
+                    "Dropped audit log entry %s (membership %s, card %s)",
+                    entry.action,
+                    entry.membership_id,
+                    entry.card_id,
+                )
+            else:
+                written += 1
+        return written
+
+    def _requeue(self, entries) -> None:
+        with self._lock:
+            self._entries[:0] = entries
+            self._oldest = time.monotonic()
+
+
+class ScanCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._started = None
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, card_id, user_id, at=None) -> None:
+        hour = (at or timezone.now()).replace(minute=0, second=0, microsecond=0)
+        key = (card_id, user_id, hour)
+        with self._lock:
+            if not self._counts:
+                self._started = time.monotonic()
+            self._counts[key] = self._counts.get(key, 0) + 1
+        self.flush_if_due()
+
+    def is_due(self) -> bool:
+        max_keys = getattr(settings, "SCAN_STATS_MAX_KEYS", 1000)
+        max_age = getattr(settings, "SCAN_STATS_FLUSH_SECONDS", 30.0)
+        with self._lock:
+            if not self._counts:
+                return False
+            return len(self._counts) >= max_keys or time.monotonic() - self._started >= max_age
+
+    def flush_if_due(self, **kwargs) -> None:
+        if self.is_due():
+            self.flush()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts = {}
+            self._started = None
+
+    def flush(self) -> int:
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self._started = None
+        if not counts:
+            return 0
+        try:
+            with transaction.atomic():
+                ScanStat.upsert_counts(counts)
+        except OperationalError:
+            logger.exception("Failed to write %s scan counters, retrying on next flush", len(counts))
+            self._requeue(counts)
+            return 0
+        except DatabaseError:
+            # Typically a card or cashier deleted before the flush; write the
+            # rest one by one so it cannot block the counters.
+            return self._write_each(counts)
+        return sum(counts.values())
+
+    def _write_each(self, counts) -> int:
+        written = 0
+        items = list(counts.items())
+        for index, (key, count) in enumerate(items):
+            try:
+                with transaction.atomic():
+                    ScanStat.upsert_counts({key: count})
+            except OperationalError:
+                logger.exception("Failed to write %s scan counters, retrying on next flush", len(items) - index)
+                self._requeue(dict(items[index:]))
+                break
+            except DatabaseError:
+                card_id, user_id, hour = key
+                logger.exception("Dropped %s scans of card %s by user %s at %s", count, card_id, user_id, hour)
+            else:
+                written += count
+        return written
+
+    def _requeue(self, counts) -> None:
+        with self._lock:
+            for key, count in counts.items():
+                self._counts[key] = self._counts.get(key, 0) + count
+            self._started = time.monotonic()
+
+
+audit_buffer = AuditBuffer()
+scan_counter = ScanCounter()
+atexit.register(audit_buffer.flush)
+atexit.register(scan_counter.flush)
+
+
+def record(action, user=None, membership_id=None, card_id=None, metadata=None, strict=False) -> AuditLog | None:
+    entry = AuditLog(
+        action=action,
+        user=user,
+        membership_id=membership_id,
+        card_id=card_id,
+        metadata=metadata or {},
+        created_at=timezone.now(),
+    )
+    if strict:
+        entry.save()
+        return entry
+    # Rolled-back actions never reach the buffer.
+    transaction.on_commit(lambda: audit_buffer.add(entry))
+    return None
+
+
+def record_scan(request, card_id, membership_id, metadata=None) -> None:
+    user = request.user if request.user and request.user.is_authenticated else None
+    if getattr(settings, "AUDIT_SCAN_MODE", "aggregate") == "full" or user is None:
+        record(AuditAction.SCAN, user=user, membership_id=membership_id, card_id=card_id, metadata=metadata)
+        return
+    scan_counter.add(card_id, user.pk)
+
+
+def flush() -> int:
+    return audit_buffer.flush() + scan_counter.flush()
+
+
+def clear() -> None:
+    """Drop anything pending without writing it."""
+    audit_buffer.clear()
+    scan_counter.clear()
@@ -0,0 +1,225 @@
+"""Monthly range partitions of the audit log table (PostgreSQL only).
+
+``crm_auditlog`` is partitioned by ``created_at``; each month lives in
+``crm_auditlog_YYYYMM`` and anything outside the created months falls into
+``crm_auditlog_default``. Old months are dumped to a compressed archive,
+then detached and dropped instead of being deleted row by row.
+"""
+from datetime import date, datetime, timezone as dt_timezone
+import gzip
+import json
+import os
+import re
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+AUDIT_TABLE = "crm_auditlog"
+DEFAULT_PARTITION = f"{AUDIT_TABLE}_default"
+ARCHIVE_COLUMNS = ["id", "created_at", "updated_at", "action", "user_id", "membership_id", "card_id", "metadata"]
+ARCHIVE_FORMATS = {"jsonl": "jsonl.gz", "parquet": "parquet"}
+ARCHIVE_CHUNK_SIZE = 5000
+
+_PARTITION_NAME = re.compile(rf"^{AUDIT_TABLE}_(\d{{4}})(\d{{2}})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{AUDIT_TABLE}_{month:%Y%m}"
+
+
+def partition_month(name: str) -> date | None:
+    match = _PARTITION_NAME.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def _bound(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def create_month_partition(cursor, month: date) -> str:
+    name = partition_name(month)
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {AUDIT_TABLE} FOR VALUES FROM (%s) TO (%s)",
+        [_bound(month), _bound(add_months(month, 1))],
+    )
+    return name
+
+
+def audit_partitions() -> list[tuple[str, date]]:
+    """Attached monthly partitions as ``(name, month)``, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [AUDIT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return _monthly(names)
+
+
+def detached_audit_partitions() -> list[tuple[str, date]]:
+    """Monthly tables no longer attached to the audit log, e.g. left by an interrupted run."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT relname
+            FROM pg_class
+            WHERE relkind = 'r' AND NOT relispartition AND relname LIKE %s AND pg_table_is_visible(oid)
+            """,
+            [f"{AUDIT_TABLE}\\_%"],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return _monthly(names)
+
+
+def _monthly(names) -> list[tuple[str, date]]:
+    partitions = [(name, partition_month(name)) for name in names]
+    return sorted((item for item in partitions if item[1] is not None), key=lambda item: item[1])
+
+
+def _default_partition_months(cursor) -> set[date]:
+    cursor.execute(
+        f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date FROM {DEFAULT_PARTITION}"
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def ensure_audit_partitions(months_ahead: int = 3) -> list[str]:
+    """Create partitions from the current month through ``months_ahead`` months ahead.
+
+    Months whose rows already fell into the default partition, e.g. because
+    this job did not run for a while, get their partition too and the rows are
+    moved into it, so they are archived like any other month.
+    """
+    current = month_start(timezone.now().date())
+    existing = {name for name, _ in audit_partitions()}
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        stranded = _default_partition_months(cursor)
+        wanted = {add_months(current, offset) for offset in range(months_ahead + 1)} | stranded
+        missing = sorted(month for month in wanted if partition_name(month) not in existing)
+        moving = [month for month in missing if month in stranded]
+        if moving:
+            # A new partition may not cover rows still in the default partition,
+            # so it is detached while they move; inserts wait on the lock until commit.
+            cursor.execute(f"ALTER TABLE {AUDIT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+        for month in missing:
+            created.append(create_month_partition(cursor, month))
+        in_month = "created_at >= %s AND created_at < %s"
+        for month in moving:
+            bounds = [_bound(month), _bound(add_months(month, 1))]
+            cursor.execute(f"INSERT INTO {AUDIT_TABLE} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}", bounds)
+            cursor.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}", bounds)
+        if moving:
+            cursor.execute(f"ALTER TABLE {AUDIT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+    return created
+
+
+def detach_partition(name: str) -> None:
+    """Detach a month and drop its foreign keys so it no longer blocks deletes."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {AUDIT_TABLE} DETACH PARTITION {name}")
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [name],
+        )
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"')
+
+
+def drop_partition(name: str) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {name}")
+
+
+def partition_rows(name: str):
+    """Stream a partition's rows through a server-side cursor."""
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {name} ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(ARCHIVE_CHUNK_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+
+def _metadata(value):
+    # Raw cursors may hand jsonb back undecoded.
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def write_jsonl_archive(rows, path) -> int:
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8") as archive:
+        for row in rows:
+            record = dict(zip(ARCHIVE_COLUMNS, row))
+            record["metadata"] = _metadata(record["metadata"])
+            archive.write(json.dumps(record, cls=DjangoJSONEncoder) + "\n")
+            count += 1
+    return count
+
+
+def write_parquet_archive(rows, path) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("id", pa.int64()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+            ("updated_at", pa.timestamp("us", tz="UTC")),
+            ("action", pa.string()),
+            ("user_id", pa.int64()),
+            ("membership_id", pa.int64()),
+            ("card_id", pa.int64()),
+            ("metadata", pa.string()),
+        ]
+    )
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        batch = []
+        for row in rows:
+            record = dict(zip(ARCHIVE_COLUMNS, row))
+            record["metadata"] = json.dumps(_metadata(record["metadata"]), cls=DjangoJSONEncoder)
+            batch.append(record)
+            if len(batch) >= ARCHIVE_CHUNK_SIZE:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def archive_path(name: str, output_dir, fmt: str = "jsonl") -> str:
+    return os.path.join(output_dir, f"{name}.{ARCHIVE_FORMATS[fmt]}")
+
+
+def archive_partition(name: str, output_dir, fmt: str = "jsonl") -> tuple[str, int]:
+    """Dump a partition to ``output_dir``; returns ``(path, row count)``."""
+    path = archive_path(name, output_dir, fmt)
+    tmp_path = f"{path}.tmp"
+    writer = write_parquet_archive if fmt == "parquet" else write_jsonl_archive
+    count = writer(partition_rows(name), tmp_path)
+    # Only a complete file gets the final name, so a crash never leaves a
+    # truncated archive next to a dropped table.
+    os.replace(tmp_path, path)
+    return path, count
@@ -0,0 +1,96 @@
+"""Cached membership payloads for the cashier read paths (scan, lookup, history).
+
+Entries are deleted whenever the membership changes and again once the
+surrounding transaction commits, so a concurrent reader cannot re-cache the
+pre-commit state. Invalidation only reaches other workers through a shared
+cache backend, so nothing is cached while ``MEMBERSHIP_CACHE_SECONDS`` is 0,
+its default when ``REDIS_URL`` is not configured.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Bump when the serialized membership shape changes.
+PAYLOAD_VERSION = 2
+
+
+def _timeout() -> int:
+    return getattr(settings, "MEMBERSHIP_CACHE_SECONDS", 0)
+
+
+def enabled() -> bool:
+    return _timeout() > 0
+
+
+def _payload_key(membership_id) -> str:
+    return f"crm:membership:{membership_id}:payload:v{PAYLOAD_VERSION}"
+
+
+def _card_key(public_id) -> str:
+    return f"crm:card:{public_id}"
+
+
+def get_membership_payload(membership_id):
+    if not enabled():
+        return None
+    return cache.get(_payload_key(membership_id))
+
+
+def set_membership_payload(membership_id, payload) -> None:
+    if not enabled():
+        return
+    cache.set(_payload_key(membership_id), payload, _timeout())
+
+
+async def aget_membership_payload(membership_id):
+    if not enabled():
+        return None
+    return await cache.aget(_payload_key(membership_id))
+
+
+async def aset_membership_payload(membership_id, payload) -> None:
+    if not enabled():
+        return
+    await cache.aset(_payload_key(membership_id), payload, _timeout())
+
+
+def get_card_entry(public_id):
+    """Return ``(card_id, membership_id)`` for an assigned card, or None."""
+    if not enabled():
+        return None
+    return cache.get(_card_key(public_id))
+
+
+def set_card_entry(public_id, card_id, membership_id) -> None:
+    if not enabled():
+        return
+    cache.set(_card_key(public_id), (card_id, membership_id), _timeout())
+
+
+async def aget_card_entry(public_id):
+    if not enabled():
+        return None
+    return await cache.aget(_card_key(public_id))
+
+
+async def aset_card_entry(public_id, card_id, membership_id) -> None:
+    if not enabled():
+        return
+    await cache.aset(_card_key(public_id), (card_id, membership_id), _timeout())
+
+
+def _delete_now_and_on_commit(keys: list[str]) -> None:
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_membership(*membership_ids) -> None:
+    keys = [_payload_key(membership_id) for membership_id in membership_ids if membership_id]
+    if keys:
+        _delete_now_and_on_commit(keys)
+
+
+def invalidate_card(*public_ids) -> None:
+    keys = [_card_key(public_id) for public_id in public_ids if public_id]
+    if keys:
+        _delete_now_and_on_commit(keys)
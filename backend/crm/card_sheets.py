@@ -0,0 +1,133 @@
+"""Print-ready QR card sheets.
+
+Rendering runs in worker processes, so this module only depends on qrcode and
+PIL; callers pass plain ``(public_id, card_number)`` tuples.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import io
+import xml.etree.ElementTree as ET
+import zipfile
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+from qrcode.image.svg import SvgPathImage
+
+SHEET_FORMATS = {
+    "pdf": "application/pdf",
+    "png": "application/zip",
+    "svg": "application/zip",
+}
+
+# A4 at 150 dpi, 3 x 4 cards per page.
+PAGE_SIZE = (1240, 1754)
+GRID = (3, 4)
+CARDS_PER_PAGE = GRID[0] * GRID[1]
+TILE_SIZE = (PAGE_SIZE[0] // GRID[0], PAGE_SIZE[1] // GRID[1])
+LABEL_HEIGHT = 48
+FILES_PER_TASK = 200
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _qr_image(public_id, size) -> Image.Image:
+    qr = qrcode.QRCode(border=2)
+    qr.add_data(str(public_id))
+    return qr.make_image().get_image().convert("1").resize((size, size), Image.NEAREST)
+
+
+def render_card_tile(public_id, card_number) -> Image.Image:
+    tile = Image.new("1", TILE_SIZE, 1)
+    qr_size = min(TILE_SIZE[0], TILE_SIZE[1] - LABEL_HEIGHT) - 20
+    tile.paste(_qr_image(public_id, qr_size), ((TILE_SIZE[0] - qr_size) // 2, 10))
+    draw = ImageDraw.Draw(tile)
+    font = ImageFont.load_default(size=28)
+    draw.text(
+        (TILE_SIZE[0] // 2, TILE_SIZE[1] - LABEL_HEIGHT // 2),
+        card_number,
+        fill=0,
+        font=font,
+        anchor="mm",
+    )
+    return tile
+
+
+def render_card_svg(public_id, card_number) -> bytes:
+    buffer = io.BytesIO()
+    qrcode.make(str(public_id), image_factory=SvgPathImage).save(buffer)
+    ET.register_namespace("", "http://www.w3.org/2000/svg")
+    root = ET.fromstring(buffer.getvalue())
+    _, _, width, height = (float(value) for value in root.get("viewBox").split())
+    label_height = width / 8
+    root.set("viewBox", f"0 0 {width:g} {height + label_height:g}")
+    root.attrib.pop("height", None)
+    root.attrib.pop("width", None)
+    label = ET.SubElement(
+        root,
+        "{http://www.w3.org/2000/svg}text",
+        {
+            "x": f"{width / 2:g}",
+            "y": f"{height + label_height / 2:g}",
+            "font-size": f"{label_height * 0.6:g}",
+            "font-family": "monospace",
+            "text-anchor": "middle",
+            "dominant-baseline": "middle",
+        },
+    )
+    label.text = card_number
+    return ET.tostring(root, xml_declaration=True, encoding="utf-8")
+
+
+def render_page(cards) -> bytes:
+    """Render up to CARDS_PER_PAGE cards onto one PNG-encoded page."""
+    page = Image.new("1", PAGE_SIZE, 1)
+    for index, (public_id, card_number) in enumerate(cards):
+        column, row = index % GRID[0], index // GRID[0]
+        page.paste(render_card_tile(public_id, card_number), (column * TILE_SIZE[0], row * TILE_SIZE[1]))
+    buffer = io.BytesIO()
+    page.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_files(cards, fmt) -> list[tuple[str, bytes]]:
+    files = []
+    for public_id, card_number in cards:
+        if fmt == "svg":
+            files.append((f"{card_number}.svg", render_card_svg(public_id, card_number)))
+        else:
+            buffer = io.BytesIO()
+            render_card_tile(public_id, card_number).save(buffer, format="PNG")
+            files.append((f"{card_number}.png", buffer.getvalue()))
+    return files
+
+
+def _map(function, tasks, workers):
+    if workers == 1:
+        yield from map(function, *tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(function, *tasks)
+
+
+def write_card_sheets(cards, output, fmt="pdf", workers=None) -> None:
+    """Write ``cards`` to the binary file ``output`` as a PDF or a ZIP of images.
+
+    ``workers=None`` uses one process per CPU; ``1`` renders in-process.
+    """
+    cards = list(cards)
+    if fmt == "pdf":
+        chunks = list(_chunks(cards, CARDS_PER_PAGE))
+        # PNG-encoded pages stay compressed until PIL writes each one.
+        pages = [Image.open(io.BytesIO(page)) for page in _map(render_page, [chunks], workers)]
+        if not pages:
+            pages = [Image.new("1", PAGE_SIZE, 1)]
+        pages[0].save(output, format="PDF", save_all=True, append_images=pages[1:], resolution=150)
+        return
+
+    chunks = list(_chunks(cards, FILES_PER_TASK))
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for files in _map(render_files, [chunks, [fmt] * len(chunks)], workers):
+            for name, content in files:
+                archive.writestr(name, content)
@@ -0,0 +1,85 @@
+import re
+import uuid
+
+from django.conf import settings
+
+DEFAULT_COUNTRY_CODE = "62"
+CARD_NUMBER_PREFIX = "CARD-"
+CARD_SEQUENCE_DIGITS = 10
+
+_PHONE_PUNCTUATION = re.compile(r"[\s\-().]")
+_PHONE_SHAPE = re.compile(r"^\+?\d{1,15}$")
+
+
+class IdentifierKind:
+    PUBLIC_ID = "public_id"
+    PHONE = "phone"
+    CARD_NUMBER = "card_number"
+
+
+def normalize_card_number(value: str) -> str:
+    return value.strip().upper()
+
+
+def luhn_check_digit(digits: str) -> str:
+    total = 0
+    # Double every second digit counting from the right, starting with the last.
+    for position, char in enumerate(reversed(digits)):
+        value = int(char)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+
+def format_card_number(sequence: int) -> str:
+    """``CARD-`` + zero-padded sequence + Luhn check digit (11 digits).
+
+    Generated numbers are one character longer than the legacy random
+    ``CARD-<10 hex>`` numbers, so the two schemes can never collide.
+    """
+    digits = f"{sequence:0{CARD_SEQUENCE_DIGITS}d}"
+    return f"{CARD_NUMBER_PREFIX}{digits}{luhn_check_digit(digits)}"
+
+
+def is_valid_card_number(value: str) -> bool:
+    if not value.startswith(CARD_NUMBER_PREFIX):
+        return False
+    digits = value[len(CARD_NUMBER_PREFIX):]
+    if len(digits) != CARD_SEQUENCE_DIGITS + 1 or not digits.isdigit():
+        return False
+    return luhn_check_digit(digits[:-1]) == digits[-1]
+
+
+def normalize_phone(value: str, country_code: str | None = None) -> str:
+    """Best-effort E.164 form; local ``0..`` numbers get ``PHONE_COUNTRY_CODE``."""
+    country_code = country_code or getattr(settings, "PHONE_COUNTRY_CODE", DEFAULT_COUNTRY_CODE)
+    digits = _PHONE_PUNCTUATION.sub("", value.strip())
+    if digits.startswith("+"):
+        return digits
+    if digits.startswith("00"):
+        return f"+{digits[2:]}"
+    if digits.startswith("0"):
+        return f"+{country_code}{digits[1:]}"
+    if digits.startswith(country_code):
+        return f"+{digits}"
+    return digits
+
+
+def classify_identifier(value: str) -> tuple[str, object]:
+    """Decide up front which indexed column an identifier should hit.
+
+    Returns ``(kind, key)`` where key is already normalized for that column.
+    Any all-digit input is phone-shaped, however short, and may still be a
+    numeric card number, so callers match ``PHONE`` against both keys.
+    """
+    value = value.strip().strip("/")
+    try:
+        return IdentifierKind.PUBLIC_ID, uuid.UUID(value)
+    except ValueError:
+        pass
+    if _PHONE_SHAPE.match(_PHONE_PUNCTUATION.sub("", value)):
+        return IdentifierKind.PHONE, normalize_phone(value)
+    return IdentifierKind.CARD_NUMBER, normalize_card_number(value)
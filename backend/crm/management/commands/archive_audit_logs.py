@@ -0,0 +1,76 @@
+import importlib.util
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from crm.audit_partitions import (
+    ARCHIVE_FORMATS,
+    add_months,
+    archive_partition,
+    archive_path,
+    audit_partitions,
+    detach_partition,
+    detached_audit_partitions,
+    drop_partition,
+    ensure_audit_partitions,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly audit log partitions, then dump months older than "
+        "--keep-months to compressed files, detach and drop them. Run monthly, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-months", type=int, default=12)
+        parser.add_argument("--output-dir", required=True)
+        parser.add_argument("--format", choices=sorted(ARCHIVE_FORMATS), default="jsonl")
+        parser.add_argument("--months-ahead", type=int, default=3)
+        parser.add_argument(
+            "--keep-tables",
+            action="store_true",
+            help="Leave archived partitions as detached tables instead of dropping them.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Audit log partitions require PostgreSQL")
+        if options["keep_months"] < 1:
+            raise CommandError("--keep-months must be at least 1")
+        if options["format"] == "parquet" and importlib.util.find_spec("pyarrow") is None:
+            raise CommandError("Parquet archives need pyarrow; install it or use --format jsonl")
+        os.makedirs(options["output_dir"], exist_ok=True)
+
+        if not options["dry_run"]:
+            for name in ensure_audit_partitions(options["months_ahead"]):
+                self.stdout.write(f"Created partition {name}")
+
+        cutoff = add_months(month_start(timezone.now().date()), -options["keep_months"])
+        expired = [name for name, month in audit_partitions() if month < cutoff]
+        # Months an earlier run detached but did not archive or drop.
+        stranded = [name for name, month in detached_audit_partitions() if month < cutoff]
+        if not (expired or stranded):
+            self.stdout.write("No partitions older than the retention window")
+            return
+
+        for name in expired + stranded:
+            if options["dry_run"]:
+                self.stdout.write(f"Would archive {name}")
+                continue
+            if name in stranded and os.path.exists(archive_path(name, options["output_dir"], options["format"])):
+                if options["keep_tables"]:
+                    continue
+                self.stdout.write(f"{name} is already archived")
+            else:
+                # Archive while still attached: if this fails, the next run finds the month again.
+                path, count = archive_partition(name, options["output_dir"], options["format"])
+                self.stdout.write(self.style.SUCCESS(f"Archived {count} rows from {name} to {path}"))
+            if name in expired:
+                detach_partition(name)
+            if not options["keep_tables"]:
+                drop_partition(name)
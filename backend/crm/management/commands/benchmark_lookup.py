@@ -0,0 +1,131 @@
+from datetime import timedelta
+import json
+import random
+import statistics
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from crm.identifiers import normalize_phone
+from crm.models import Customer, Membership
+from crm.services import find_membership_by_identifier
+
+BENCH_PREFIX = "BENCH-"
+BENCH_PHONE_PREFIX = "0877"
+
+
+def _legacy_lookup(identifier):
+    """The pre-index lookup chain, kept here only as a comparison baseline."""
+    identifier = identifier.strip().strip("/")
+    membership = Membership.objects.filter(card_number__iexact=identifier).first()
+    if membership is None:
+        membership = (
+            Membership.objects.filter(customer__phone__iexact=identifier).order_by("-start_date").first()
+        )
+    if membership is None:
+        try:
+            membership = Membership.objects.filter(card__public_id=identifier).first()
+        except ValidationError:
+            membership = None
+    return membership
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed benchmark customers/memberships and compare the legacy iexact lookup "
+        "chain with the indexed identifier lookup. Prints JSON timings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=2_000_000)
+        parser.add_argument("--samples", type=int, default=500)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the seeded rows for later runs instead of deleting them",
+        )
+
+    def handle(self, *args, **options):
+        total = options["customers"]
+        if total < 1 or options["samples"] < 1:
+            raise CommandError("--customers and --samples must be positive")
+
+        self._seed(total, options["batch_size"])
+        try:
+            identifiers = self._sample_identifiers(total, options["samples"])
+            report = {
+                "customers": total,
+                "samples": len(identifiers),
+                "legacy": self._measure(_legacy_lookup, identifiers),
+                "indexed": self._measure(find_membership_by_identifier, identifiers),
+            }
+        finally:
+            if not options["keep"]:
+                Customer.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _seed(self, total, batch_size):
+        existing = Customer.objects.filter(name__startswith=BENCH_PREFIX).count()
+        today = timezone.localdate()
+        end = today + timedelta(days=365)
+        for start in range(existing, total, batch_size):
+            stop = min(start + batch_size, total)
+            with transaction.atomic():
+                customers = Customer.objects.bulk_create(
+                    Customer(
+                        name=f"{BENCH_PREFIX}{index}",
+                        phone=f"{BENCH_PHONE_PREFIX}{index:09d}",
+                        phone_key=normalize_phone(f"{BENCH_PHONE_PREFIX}{index:09d}"),
+                    )
+                    for index in range(start, stop)
+                )
+                Membership.objects.bulk_create(
+                    Membership(
+                        customer=customer,
+                        card_number=f"{BENCH_PREFIX}{index:09d}",
+                        card_number_key=f"{BENCH_PREFIX}{index:09d}",
+                        start_date=today,
+                        end_date=end,
+                    )
+                    for index, customer in zip(range(start, stop), customers)
+                )
+            self.stderr.write(f"seeded {stop}/{total}")
+
+    @staticmethod
+    def _sample_identifiers(total, samples):
+        identifiers = []
+        for _ in range(samples):
+            index = random.randrange(total)
+            identifiers.append(
+                random.choice(
+                    [
+                        f"{BENCH_PREFIX}{index:09d}".lower(),
+                        f"{BENCH_PHONE_PREFIX}{index:09d}",
+                        f"{BENCH_PREFIX}MISSING-{index}",
+                    ]
+                )
+            )
+        return identifiers
+
+    @staticmethod
+    def _measure(lookup, identifiers):
+        timings = []
+        queries = 0
+        for identifier in identifiers:
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                lookup(identifier)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries += len(captured)
+        timings.sort()
+        return {
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "p50_ms": round(timings[len(timings) // 2], 3),
+            "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            "queries_per_lookup": round(queries / len(identifiers), 2),
+        }
@@ -0,0 +1,178 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import statistics
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework_simplejwt.tokens import AccessToken
+
+from crm import cache as membership_cache
+from crm.models import Customer, Membership, MembershipCard
+from crm.throttles import ScanRateThrottle
+from users.models import UserRole
+
+BENCH_USERNAME = "bench-scan"
+BENCH_CARD_NUMBER = "CARD-BENCHSCAN"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure scan throughput through the full WSGI stack with the configured "
+        "DB_CONNECTION_MODE. Run once per mode (none, persistent, pool) against the "
+        "same PostgreSQL and compare the JSON output; add --asgi, with and without "
+        "ASYNC_READ_VIEWS=true, to compare against the ASGI handler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Concurrent requests: WSGI threads, or tasks on one event loop with --asgi",
+        )
+        parser.add_argument("--asgi", action="store_true", help="Drive the ASGI handler instead of WSGI")
+        parser.add_argument(
+            "--uncached",
+            action="store_true",
+            help="Drop the cached membership payload before every scan to exercise the read queries",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["threads"] < 1:
+            raise CommandError("--requests and --threads must be positive")
+
+        user, card = self._fixtures()
+        token = str(AccessToken.for_user(user))
+        # Keep the throttle's bucket upsert in the measured path, but never block.
+        ScanRateThrottle.rate = "1000000/s"
+        # Benchmark threads open their own connections; this one is done.
+        connection.close()
+
+        latencies = []
+        statuses = {}
+        run = self._run_asgi if options["asgi"] else self._run_wsgi
+        started = time.perf_counter()
+        run(card, token, options, latencies, statuses)
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        report = {
+            "interface": "asgi" if options["asgi"] else "wsgi",
+            "async_views": settings.ASYNC_READ_VIEWS,
+            "mode": settings.DB_CONNECTION_MODE,
+            "vendor": connection.vendor,
+            "threads": options["threads"],
+            "requests": options["requests"],
+            "uncached": options["uncached"] or not membership_cache.enabled(),
+            "statuses": statuses,
+            "seconds": round(wall, 3),
+            "requests_per_second": round(options["requests"] / wall, 1),
+            "p50_ms": round(statistics.median(latencies) * 1000, 3),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def _record(latencies, statuses, elapsed, code):
+        latencies.append(elapsed)
+        statuses[code] = statuses.get(code, 0) + 1
+
+    def _run_wsgi(self, card, token, options, latencies, statuses):
+        handler = WSGIHandler()
+        lock = threading.Lock()
+
+        def scan(_):
+            if options["uncached"]:
+                membership_cache.invalidate_membership(card.membership_id)
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": "/api/memberships/scan/",
+                "QUERY_STRING": f"public_id={card.public_id}",
+                "SERVER_NAME": "localhost",
+                "SERVER_PORT": "80",
+                "HTTP_HOST": "localhost",
+                "HTTP_AUTHORIZATION": f"Bearer {token}",
+                "wsgi.input": io.BytesIO(),
+                "wsgi.url_scheme": "http",
+            }
+            started = time.perf_counter()
+            response_status = []
+            body = handler(environ, lambda status, headers, exc_info=None: response_status.append(status))
+            b"".join(body)
+            body.close()
+            elapsed = time.perf_counter() - started
+            with lock:
+                self._record(latencies, statuses, elapsed, response_status[0].split()[0])
+
+        with ThreadPoolExecutor(max_workers=options["threads"]) as executor:
+            list(executor.map(scan, range(options["requests"])))
+
+    def _run_asgi(self, card, token, options, latencies, statuses):
+        handler = ASGIHandler()
+        invalidate = sync_to_async(membership_cache.invalidate_membership)
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/memberships/scan/",
+            "raw_path": b"/api/memberships/scan/",
+            "root_path": "",
+            "query_string": f"public_id={card.public_id}".encode(),
+            "headers": [(b"host", b"localhost"), (b"authorization", f"Bearer {token}".encode())],
+            "client": ("127.0.0.1", 50000),
+            "server": ("localhost", 80),
+        }
+
+        async def scan(slots):
+            async with slots:
+                if options["uncached"]:
+                    await invalidate(card.membership_id)
+                messages = [{"type": "http.request", "body": b"", "more_body": False}]
+                sent = []
+
+                async def receive():
+                    if messages:
+                        return messages.pop()
+                    # Never disconnect; Django cancels this wait once it has responded.
+                    await asyncio.Future()
+
+                async def send(message):
+                    sent.append(message)
+
+                started = time.perf_counter()
+                await handler(dict(scope), receive, send)
+                self._record(latencies, statuses, time.perf_counter() - started, str(sent[0]["status"]))
+
+        async def main():
+            slots = asyncio.Semaphore(options["threads"])
+            await asyncio.gather(*(scan(slots) for _ in range(options["requests"])))
+
+        asyncio.run(main())
+
+    def _fixtures(self):
+        user, created = get_user_model().objects.get_or_create(
+            username=BENCH_USERNAME,
+            defaults={"role": UserRole.CASHIER},
+        )
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=["password"])
+        card = MembershipCard.objects.filter(card_number=BENCH_CARD_NUMBER).select_related("membership").first()
+        if card is None or card.membership is None:
+            customer, _ = Customer.objects.get_or_create(phone="0899000000", defaults={"name": "Bench Scan"})
+            card = card or MembershipCard.objects.create(card_number=BENCH_CARD_NUMBER)
+            Membership.create_new(customer=customer, card=card)
+            card.refresh_from_db()
+        return user, card
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from crm.models import Membership
+
+
+class Command(BaseCommand):
+    help = "Mark every active membership past its end date as expired. Run daily, e.g. from cron."
+
+    def handle(self, *args, **options):
+        expired = Membership.expire_due()
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} memberships"))
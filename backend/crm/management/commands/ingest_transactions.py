@@ -0,0 +1,56 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.services import IngestStatus, ingest_transactions
+
+
+class Command(BaseCommand):
+    help = (
+        "Award stamps from a POS export CSV with columns card_number or public_id, "
+        "transaction_amount and pos_receipt_number."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file to ingest")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Rows per transaction (default: 2000)",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        try:
+            handle = open(options["path"], newline="", encoding="utf-8")
+        except OSError as exc:
+            raise CommandError(str(exc)) from exc
+
+        counts = {}
+        offset = 0
+        with handle:
+            reader = csv.DictReader(handle)
+            batch = []
+            for row in reader:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self._ingest(batch, offset, counts)
+                    offset += len(batch)
+                    batch = []
+            if batch:
+                self._ingest(batch, offset, counts)
+
+        summary = ", ".join(f"{key}={value}" for key, value in sorted(counts.items()))
+        self.stdout.write(self.style.SUCCESS(f"Ingested {sum(counts.values())} rows: {summary}"))
+
+    def _ingest(self, batch, offset, counts):
+        for result in ingest_transactions(batch):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            if result["status"] in {IngestStatus.INVALID, IngestStatus.NOT_FOUND, IngestStatus.DUPLICATE}:
+                # +2 accounts for the header line and 1-based line numbers.
+                line = offset + result["row"] + 2
+                self.stderr.write(f"line {line}: {result['status']} ({result['detail']})")
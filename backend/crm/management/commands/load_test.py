@@ -0,0 +1,375 @@
+from collections import Counter
+import http.client
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer,
+    WSGIRequestHandler,
+    WSGIServer,
+    get_internal_wsgi_application,
+)
+from django.db import connection, connections
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from crm.models import Customer, Membership, MembershipCard, RewardType
+from crm.throttles import BaseUserRateThrottle
+from users.models import UserRole
+
+LOAD_PREFIX = "loadtest"
+DEFAULT_MIX = "scan=60,add-stamp=20,redeem=5,activate-card=5,reports=10"
+REPORT_PATHS = (
+    "reports/summary/",
+    "reports/dashboard/",
+    "reports/rewards/",
+    "reports/transactions/",
+    "reports/transactions/daily/",
+)
+# Statuses that are a correct answer for the workflow; 429 is counted separately.
+EXPECTED_STATUSES = {
+    "scan": {200},
+    "add-stamp": {200, 201},
+    "redeem": {200, 400},
+    "activate-card": {201},
+    "reports": {200},
+}
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(len(sorted_values) * percent / 100))
+    return sorted_values[rank - 1]
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _Client:
+    """One keep-alive HTTP connection per virtual cashier."""
+
+    def __init__(self, host, port, prefix, token):
+        self.host, self.port, self.prefix = host, port, prefix
+        self.headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        self.conn = None
+
+    def request(self, method, path, params=None, body=None):
+        url = f"{self.prefix}/api/{path}"
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            self.conn.request(method, url, body=json.dumps(body) if body is not None else None, headers=self.headers)
+            response = self.conn.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        if response.getheader("Connection", "").lower() == "close":
+            self.conn.close()
+            self.conn = None
+        return response.status, content
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class _Workload:
+    """Seeded members and spare cards shared by all virtual cashiers."""
+
+    def __init__(self, members, spare_cards, phone_prefix):
+        self.lock = threading.Lock()
+        self.members = members
+        self.spare_cards = spare_cards
+        self.phone_prefix = phone_prefix
+        self.phones = itertools.count()
+
+    def random_member(self, rng):
+        with self.lock:
+            return rng.choice(self.members)
+
+    def add_member(self, member):
+        with self.lock:
+            self.members.append(member)
+
+    def take_spare_card(self):
+        with self.lock:
+            return self.spare_cards.pop() if self.spare_cards else None
+
+    def next_phone(self):
+        with self.lock:
+            return f"{self.phone_prefix}{next(self.phones):05d}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the API with concurrent virtual cashiers replaying activate-card, scan, "
+        "add-stamp, redeem and report calls, and print per-endpoint latency percentiles, "
+        "throughput and error rates as JSON. By default a local server is started on a "
+        "throwaway test database; --url targets a running server and seeds the configured "
+        "database instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cashiers", type=int, default=20, help="Concurrent virtual cashiers")
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+        parser.add_argument("--members", type=int, default=200, help="Active memberships to seed")
+        parser.add_argument("--spare-cards", type=int, default=1000, help="Unassigned cards for activate-card")
+        parser.add_argument(
+            "--mix",
+            default=DEFAULT_MIX,
+            help=f"Relative weights of the workflows (default {DEFAULT_MIX})",
+        )
+        parser.add_argument(
+            "--think-time",
+            type=float,
+            default=0.0,
+            help="Mean pause in seconds between a cashier's requests (0 for maximum load)",
+        )
+        parser.add_argument("--url", help="Base URL of a running server, e.g. http://127.0.0.1:8000")
+        parser.add_argument(
+            "--keep-throttles",
+            action="store_true",
+            help="Apply the configured rate limits to the local server instead of lifting them",
+        )
+        parser.add_argument("--seed", type=int, default=None, help="Random seed for a repeatable request mix")
+        parser.add_argument("--output", help="Also write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if options["cashiers"] < 1 or options["duration"] <= 0 or options["members"] < 1:
+            raise CommandError("--cashiers, --duration and --members must be positive")
+        mix = self._parse_mix(options["mix"])
+
+        test_db_name = None
+        if not options["url"]:
+            test_db_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self._run(mix, options)
+        finally:
+            if test_db_name is not None:
+                connection.creation.destroy_test_db(test_db_name, verbosity=0)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output + "\n")
+        self.stdout.write(output)
+
+    @staticmethod
+    def _parse_mix(value):
+        mix = {}
+        for part in value.split(","):
+            name, _, weight = part.partition("=")
+            name = name.strip()
+            if name not in EXPECTED_STATUSES:
+                raise CommandError(f"Unknown workflow {name!r} in --mix")
+            try:
+                mix[name] = float(weight)
+            except ValueError:
+                raise CommandError(f"Invalid weight for {name!r} in --mix")
+        if not any(weight > 0 for weight in mix.values()):
+            raise CommandError("--mix needs at least one positive weight")
+        return mix
+
+    def _run(self, mix, options):
+        workload, tokens = self._seed(options)
+        server = None
+        if options["url"]:
+            parts = urlsplit(options["url"])
+            host, port, prefix = parts.hostname, parts.port or 80, parts.path.rstrip("/")
+        else:
+            server = self._start_server(options["keep_throttles"])
+            host, port, prefix = "127.0.0.1", server.server_address[1], ""
+
+        rng = random.Random(options["seed"])
+        deadline = time.monotonic() + options["duration"]
+        results = []
+        workers = [
+            threading.Thread(
+                target=self._cashier,
+                args=(
+                    _Client(host, port, prefix, token),
+                    workload,
+                    mix,
+                    random.Random(rng.random()),
+                    options["think_time"],
+                    deadline,
+                    results,
+                ),
+            )
+            for token in tokens
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        return self._report(results, elapsed, options, server is not None)
+
+    def _seed(self, options):
+        user_model = get_user_model()
+        stamp = timezone.now().strftime("%Y%m%d%H%M%S")
+        tokens = []
+        for index in range(options["cashiers"]):
+            user = user_model.objects.create_user(
+                username=f"{LOAD_PREFIX}-{stamp}-{index}", password=None, role=UserRole.CASHIER
+            )
+            tokens.append(str(AccessToken.for_user(user)))
+
+        cards = MembershipCard.provision(options["members"] + options["spare_cards"])
+        members = []
+        for index, card in enumerate(cards[: options["members"]]):
+            customer = Customer.objects.create(name=f"Load Member {index}", phone=f"0855{stamp[-6:]}{index:05d}")
+            membership = Membership.create_new(customer=customer, card=card)
+            members.append((membership.pk, str(card.public_id)))
+        spare = [(card.card_number, str(card.public_id)) for card in cards[options["members"]:]]
+        return _Workload(members, spare, phone_prefix=f"0866{stamp[-6:]}"), tokens
+
+    def _start_server(self, keep_throttles):
+        # Expected 4xx answers (e.g. redeem without a reward) are counted, not logged.
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+        if not keep_throttles:
+            for throttle in BaseUserRateThrottle.__subclasses__():
+                throttle.rate = "1000000/s"
+        # An in-memory SQLite test database lives on this thread's connection;
+        # hand it to the server thread and serve one request at a time.
+        overrides = {}
+        for conn in connections.all():
+            if conn.vendor == "sqlite" and conn.is_in_memory_db():
+                conn.inc_thread_sharing()
+                overrides[conn.alias] = conn
+        server_class = WSGIServer if overrides else ThreadedWSGIServer
+        server = server_class(("127.0.0.1", 0), _QuietRequestHandler, allow_reuse_address=False)
+        server.set_app(get_internal_wsgi_application())
+
+        def serve():
+            for alias, conn in overrides.items():
+                connections[alias] = conn
+            server.serve_forever()
+
+        threading.Thread(target=serve, daemon=True).start()
+        return server
+
+    def _cashier(self, client, workload, mix, rng, think_time, deadline, results):
+        names, weights = list(mix), list(mix.values())
+        local = []
+        try:
+            while time.monotonic() < deadline:
+                workflow = rng.choices(names, weights)[0]
+                for endpoint, method, path, params, body in self._requests(workflow, workload, rng):
+                    started = time.perf_counter()
+                    try:
+                        status, content = client.request(method, path, params, body)
+                    except (OSError, http.client.HTTPException):
+                        status, content = None, b""
+                    local.append((endpoint, status, time.perf_counter() - started))
+                    if endpoint == "activate-card" and status == 201:
+                        workload.add_member((json.loads(content)["id"], body["public_id"]))
+                if think_time:
+                    time.sleep(rng.expovariate(1 / think_time))
+        finally:
+            client.close()
+            results.extend(local)
+
+    @staticmethod
+    def _requests(workflow, workload, rng):
+        """``(endpoint, method, path, params, body)`` tuples for one workflow step."""
+        if workflow == "activate-card":
+            card = workload.take_spare_card()
+            if card is not None:
+                card_number, public_id = card
+                phone = workload.next_phone()
+                body = {
+                    "card_number": card_number,
+                    "public_id": public_id,
+                    "name": f"Load Customer {phone}",
+                    "phone": phone,
+                }
+                yield "activate-card", "POST", "memberships/activate-card/", None, body
+                return
+            workflow = "scan"
+        if workflow == "reports":
+            path = rng.choice(REPORT_PATHS)
+            yield path, "GET", path, None, None
+            return
+
+        membership_id, public_id = workload.random_member(rng)
+        # Every counter visit starts by scanning the card.
+        yield "scan", "GET", "memberships/scan/", {"public_id": public_id}, None
+        if workflow == "add-stamp":
+            body = {
+                "transaction_amount": str(rng.choice([25000, 50000, 75000, 120000])),
+                "pos_receipt_number": f"{LOAD_PREFIX}-{rng.getrandbits(64):016x}",
+            }
+            yield "add-stamp", "POST", f"memberships/{membership_id}/add-stamp/", None, body
+        elif workflow == "redeem":
+            body = {"reward_type": rng.choice([RewardType.FREE_DRINK, RewardType.VOUCHER_50K]).value}
+            yield "redeem", "POST", f"memberships/{membership_id}/redeem/", None, body
+
+    @staticmethod
+    def _report(results, elapsed, options, local_server):
+        by_endpoint = {}
+        for endpoint, status, latency in results:
+            by_endpoint.setdefault(endpoint, []).append((status, latency))
+
+        endpoints = {}
+        total_errors = total_throttled = 0
+        for endpoint in sorted(by_endpoint):
+            samples = by_endpoint[endpoint]
+            expected = EXPECTED_STATUSES["reports" if endpoint.startswith("reports/") else endpoint]
+            statuses = Counter("error" if status is None else str(status) for status, _ in samples)
+            throttled = statuses.get("429", 0)
+            errors = sum(1 for status, _ in samples if status != 429 and status not in expected)
+            latencies = sorted(latency for _, latency in samples)
+            total_errors += errors
+            total_throttled += throttled
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "requests_per_second": round(len(samples) / elapsed, 1),
+                "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "throttled": throttled,
+                "statuses": dict(sorted(statuses.items())),
+            }
+
+        latencies = sorted(latency for _, _, latency in results)
+        return {
+            "server": "in-process" if local_server else options["url"],
+            "database": connection.vendor,
+            "cashiers": options["cashiers"],
+            "mix": options["mix"],
+            "think_time": options["think_time"],
+            "seconds": round(elapsed, 3),
+            "total": {
+                "requests": len(results),
+                "requests_per_second": round(len(results) / elapsed, 1),
+                "p50_ms": round((_percentile(latencies, 50) or 0) * 1000, 2),
+                "p95_ms": round((_percentile(latencies, 95) or 0) * 1000, 2),
+                "p99_ms": round((_percentile(latencies, 99) or 0) * 1000, 2),
+                "errors": total_errors,
+                "error_rate": round(total_errors / len(results), 4) if results else 0,
+                "throttled": total_throttled,
+            },
+            "endpoints": endpoints,
+        }
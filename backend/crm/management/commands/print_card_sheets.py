@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.card_sheets import SHEET_FORMATS, write_card_sheets
+from crm.services import cards_for_sheets
+
+
+class Command(BaseCommand):
+    help = (
+        "Render print-ready QR card sheets: a multi-page PDF or a ZIP of PNG/SVG "
+        "files. Either create --count new cards or print existing unassigned cards "
+        "by id range."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="File to write")
+        parser.add_argument("--count", type=int, help="Create and print this many new cards")
+        parser.add_argument("--start-id", type=int, help="First unassigned card id to print")
+        parser.add_argument("--end-id", type=int, help="Last unassigned card id to print")
+        parser.add_argument("--format", dest="fmt", choices=sorted(SHEET_FORMATS), default="pdf")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Rendering processes (default: one per CPU)",
+        )
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        if count is not None and (count < 1 or options["start_id"] or options["end_id"]):
+            raise CommandError("--count must be positive and cannot be combined with an id range")
+
+        cards = cards_for_sheets(count=count, start_id=options["start_id"], end_id=options["end_id"])
+        if not cards:
+            raise CommandError("No cards to print")
+
+        started = time.perf_counter()
+        with open(options["output"], "wb") as output:
+            write_card_sheets(cards, output, fmt=options["fmt"], workers=options["workers"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Rendered {len(cards)} cards to {options['output']} in {elapsed:.1f}s")
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.models import MembershipCard
+
+
+class Command(BaseCommand):
+    help = "Create unassigned membership cards in bulk with sequential, check-digited numbers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("count", type=int)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["count"] < 1:
+            raise CommandError("count must be positive")
+        cards = MembershipCard.provision(options["count"], batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(cards)} cards ({cards[0].card_number} .. {cards[-1].card_number})"
+            )
+        )
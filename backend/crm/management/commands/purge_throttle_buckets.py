@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.throttles import get_bucket_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete throttle buckets that have been idle for a while. A missing bucket "
+        "starts full, so any bucket idle longer than its refill time can go. Run hourly, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--idle", type=int, default=3600, help="Seconds since the bucket was last used")
+
+    def handle(self, *args, **options):
+        purged = get_bucket_store().purge(time.time() - options["idle"])
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} throttle buckets"))
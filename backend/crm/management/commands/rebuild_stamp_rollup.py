@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from crm.models import DailyStampRollup
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily stamp rollup used by the transaction reports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="end", help="Last day to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for key in ("start", "end"):
+            value = options[key]
+            try:
+                dates[key] = parse_date(value) if value else None
+            except ValueError:
+                dates[key] = None
+            if value and dates[key] is None:
+                raise CommandError(f"Invalid date: {value}")
+
+        rows = DailyStampRollup.rebuild(start_date=dates["start"], end_date=dates["end"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily rollup rows"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from crm.models import StampCycle
+
+
+class Command(BaseCommand):
+    help = "Recompute StampCycle.stamp_count from the stamp table where it has drifted."
+
+    def handle(self, *args, **options):
+        fixed = StampCycle.reconcile_stamp_counts()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {fixed} stamp cycles"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from crm.identifiers import normalize_phone
+from crm.models import Customer
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = "Recompute Customer.phone_key, e.g. after changing PHONE_COUNTRY_CODE."
+
+    def handle(self, *args, **options):
+        changed = []
+        for customer in Customer.objects.only("id", "phone", "phone_key").iterator(chunk_size=BATCH_SIZE):
+            phone_key = normalize_phone(customer.phone)
+            if phone_key != customer.phone_key:
+                customer.phone_key = phone_key
+                changed.append(customer)
+        Customer.objects.bulk_update(changed, ["phone_key"], batch_size=BATCH_SIZE)
+        self.stdout.write(self.style.SUCCESS(f"Updated {len(changed)} phone keys"))
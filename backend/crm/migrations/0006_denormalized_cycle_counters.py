@@ -0,0 +1,58 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_cycle_counters(apps, schema_editor):
+    Membership = apps.get_model("crm", "Membership")
+    StampCycle = apps.get_model("crm", "StampCycle")
+    Stamp = apps.get_model("crm", "Stamp")
+
+    stamp_counts = (
+        Stamp.objects.filter(cycle=OuterRef("pk"))
+        .order_by()
+        .values("cycle")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    StampCycle.objects.update(stamp_count=Coalesce(Subquery(stamp_counts), 0))
+
+    open_cycle = (
+        StampCycle.objects.filter(membership=OuterRef("pk"), is_closed=False)
+        .order_by("-cycle_number")
+        .values("pk")[:1]
+    )
+    latest_cycle = (
+        StampCycle.objects.filter(membership=OuterRef("pk"))
+        .order_by("-cycle_number")
+        .values("pk")[:1]
+    )
+    Membership.objects.update(active_cycle=Coalesce(Subquery(open_cycle), Subquery(latest_cycle)))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("crm", "0005_auditlog"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stampcycle",
+            name="stamp_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="membership",
+            name="active_cycle",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="crm.stampcycle",
+            ),
+        ),
+        migrations.RunPython(backfill_cycle_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-16 22:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_denormalized_cycle_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='programsettings',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,62 @@
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+# Frozen copy of crm.identifiers.normalize_phone, so later changes to that
+# module cannot change what this migration writes. Only the country code is
+# read from settings; refresh_phone_keys rewrites keys after it changes.
+_PHONE_PUNCTUATION = re.compile(r"[\s\-().]")
+
+
+def normalize_phone(value):
+    country_code = getattr(settings, "PHONE_COUNTRY_CODE", "62")
+    digits = _PHONE_PUNCTUATION.sub("", value.strip())
+    if digits.startswith("+"):
+        return digits
+    if digits.startswith("00"):
+        return f"+{digits[2:]}"
+    if digits.startswith("0"):
+        return f"+{country_code}{digits[1:]}"
+    if digits.startswith(country_code):
+        return f"+{digits}"
+    return digits
+
+
+def backfill_lookup_keys(apps, schema_editor):
+    Customer = apps.get_model("crm", "Customer")
+    Membership = apps.get_model("crm", "Membership")
+
+    Membership.objects.update(card_number_key=Upper("card_number"))
+
+    batch = []
+    for customer in Customer.objects.only("id", "phone").iterator(chunk_size=2000):
+        customer.phone_key = normalize_phone(customer.phone)
+        batch.append(customer)
+        if len(batch) >= 2000:
+            Customer.objects.bulk_update(batch, ["phone_key"])
+            batch = []
+    if batch:
+        Customer.objects.bulk_update(batch, ["phone_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_program_settings_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='phone_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='card_number_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(backfill_lookup_keys, migrations.RunPython.noop),
+    ]
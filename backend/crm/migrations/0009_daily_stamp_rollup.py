@@ -0,0 +1,43 @@
+# Generated by Django 5.2.9 on 2026-10-16 22:39
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_rollup(apps, schema_editor):
+    Stamp = apps.get_model("crm", "Stamp")
+    DailyStampRollup = apps.get_model("crm", "DailyStampRollup")
+    rows = (
+        Stamp.objects.annotate(day=TruncDate("created_at"))
+        .values("day")
+        .annotate(count=Count("id"), total=Sum("transaction_amount"))
+        .order_by("day")
+    )
+    DailyStampRollup.objects.bulk_create(
+        [
+            DailyStampRollup(day=row["day"], stamp_count=row["count"], total_transaction_amount=row["total"] or 0)
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_identifier_lookup_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStampRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('stamp_count', models.PositiveIntegerField(default=0)),
+                ('total_transaction_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.RunPython(backfill_daily_rollup, migrations.RunPython.noop),
+    ]
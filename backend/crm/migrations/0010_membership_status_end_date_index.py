@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-16 22:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_daily_stamp_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(fields=['status', 'end_date'], name='crm_membership_status_end'),
+        ),
+    ]
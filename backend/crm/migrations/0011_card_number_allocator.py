@@ -0,0 +1,36 @@
+# Generated by Django 5.2.9 on 2026-10-16 22:49
+
+from django.db import migrations, models
+
+SEQUENCE = "crm_card_number_seq"
+
+
+def create_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} START 1")
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP SEQUENCE IF EXISTS {SEQUENCE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0010_membership_status_end_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -0,0 +1,89 @@
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import migrations
+from django.utils import timezone
+
+# Frozen copies of the crm.audit_partitions helpers, so later changes to that
+# module cannot change what this migration does.
+AUDIT_TABLE = "crm_auditlog"
+DEFAULT_PARTITION = f"{AUDIT_TABLE}_default"
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def create_month_partition(cursor, month):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {AUDIT_TABLE}_{month:%Y%m} PARTITION OF {AUDIT_TABLE} "
+        "FOR VALUES FROM (%s) TO (%s)",
+        [_bound(month), _bound(add_months(month, 1))],
+    )
+
+
+# The model keeps ``id`` as its primary key; PostgreSQL needs the partition key
+# in the table's primary key, so the table itself uses (id, created_at).
+
+
+def partition_audit_log(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {AUDIT_TABLE} RENAME TO {AUDIT_TABLE}_legacy")
+        cursor.execute(
+            f"CREATE TABLE {AUDIT_TABLE} (LIKE {AUDIT_TABLE}_legacy INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute(f"ALTER TABLE {AUDIT_TABLE} ADD PRIMARY KEY (id, created_at)")
+        for column, target in (
+            ("user_id", "users_user"),
+            ("membership_id", "crm_membership"),
+            ("card_id", "crm_membershipcard"),
+        ):
+            cursor.execute(
+                f"ALTER TABLE {AUDIT_TABLE} ADD CONSTRAINT {AUDIT_TABLE}_{column}_fk "
+                f"FOREIGN KEY ({column}) REFERENCES {target} (id) DEFERRABLE INITIALLY DEFERRED"
+            )
+            cursor.execute(f"CREATE INDEX {AUDIT_TABLE}_{column}_idx ON {AUDIT_TABLE} ({column})")
+        cursor.execute(f"CREATE INDEX {AUDIT_TABLE}_created_at_idx ON {AUDIT_TABLE} (created_at)")
+
+        cursor.execute(f"SELECT MIN(created_at) FROM {AUDIT_TABLE}_legacy")
+        oldest = cursor.fetchone()[0] or timezone.now()
+        month = month_start(oldest.date())
+        last = add_months(month_start(timezone.now().date()), 3)
+        while month <= last:
+            create_month_partition(cursor, month)
+            month = add_months(month, 1)
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {AUDIT_TABLE} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {AUDIT_TABLE} SELECT * FROM {AUDIT_TABLE}_legacy")
+        cursor.execute(f"DROP TABLE {AUDIT_TABLE}_legacy")
+
+        cursor.execute(f"CREATE SEQUENCE {AUDIT_TABLE}_id_seq OWNED BY {AUDIT_TABLE}.id")
+        cursor.execute(
+            f"SELECT setval('{AUDIT_TABLE}_id_seq', COALESCE((SELECT MAX(id) FROM {AUDIT_TABLE}), 0) + 1, false)"
+        )
+        cursor.execute(f"ALTER TABLE {AUDIT_TABLE} ALTER COLUMN id SET DEFAULT nextval('{AUDIT_TABLE}_id_seq')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0012_audit_log_event_time'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        # Unapplying leaves the table partitioned: the model is unchanged, so the
+        # partitioned table keeps serving it, and archived months cannot be folded back.
+        migrations.RunPython(partition_audit_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.9 on 2026-10-16 22:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_metadata_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    # jsonb_path_ops serves metadata__contains (@>) lookups with a smaller index.
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS crm_audit_metadata_gin ON crm_auditlog USING gin (metadata jsonb_path_ops)"
+    )
+
+
+def drop_metadata_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS crm_audit_metadata_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0013_partition_audit_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['membership', 'created_at'], name='crm_audit_membership_created'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['user', 'created_at'], name='crm_audit_user_created'),
+        ),
+        migrations.RunPython(create_metadata_index, drop_metadata_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-16 22:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0014_audit_log_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scan_stats', to='crm.membershipcard')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scan_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('card', 'user', 'hour'), name='crm_scanstat_card_user_hour')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-16 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0015_scan_stat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.FloatField()),
+                ('allowed', models.BooleanField(default=True)),
+            ],
+        ),
+    ]
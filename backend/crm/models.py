@@ -1,10 +1,25 @@
+from collections import deque
 from datetime import timedelta
+import os
+import threading
+import time
 import uuid
 
-from django.db import models, transaction
-from django.db.models import Q
+from django.conf import settings as django_settings
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 
+from .cache import invalidate_membership
+from .identifiers import format_card_number, normalize_card_number, normalize_phone
+
+STAMPS_PER_CYCLE = 10
+CARD_NUMBER_SEQUENCE = "crm_card_number_seq"
+SCAN_STAT_BATCH_SIZE = 500
+
 
 class TimeStampedModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -17,11 +32,76 @@ class TimeStampedModel(models.Model):
 class Customer(TimeStampedModel):
     name = models.CharField(max_length=255)
     phone = models.CharField(max_length=20, unique=True)
+    # E.164 form of ``phone`` used for identifier lookups.
+    phone_key = models.CharField(max_length=20, db_index=True, editable=False, default="")
     email = models.EmailField(blank=True, null=True)
 
     def __str__(self) -> str:
         return f"{self.name} ({self.phone})"
 
+    def save(self, *args, **kwargs):
+        self.phone_key = normalize_phone(self.phone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_key"}
+        super().save(*args, **kwargs)
+
+
+class CardNumberCounter(models.Model):
+    """Card number counter for databases without native sequences."""
+
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.next_value}"
+
+
+def reserve_card_sequences(count: int) -> list[int]:
+    """Reserve ``count`` unused card sequence values in one round trip.
+
+    PostgreSQL hands them out with ``nextval``, which is not rolled back with
+    the caller's transaction, so a value is never issued twice. Elsewhere a
+    locked counter row is used instead.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                [CARD_NUMBER_SEQUENCE, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    with transaction.atomic():
+        counter, _ = CardNumberCounter.objects.select_for_update().get_or_create(name=CARD_NUMBER_SEQUENCE)
+        start = counter.next_value
+        counter.next_value = start + count
+        counter.save(update_fields=["next_value"])
+    return list(range(start, start + count))
+
+
+class CardNumberAllocator:
+    """Hi/lo allocator: each process reserves a block and hands numbers out locally."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._pid = os.getpid()
+
+    def next(self) -> str:
+        block_size = getattr(django_settings, "CARD_NUMBER_BLOCK_SIZE", 100)
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not reuse the parent's reserved block.
+                self._pending.clear()
+                self._pid = os.getpid()
+            if not self._pending:
+                self._pending.extend(reserve_card_sequences(block_size))
+            return format_card_number(self._pending.popleft())
+
+
+card_number_allocator = CardNumberAllocator()
+
 
 class MembershipCard(TimeStampedModel):
     public_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
@@ -37,15 +117,20 @@ class MembershipCard(TimeStampedModel):
 
     @staticmethod
     def generate_card_number() -> str:
-        return f"CARD-{uuid.uuid4().hex[:10].upper()}"
+        return card_number_allocator.next()
 
     def save(self, *args, **kwargs):
         if not self.card_number:
             self.card_number = self.generate_card_number()
-            while type(self).objects.filter(card_number=self.card_number).exists():
-                self.card_number = self.generate_card_number()
         super().save(*args, **kwargs)
 
+    @classmethod
+    def provision(cls, count: int, batch_size: int = 1000) -> list["MembershipCard"]:
+        """Create ``count`` unassigned cards with freshly reserved numbers."""
+        cards = [cls(card_number=format_card_number(value)) for value in reserve_card_sequences(count)]
+        with transaction.atomic():
+            return cls.objects.bulk_create(cards, batch_size=batch_size)
+
     def __str__(self) -> str:
         return f"{self.card_number} ({'assigned' if self.is_assigned else 'unassigned'})"
 
@@ -59,6 +144,8 @@ class MembershipStatus(models.TextChoices):
 class Membership(TimeStampedModel):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="memberships")
     card_number = models.CharField(max_length=50, unique=True, editable=False)
+    # Upper-cased ``card_number`` so case-insensitive lookups can use an index.
+    card_number_key = models.CharField(max_length=50, db_index=True, editable=False, default="")
 
     start_date = models.DateField()
     end_date = models.DateField()
@@ -68,15 +155,44 @@ class Membership(TimeStampedModel):
         choices=MembershipStatus.choices,
         default=MembershipStatus.ACTIVE,
     )
+    # Denormalized pointer so stamp awarding does not have to search cycles.
+    active_cycle = models.ForeignKey(
+        "StampCycle",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "end_date"], name="crm_membership_status_end"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.card_number} - {self.customer.name}"
 
+    def save(self, *args, **kwargs):
+        self.card_number_key = normalize_card_number(self.card_number)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "card_number" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "card_number_key"}
+        super().save(*args, **kwargs)
+        invalidate_membership(self.pk)
+
     @property
     def is_active(self) -> bool:
         today = timezone.localdate()
         return self.status == MembershipStatus.ACTIVE and self.start_date <= today <= self.end_date
 
+    @property
+    def effective_status(self) -> str:
+        """Status as of today, without waiting for the expiry sweep to store it."""
+        if self.status == MembershipStatus.ACTIVE and timezone.localdate() > self.end_date:
+            return MembershipStatus.EXPIRED
+        return self.status
+
     def refresh_status_by_date(self) -> None:
         today = timezone.localdate()
         if self.status == MembershipStatus.BLOCKED:
@@ -85,6 +201,16 @@ class Membership(TimeStampedModel):
             self.status = MembershipStatus.EXPIRED
             self.save(update_fields=["status"])
 
+    @classmethod
+    def expire_due(cls, today=None) -> int:
+        """Expire every active membership past its end date in one UPDATE."""
+        # Read paths already report these as expired via effective_status, so
+        # cached payloads need no invalidation here.
+        today = today or timezone.localdate()
+        return cls.objects.filter(status=MembershipStatus.ACTIVE, end_date__lt=today).update(
+            status=MembershipStatus.EXPIRED
+        )
+
     @classmethod
     def create_new(
         cls,
@@ -96,7 +222,7 @@ class Membership(TimeStampedModel):
     ) -> "Membership":
         from .models import ProgramSettings  # local import to avoid circular dependency
 
-        settings = ProgramSettings.get_solo()
+        settings = ProgramSettings.get_cached()
         months = duration_months or settings.membership_duration_months
 
         start = start_date or timezone.localdate()
@@ -123,6 +249,8 @@ class Membership(TimeStampedModel):
                 number=1,
                 reward_type=settings.reward_stamp_1_type or RewardType.FREE_DRINK,
             )
+            membership.active_cycle = cycle
+            membership.save(update_fields=["active_cycle"])
             return membership
 
 
@@ -130,6 +258,8 @@ class StampCycle(TimeStampedModel):
     membership = models.ForeignKey(Membership, on_delete=models.CASCADE, related_name="cycles")
     cycle_number = models.PositiveIntegerField()
     is_closed = models.BooleanField(default=False)
+    # Maintained by Stamp.save() so reads never need a COUNT over stamps.
+    stamp_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ("membership", "cycle_number")
@@ -137,13 +267,34 @@ class StampCycle(TimeStampedModel):
     def __str__(self) -> str:
         return f"{self.membership.card_number} - Cycle {self.cycle_number}"
 
-    @property
-    def stamp_count(self) -> int:
-        return self.stamps.count()
-
     @property
     def is_full(self) -> bool:
-        return self.stamp_count >= 10
+        return self.stamp_count >= STAMPS_PER_CYCLE
+
+    @classmethod
+    def reconcile_stamp_counts(cls) -> int:
+        """Reset ``stamp_count`` from the stamp table wherever it has drifted."""
+        actual = Coalesce(
+            Subquery(
+                Stamp.objects.filter(cycle=OuterRef("pk"))
+                .order_by()
+                .values("cycle")
+                .annotate(count=Count("id"))
+                .values("count")
+            ),
+            0,
+        )
+        drifted = dict(
+            cls.objects.annotate(actual=actual)
+            .exclude(stamp_count=F("actual"))
+            .values_list("pk", "membership_id")
+        )
+        if not drifted:
+            return 0
+        with transaction.atomic():
+            updated = cls.objects.filter(pk__in=drifted).update(stamp_count=actual)
+            invalidate_membership(*set(drifted.values()))
+        return updated
 
 
 class RewardType(models.TextChoices):
@@ -179,6 +330,30 @@ class Stamp(TimeStampedModel):
     def __str__(self) -> str:
         return f"Stamp {self.number} - {self.cycle}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            self._bump_cycle_counter()
+            DailyStampRollup.add(
+                timezone.localdate(self.created_at),
+                count=1,
+                amount=self.transaction_amount or 0,
+            )
+
+    def _bump_cycle_counter(self) -> None:
+        closes_cycle = self.number >= STAMPS_PER_CYCLE
+        updates = {"stamp_count": F("stamp_count") + 1}
+        if closes_cycle:
+            updates["is_closed"] = True
+        StampCycle.objects.filter(pk=self.cycle_id).update(**updates)
+
+        # Keep an already-loaded cycle in sync so callers can keep using it.
+        if Stamp.cycle.is_cached(self):
+            self.cycle.stamp_count += 1
+            if closes_cycle:
+                self.cycle.is_closed = True
+
     @property
     def is_redeemed(self) -> bool:
         return self.redeemed_at is not None
@@ -187,6 +362,87 @@ class Stamp(TimeStampedModel):
         if not self.is_redeemed:
             self.redeemed_at = timezone.now()
             self.save(update_fields=["redeemed_at"])
+            invalidate_membership(self.cycle.membership_id)
+
+
+@receiver(post_delete, sender=Stamp, dispatch_uid="crm.models.stamp_deleted")
+def _stamp_deleted(sender, instance, **kwargs):
+    # Admin, queryset and cascade deletes all end here; undo what save() added.
+    DailyStampRollup.add(
+        timezone.localdate(instance.created_at),
+        count=-1,
+        amount=-(instance.transaction_amount or 0),
+    )
+    cycles = StampCycle.objects.filter(pk=instance.cycle_id)
+    cycles.filter(stamp_count__gt=0).update(stamp_count=F("stamp_count") - 1)
+    membership_id = cycles.values_list("membership_id", flat=True).first()
+    if membership_id is not None:
+        invalidate_membership(membership_id)
+
+
+class DailyStampRollup(models.Model):
+    """Per-day stamp count and transaction total, kept current as stamps are created."""
+
+    day = models.DateField(unique=True)
+    stamp_count = models.PositiveIntegerField(default=0)
+    total_transaction_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self) -> str:
+        return f"{self.day}: {self.stamp_count} stamps"
+
+    @classmethod
+    def add(cls, day, count: int, amount) -> None:
+        """Apply ``count``/``amount`` to the day once the current transaction commits.
+
+        The increment runs in its own short transaction, so the per-day row lock
+        is never held across a stamp award. A crash between the two commits
+        leaves the day short; ``rebuild_stamp_rollup`` repairs it.
+        """
+        transaction.on_commit(lambda: cls._apply(day, count, amount))
+
+    @classmethod
+    def _apply(cls, day, count: int, amount) -> None:
+        increments = {
+            "stamp_count": F("stamp_count") + count,
+            "total_transaction_amount": F("total_transaction_amount") + amount,
+        }
+        if cls.objects.filter(day=day).update(**increments) or count < 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(day=day, stamp_count=count, total_transaction_amount=amount)
+        except IntegrityError:
+            # Another transaction created the day first.
+            cls.objects.filter(day=day).update(**increments)
+
+    @classmethod
+    def rebuild(cls, start_date=None, end_date=None) -> int:
+        """Recompute rows for the given range from the stamp table."""
+        stamps = Stamp.objects.all()
+        rollups = cls.objects.all()
+        if start_date:
+            stamps = stamps.filter(created_at__date__gte=start_date)
+            rollups = rollups.filter(day__gte=start_date)
+        if end_date:
+            stamps = stamps.filter(created_at__date__lte=end_date)
+            rollups = rollups.filter(day__lte=end_date)
+
+        rows = (
+            stamps.annotate(day=TruncDate("created_at"))
+            .values("day")
+            .annotate(count=models.Count("id"), total=models.Sum("transaction_amount"))
+            .order_by("day")
+        )
+        with transaction.atomic():
+            rollups.delete()
+            created = cls.objects.bulk_create(
+                [
+                    cls(day=row["day"], stamp_count=row["count"], total_transaction_amount=row["total"] or 0)
+                    for row in rows
+                ],
+                batch_size=1000,
+            )
+        return len(created)
 
 
 class ProgramSettings(TimeStampedModel):
@@ -209,14 +465,67 @@ class ProgramSettings(TimeStampedModel):
         default=RewardType.VOUCHER_50K,
     )
 
+    # Bumped on every save so cached copies can tell they are stale.
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    _cache_lock = threading.Lock()
+    _cached = None
+    _cached_checked_at = 0.0
+
     def __str__(self) -> str:
         return "Program Settings"
 
+    def save(self, *args, **kwargs):
+        bump = not self._state.adding
+        if bump:
+            # Incremented in SQL so concurrent saves each get their own version.
+            self.version = F("version") + 1
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "version"}
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=["version"])
+        type(self).clear_cache()
+
     @classmethod
     def get_solo(cls) -> "ProgramSettings":
         obj, _ = cls.objects.get_or_create(id=1)
         return obj
 
+    @classmethod
+    def get_cached(cls) -> "ProgramSettings":
+        """Read-only settings for hot paths.
+
+        The row is kept per process and revalidated against ``version`` once
+        ``PROGRAM_SETTINGS_CACHE_SECONDS`` have passed, so other workers pick
+        up changes within that window. Use ``get_solo()`` to modify settings.
+        """
+        ttl = getattr(django_settings, "PROGRAM_SETTINGS_CACHE_SECONDS", 30)
+        now = time.monotonic()
+        with cls._cache_lock:
+            cached, checked_at = cls._cached, cls._cached_checked_at
+        if cached is not None and now - checked_at < ttl:
+            return cached
+
+        if cached is not None:
+            version = cls.objects.filter(id=1).values_list("version", flat=True).first()
+            if version == cached.version:
+                with cls._cache_lock:
+                    cls._cached_checked_at = now
+                return cached
+
+        fresh = cls.get_solo()
+        with cls._cache_lock:
+            cls._cached, cls._cached_checked_at = fresh, now
+        return fresh
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        with cls._cache_lock:
+            cls._cached = None
+            cls._cached_checked_at = 0.0
+
 
 class AuditAction(models.TextChoices):
     ACTIVATE_CARD = "activate_card", "Activate Card"
@@ -225,7 +534,59 @@ class AuditAction(models.TextChoices):
     REPLACE_CARD = "replace_card", "Replace Card"
 
 
+class ScanStat(models.Model):
+    """Scans per card, cashier and hour; replaces one audit row per scan."""
+
+    card = models.ForeignKey(MembershipCard, on_delete=models.CASCADE, related_name="scan_stats")
+    user = models.ForeignKey("users.User", on_delete=models.CASCADE, related_name="scan_stats")
+    hour = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["card", "user", "hour"], name="crm_scanstat_card_user_hour"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.card_id} / {self.user_id} @ {self.hour}: {self.count}"
+
+    @classmethod
+    def upsert_counts(cls, counts: dict) -> None:
+        """Add ``{(card_id, user_id, hour): count}`` to the stored counters in one statement."""
+        if not counts:
+            return
+        table = connection.ops.quote_name(cls._meta.db_table)
+        hour_field = cls._meta.get_field("hour")
+        items = list(counts.items())
+        with connection.cursor() as cursor:
+            for start in range(0, len(items), SCAN_STAT_BATCH_SIZE):
+                batch = items[start:start + SCAN_STAT_BATCH_SIZE]
+                params = []
+                for (card_id, user_id, hour), count in batch:
+                    params.extend([card_id, user_id, hour_field.get_db_prep_value(hour, connection), count])
+                cursor.execute(
+                    f"INSERT INTO {table} (card_id, user_id, hour, count) "
+                    f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(batch))} "
+                    f"ON CONFLICT (card_id, user_id, hour) DO UPDATE SET count = {table}.count + EXCLUDED.count",
+                    params,
+                )
+
+
+class ThrottleBucket(models.Model):
+    """Token bucket state for crm.throttles when THROTTLE_STORE is "db"."""
+
+    key = models.CharField(max_length=200, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField()
+    allowed = models.BooleanField(default=True)
+
+    def __str__(self) -> str:
+        return f"{self.key}: {self.tokens:.2f}"
+
+
 class AuditLog(TimeStampedModel):
+    # Set when the action happens, not when a buffered entry is written.
+    created_at = models.DateTimeField(default=timezone.now)
     action = models.CharField(max_length=30, choices=AuditAction.choices)
     user = models.ForeignKey(
         "users.User",
@@ -250,5 +611,12 @@ class AuditLog(TimeStampedModel):
     )
     metadata = models.JSONField(default=dict, blank=True)
 
+    class Meta:
+        # A GIN index on metadata is added on PostgreSQL by migration 0014.
+        indexes = [
+            models.Index(fields=["membership", "created_at"], name="crm_audit_membership_created"),
+            models.Index(fields=["user", "created_at"], name="crm_audit_user_created"),
+        ]
+
     def __str__(self) -> str:
         return f"{self.action} ({self.created_at})"
@@ -0,0 +1,120 @@
+import base64
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import uuid
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination that seeks on the full ``ordering`` key.
+
+    The cursor holds the ordering values of the last row served, so every page
+    is an index range scan from that row; there is no COUNT(*) and no OFFSET.
+    ``ordering`` must end with a unique field. The default, newest id first,
+    is served by the primary key index.
+    """
+
+    ordering = ("-id",)
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _fields(self):
+        return [(name.lstrip("-"), name.startswith("-")) for name in self.ordering]
+
+    @staticmethod
+    def _json_value(value):
+        # Full precision: DjangoJSONEncoder would cut datetimes to milliseconds.
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        if isinstance(value, (Decimal, uuid.UUID)):
+            return str(value)
+        return value
+
+    def encode_cursor(self, item) -> str:
+        get = item.get if isinstance(item, dict) else lambda name: getattr(item, name)
+        values = [self._json_value(get(name)) for name, _ in self._fields()]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, queryset, cursor: str) -> list:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            fields = self._fields()
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            return [self._field(queryset, name).to_python(value) for (name, _), value in zip(fields, values)]
+        except Exception:
+            raise NotFound("Invalid cursor")
+
+    @staticmethod
+    def _field(queryset, name):
+        # Orderings may use annotations, e.g. a column joined from a parent.
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def _after(self, values) -> Q:
+        # (a, b) after (x, y)  ==  a > x OR (a = x AND b > y), per direction.
+        clauses = []
+        for index, ((name, descending), value) in enumerate(zip(self._fields(), values)):
+            equal = {field: previous for (field, _), previous in zip(self._fields()[:index], values)}
+            clauses.append(Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value}))
+        return reduce(or_, clauses)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(queryset, cursor)))
+        items = list(queryset[: size + 1])
+        self.has_next = len(items) > size
+        items = items[:size]
+        self.next_cursor = self.encode_cursor(items[-1]) if self.has_next else None
+        return items
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+
+class AuditLogPagination(KeysetPagination):
+    ordering = ("-created_at", "-id")
+
+
+class StampHistoryPagination(KeysetPagination):
+    ordering = ("-cycle_number", "-number")
+
+
+class CycleSummaryPagination(KeysetPagination):
+    ordering = ("-cycle_number",)
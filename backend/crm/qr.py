@@ -0,0 +1,80 @@
+from collections import OrderedDict
+import io
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+import qrcode
+from qrcode.image.svg import SvgPathImage
+
+QR_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+# Bump when the rendering parameters change so clients and the disk store
+# stop reusing old images.
+QR_RENDER_VERSION = 1
+
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def qr_etag(public_id, fmt: str) -> str:
+    return f'"qr-{public_id}-{fmt}-v{QR_RENDER_VERSION}"'
+
+
+def _render(public_id, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "svg":
+        qrcode.make(str(public_id), image_factory=SvgPathImage).save(buffer)
+    else:
+        qrcode.make(str(public_id)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _disk_path(public_id, fmt: str) -> Path | None:
+    directory = getattr(settings, "QR_CACHE_DIR", None)
+    if not directory:
+        return None
+    return Path(directory) / f"v{QR_RENDER_VERSION}" / f"{public_id}.{fmt}"
+
+
+def _remember(key, content: bytes) -> None:
+    limit = getattr(settings, "QR_CACHE_SIZE", 1024)
+    with _memory_lock:
+        _memory_cache[key] = content
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > limit:
+            _memory_cache.popitem(last=False)
+
+
+def get_qr_image(public_id, fmt: str = "png") -> bytes:
+    """Rendered QR code for a card, from memory, then disk, then qrcode."""
+    key = (str(public_id), fmt)
+    with _memory_lock:
+        content = _memory_cache.get(key)
+        if content is not None:
+            _memory_cache.move_to_end(key)
+            return content
+
+    path = _disk_path(public_id, fmt)
+    if path is not None and path.exists():
+        content = path.read_bytes()
+    else:
+        content = _render(public_id, fmt)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename so concurrent readers never see a partial file.
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(content)
+            tmp_path.replace(path)
+
+    _remember(key, content)
+    return content
+
+
+def clear_qr_cache() -> None:
+    with _memory_lock:
+        _memory_cache.clear()
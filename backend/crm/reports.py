@@ -0,0 +1,115 @@
+from functools import reduce
+from operator import or_
+
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DailyStampRollup, Membership, MembershipStatus, RewardType, Stamp
+
+
+def _date_range_q(field, start_date=None, end_date=None) -> Q:
+    q = Q()
+    if start_date:
+        q &= Q(**{f"{field}__date__gte": start_date})
+    if end_date:
+        q &= Q(**{f"{field}__date__lte": end_date})
+    return q
+
+
+def aggregate_counts(queryset, metrics: dict[str, Q]) -> dict[str, int]:
+    """Evaluate several filtered counts over one table in a single query.
+
+    The WHERE clause is the union of the metric filters so rows that no metric
+    counts are never aggregated.
+    """
+    if not metrics:
+        return {}
+    queryset = queryset.filter(reduce(or_, metrics.values()))
+    return queryset.aggregate(
+        **{name: models.Count("pk", filter=condition) for name, condition in metrics.items()}
+    )
+
+
+def _membership_metrics(start_date=None, end_date=None) -> dict[str, Q]:
+    # Count by effective status so results do not depend on when the expiry
+    # sweep last ran.
+    created = _date_range_q("created_at", start_date, end_date)
+    today = timezone.localdate()
+    return {
+        "active_members": created & Q(status=MembershipStatus.ACTIVE, end_date__gte=today),
+        "expired_members": created
+        & (Q(status=MembershipStatus.EXPIRED) | Q(status=MembershipStatus.ACTIVE, end_date__lt=today)),
+    }
+
+
+def _used_reward_metrics(start_date=None, end_date=None) -> dict[str, Q]:
+    redeemed = Q(redeemed_at__isnull=False) & _date_range_q("redeemed_at", start_date, end_date)
+    return {
+        "free_drink_used": redeemed & Q(reward_type=RewardType.FREE_DRINK),
+        "voucher_used": redeemed & Q(reward_type=RewardType.VOUCHER_50K),
+    }
+
+
+def _unused_reward_metrics(start_date=None, end_date=None) -> dict[str, Q]:
+    unused = Q(redeemed_at__isnull=True) & _date_range_q("created_at", start_date, end_date)
+    return {
+        "free_drink_unused": unused & Q(reward_type=RewardType.FREE_DRINK),
+        "voucher_unused": unused & Q(reward_type=RewardType.VOUCHER_50K),
+    }
+
+
+def rollup_rows(start_date=None, end_date=None, using=DEFAULT_DB_ALIAS):
+    rollups = DailyStampRollup.objects.using(using)
+    if start_date:
+        rollups = rollups.filter(day__gte=start_date)
+    if end_date:
+        rollups = rollups.filter(day__lte=end_date)
+    return rollups.order_by("day")
+
+
+def build_summary_data(start_date=None, end_date=None, using=DEFAULT_DB_ALIAS) -> dict:
+    return {
+        **aggregate_counts(Membership.objects.using(using), _membership_metrics(start_date, end_date)),
+        **aggregate_counts(Stamp.objects.using(using), _used_reward_metrics(start_date, end_date)),
+    }
+
+
+def build_rewards_data(start_date=None, end_date=None, using=DEFAULT_DB_ALIAS) -> dict:
+    used = _used_reward_metrics(start_date, end_date)
+    unused = _unused_reward_metrics(start_date, end_date)
+    return aggregate_counts(
+        Stamp.objects.using(using),
+        {
+            "free_drink_used": used["free_drink_used"],
+            "free_drink_unused": unused["free_drink_unused"],
+            "voucher_used": used["voucher_used"],
+            "voucher_unused": unused["voucher_unused"],
+        },
+    )
+
+
+def build_transaction_totals(start_date=None, end_date=None, using=DEFAULT_DB_ALIAS) -> dict:
+    totals = rollup_rows(start_date, end_date, using=using).aggregate(
+        count=models.Sum("stamp_count"),
+        total=models.Sum("total_transaction_amount"),
+    )
+    return {
+        "eligible_stamp_count": totals["count"] or 0,
+        "total_transaction_amount": totals["total"] or 0,
+    }
+
+
+def build_dashboard_data(start_date=None, end_date=None, using=DEFAULT_DB_ALIAS) -> dict:
+    """Summary, rewards and transaction totals in three queries."""
+    members = aggregate_counts(Membership.objects.using(using), _membership_metrics(start_date, end_date))
+    rewards = build_rewards_data(start_date, end_date, using=using)
+    return {
+        "summary": {
+            **members,
+            "free_drink_used": rewards["free_drink_used"],
+            "voucher_used": rewards["voucher_used"],
+        },
+        "rewards": rewards,
+        "transactions": build_transaction_totals(start_date, end_date, using=using),
+    }
@@ -0,0 +1,38 @@
+"""Send report and export reads to the optional ``replica`` database.
+
+The replica is a streaming copy of the primary, so writes, migrations and
+ordinary reads always use ``default``. Report views opt in per request via
+``reporting_database()``, which keeps ranges that include today on the primary
+so figures for the current trading day never lag behind the tills.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+REPLICA_ALIAS = "replica"
+
+
+def replica_configured() -> bool:
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def reporting_database(start_date=None, end_date=None) -> str:
+    """Alias to aggregate a ``from``/``to`` range on; open-ended ranges include today."""
+    if not replica_configured() or end_date is None or end_date >= timezone.localdate():
+        return DEFAULT_DB_ALIAS
+    return REPLICA_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same rows.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
@@ -1,9 +1,10 @@
 from datetime import timedelta
 
 from rest_framework import serializers
+from rest_framework.exceptions import ParseError
 from django.utils import timezone
 
-from .models import Customer, Membership, MembershipCard, ProgramSettings, Stamp, StampCycle
+from .models import AuditLog, Customer, Membership, MembershipCard, ProgramSettings, Stamp, StampCycle
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -25,12 +26,35 @@ class StampSerializer(serializers.ModelSerializer):
         ]
 
 
-class StampCycleSerializer(serializers.ModelSerializer):
-    stamps = StampSerializer(many=True, read_only=True)
+class StampHistorySerializer(StampSerializer):
+    cycle_number = serializers.IntegerField(read_only=True)
+
+    class Meta(StampSerializer.Meta):
+        fields = ["cycle_number", *StampSerializer.Meta.fields, "created_at"]
+
+
+class CycleSummarySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    cycle_number = serializers.IntegerField()
+    is_closed = serializers.BooleanField()
+    stamp_count = serializers.IntegerField(source="stamps_total")
+    free_drink_count = serializers.IntegerField()
+    voucher_count = serializers.IntegerField()
+    redeemed_count = serializers.IntegerField()
+    unredeemed_count = serializers.IntegerField()
+
 
+class StampCycleSummarySerializer(serializers.ModelSerializer):
     class Meta:
         model = StampCycle
-        fields = ["id", "cycle_number", "is_closed", "stamps"]
+        fields = ["id", "cycle_number", "is_closed", "stamp_count"]
+
+
+class StampCycleSerializer(StampCycleSummarySerializer):
+    stamps = StampSerializer(many=True, read_only=True)
+
+    class Meta(StampCycleSummarySerializer.Meta):
+        fields = [*StampCycleSummarySerializer.Meta.fields, "stamps"]
 
 
 class MembershipSerializer(serializers.ModelSerializer):
@@ -38,6 +62,7 @@ class MembershipSerializer(serializers.ModelSerializer):
     customer_id = serializers.PrimaryKeyRelatedField(
         queryset=Customer.objects.all(), source="customer", write_only=True
     )
+    stamp_count = serializers.SerializerMethodField()
     cycles = StampCycleSerializer(many=True, read_only=True)
 
     class Meta:
@@ -50,6 +75,7 @@ class MembershipSerializer(serializers.ModelSerializer):
             "start_date",
             "end_date",
             "status",
+            "stamp_count",
             "cycles",
         ]
         extra_kwargs = {
@@ -58,15 +84,113 @@ class MembershipSerializer(serializers.ModelSerializer):
             "card_number": {"read_only": True},
         }
 
+    def __init__(self, *args, **kwargs):
+        # ``fields``/``expand`` in the context narrow the output; see
+        # shape_membership_payload for the same rules applied to cached data.
+        super().__init__(*args, **kwargs)
+        fields = self.context.get("fields")
+        expand = self.context.get("expand")
+        if expand is not None:
+            if "customer" not in expand:
+                self.fields["customer"] = serializers.PrimaryKeyRelatedField(read_only=True)
+            if "cycles" not in expand:
+                self.fields.pop("cycles")
+            elif "cycles.stamps" not in expand:
+                self.fields["cycles"] = StampCycleSummarySerializer(many=True, read_only=True)
+        if fields is not None:
+            for name in [name for name, field in self.fields.items() if not field.write_only]:
+                if name not in fields:
+                    self.fields.pop(name)
+
+    def get_stamp_count(self, instance) -> int:
+        return instance.active_cycle.stamp_count if instance.active_cycle else 0
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if "status" in data:
+            data["status"] = instance.effective_status
+        return data
+
     def create(self, validated_data):
         if "start_date" not in validated_data:
             validated_data["start_date"] = timezone.localdate()
         if "end_date" not in validated_data:
-            months = ProgramSettings.get_solo().membership_duration_months
+            months = ProgramSettings.get_cached().membership_duration_months
             validated_data["end_date"] = validated_data["start_date"] + timedelta(days=months * 30)
         return super().create(validated_data)
 
 
+MEMBERSHIP_EXPANSIONS = ("customer", "cycles", "cycles.stamps")
+
+
+def parse_sparse_params(params):
+    """``(fields, expand)`` from a query string, each None when not given."""
+    fields = expand = None
+    if "fields" in params:
+        fields = {name for name in params["fields"].split(",") if name}
+        unknown = fields - set(MembershipSerializer.Meta.fields)
+        if unknown:
+            raise ParseError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    if "expand" in params:
+        expand = {name for name in params["expand"].split(",") if name}
+        unknown = expand - set(MEMBERSHIP_EXPANSIONS)
+        if unknown:
+            raise ParseError(f"Unknown expand: {', '.join(sorted(unknown))}")
+        if "cycles.stamps" in expand:
+            expand.add("cycles")
+    return fields, expand
+
+
+def shape_membership_payload(payload: dict, fields=None, expand=None) -> dict:
+    """Narrow a full MembershipSerializer payload like ``fields``/``expand`` would."""
+    data = dict(payload)
+    if expand is not None:
+        if "customer" not in expand and isinstance(data.get("customer"), dict):
+            data["customer"] = data["customer"]["id"]
+        if "cycles" not in expand:
+            data.pop("cycles", None)
+        elif "cycles.stamps" not in expand:
+            data["cycles"] = [
+                {key: value for key, value in cycle.items() if key != "stamps"} for cycle in data["cycles"]
+            ]
+    if fields is not None:
+        data = {key: value for key, value in data.items() if key in fields}
+    return data
+
+
+class MembershipListSerializer(serializers.ModelSerializer):
+    """List rows: no cycles, just the active cycle's stamp count."""
+
+    customer = CustomerSerializer(read_only=True)
+    stamp_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Membership
+        fields = [
+            "id",
+            "customer",
+            "card_number",
+            "start_date",
+            "end_date",
+            "status",
+            "stamp_count",
+        ]
+
+    def get_stamp_count(self, instance) -> int:
+        return instance.active_cycle.stamp_count if instance.active_cycle else 0
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["status"] = instance.effective_status
+        return data
+
+
+class AuditLogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuditLog
+        fields = ["id", "action", "user", "membership", "card", "metadata", "created_at"]
+
+
 class MembershipCardSerializer(serializers.ModelSerializer):
     class Meta:
         model = MembershipCard
@@ -1,8 +1,73 @@
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+import uuid
 
+from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
 
-from .models import Membership, ProgramSettings, RewardType, Stamp, StampCycle
+from .cache import invalidate_membership
+from .identifiers import IdentifierKind, classify_identifier, normalize_card_number
+from .models import (
+    STAMPS_PER_CYCLE,
+    DailyStampRollup,
+    Membership,
+    MembershipCard,
+    ProgramSettings,
+    RewardType,
+    Stamp,
+    StampCycle,
+)
+
+INGEST_BATCH_SIZE = 500
+
+
+class IngestStatus:
+    AWARDED = "awarded"
+    NO_STAMP = "no_stamp"
+    DUPLICATE = "duplicate"
+    NOT_FOUND = "not_found"
+    INVALID = "invalid"
+
+
+STAMP_HISTORY_COLUMNS = (
+    "id",
+    "number",
+    "reward_type",
+    "redeemed_at",
+    "pos_receipt_number",
+    "transaction_amount",
+    "created_at",
+)
+
+
+def stamp_history(membership_id):
+    """A membership's stamps with their cycle number, for keyset paging on (cycle_number, number).
+
+    Pages walk the (membership, cycle_number) key of the cycles and the
+    (cycle, number) key of the stamps; only the serialized columns are loaded.
+    """
+    return (
+        Stamp.objects.filter(cycle__membership_id=membership_id)
+        .annotate(cycle_number=F("cycle__cycle_number"))
+        .only(*STAMP_HISTORY_COLUMNS)
+    )
+
+
+def cycle_summaries(membership_id):
+    """Per-cycle stamp, reward and redemption counts, aggregated in SQL."""
+    is_reward = ~Q(stamps__reward_type=RewardType.NONE)
+    return (
+        StampCycle.objects.filter(membership_id=membership_id)
+        .values("id", "cycle_number", "is_closed")
+        .annotate(
+            stamps_total=Count("stamps"),
+            free_drink_count=Count("stamps", filter=Q(stamps__reward_type=RewardType.FREE_DRINK)),
+            voucher_count=Count("stamps", filter=Q(stamps__reward_type=RewardType.VOUCHER_50K)),
+            redeemed_count=Count("stamps", filter=is_reward & Q(stamps__redeemed_at__isnull=False)),
+            unredeemed_count=Count("stamps", filter=is_reward & Q(stamps__redeemed_at__isnull=True)),
+        )
+    )
 
 
 def get_or_create_active_cycle(membership: Membership) -> StampCycle:
@@ -18,45 +83,334 @@ def get_or_create_active_cycle(membership: Membership) -> StampCycle:
     return active_cycle
 
 
+def _identifier_queries(identifier: str, queryset) -> list:
+    """Querysets to try in order, each served by a single index; the first match wins."""
+    kind, key = classify_identifier(identifier)
+    if kind == IdentifierKind.PUBLIC_ID:
+        return [queryset.filter(card__public_id=key)]
+    if kind == IdentifierKind.CARD_NUMBER:
+        return [queryset.filter(card_number_key=key)]
+    # Phone-shaped input may also be a numeric card number; the card wins.
+    # Two lookups rather than an OR across the customer join, which no index serves.
+    card_key = normalize_card_number(identifier.strip().strip("/"))
+    return [
+        queryset.filter(card_number_key=card_key),
+        queryset.filter(customer__phone_key=key).order_by("-start_date"),
+    ]
+
+
+def find_membership_by_identifier(identifier: str, queryset=None) -> Membership | None:
+    """Resolve a card number, phone or card public_id with indexed lookups.
+
+    Phone-shaped input costs a second query only when no card number matches.
+    """
+    queryset = Membership.objects.all() if queryset is None else queryset
+    for candidates in _identifier_queries(identifier, queryset):
+        membership = candidates.first()
+        if membership is not None:
+            return membership
+    return None
+
+
+async def afind_membership_by_identifier(identifier: str, queryset=None) -> Membership | None:
+    queryset = Membership.objects.all() if queryset is None else queryset
+    for candidates in _identifier_queries(identifier, queryset):
+        membership = await candidates.afirst()
+        if membership is not None:
+            return membership
+    return None
+
+
+def _open_cycle_for_award(membership: Membership) -> StampCycle:
+    """Return the cycle the next stamp goes into, rolling over when needed.
+
+    Uses the denormalized ``active_cycle`` pointer; only memberships that
+    predate the pointer fall back to searching their cycles once.
+    """
+    cycle = membership.active_cycle
+    if cycle is None:
+        cycle = get_or_create_active_cycle(membership)
+    elif cycle.is_closed or cycle.is_full:
+        if not cycle.is_closed:
+            cycle.is_closed = True
+            cycle.save(update_fields=["is_closed"])
+        cycle = StampCycle.objects.create(
+            membership=membership,
+            cycle_number=cycle.cycle_number + 1,
+            is_closed=False,
+        )
+    else:
+        return cycle
+
+    membership.active_cycle = cycle
+    membership.save(update_fields=["active_cycle"])
+    return cycle
+
+
+def reward_for_stamp_number(number: int, settings: ProgramSettings) -> str:
+    if number == 1:
+        return settings.reward_stamp_1_type
+    if number == STAMPS_PER_CYCLE:
+        return settings.reward_stamp_10_type
+    return RewardType.NONE
+
+
 @transaction.atomic
 def award_stamp_for_transaction(
     membership: Membership,
     transaction_amount: Decimal,
     pos_receipt_number: str | None = None,
 ) -> Stamp | None:
-    settings = ProgramSettings.get_solo()
-    membership.refresh_status_by_date()
-
-    if not membership.is_active:
+    settings = ProgramSettings.get_cached()
+    if transaction_amount < Decimal(settings.min_amount_for_stamp):
         return None
 
-    if transaction_amount < Decimal(settings.min_amount_for_stamp):
+    # Lock the membership row so concurrent awards serialize on the counters.
+    locked = (
+        Membership.objects.select_for_update(of=("self",))
+        .select_related("active_cycle")
+        .get(pk=membership.pk)
+    )
+    if not locked.is_active:
         return None
 
-    cycle = get_or_create_active_cycle(membership)
+    cycle = _open_cycle_for_award(locked)
     next_number = cycle.stamp_count + 1
-    if next_number > 10:
-        cycle.is_closed = True
-        cycle.save(update_fields=["is_closed"])
-        cycle = get_or_create_active_cycle(membership)
-        next_number = 1
-
-    reward_type = RewardType.NONE
-    if next_number == 1:
-        reward_type = settings.reward_stamp_1_type
-    elif next_number == 10:
-        reward_type = settings.reward_stamp_10_type
+    membership.active_cycle = cycle
 
+    # Stamp.save() bumps the cycle counter and closes the cycle at the limit.
     stamp = Stamp.objects.create(
         cycle=cycle,
         number=next_number,
-        reward_type=reward_type,
+        reward_type=reward_for_stamp_number(next_number, settings),
         pos_receipt_number=pos_receipt_number,
         transaction_amount=transaction_amount,
     )
+    invalidate_membership(locked.pk)
+    return stamp
 
-    if next_number == 10:
-        cycle.is_closed = True
-        cycle.save(update_fields=["is_closed"])
 
-    return stamp
+def _parse_ingest_row(row: dict) -> tuple[dict | None, str | None]:
+    card_number = (row.get("card_number") or "").strip() or None
+    public_id = row.get("public_id") or None
+    if not (card_number or public_id):
+        return None, "card_number or public_id is required"
+    if public_id is not None:
+        try:
+            public_id = uuid.UUID(str(public_id))
+        except (ValueError, TypeError):
+            return None, "Invalid public_id"
+
+    amount = row.get("transaction_amount")
+    if amount in (None, ""):
+        return None, "transaction_amount required"
+    try:
+        amount = Decimal(str(amount))
+    except (InvalidOperation, ValueError):
+        return None, "Invalid transaction_amount"
+    if not amount.is_finite() or amount < 0:
+        return None, "Invalid transaction_amount"
+    try:
+        # Same max_digits/decimal_places the stamp insert would enforce.
+        Stamp._meta.get_field("transaction_amount").run_validators(amount)
+    except ValidationError:
+        return None, "Invalid transaction_amount"
+
+    receipt = (row.get("pos_receipt_number") or "").strip() or None
+    return {
+        "card_number": card_number,
+        "public_id": public_id,
+        "transaction_amount": amount,
+        "pos_receipt_number": receipt,
+    }, None
+
+
+def _load_cycles_for_ingest(memberships: list[Membership]) -> dict[int, StampCycle]:
+    """Current cycle per membership, with one query for pre-pointer memberships."""
+    current = {m.pk: m.active_cycle for m in memberships if m.active_cycle_id}
+    legacy_ids = [m.pk for m in memberships if not m.active_cycle_id]
+    if legacy_ids:
+        for cycle in StampCycle.objects.filter(membership_id__in=legacy_ids).order_by("cycle_number"):
+            previous = current.get(cycle.membership_id)
+            # Prefer the latest open cycle, otherwise the latest cycle.
+            if previous is None or not cycle.is_closed or previous.is_closed:
+                current[cycle.membership_id] = cycle
+    return current
+
+
+class _ReceiptsTaken(Exception):
+    def __init__(self, receipts):
+        super().__init__(receipts)
+        self.receipts = receipts
+
+
+def _award_ingest_rows(parsed, results, taken_receipts, settings):
+    """Plan and write one attempt of ``ingest_transactions``; fills in ``results``."""
+    min_amount = Decimal(settings.min_amount_for_stamp)
+    # Matched on the same canonical key as interactive lookup.
+    card_keys = {normalize_card_number(data["card_number"]) for data in parsed if data and data["card_number"]}
+    public_ids = {data["public_id"] for data in parsed if data and data["public_id"]}
+    memberships = list(
+        Membership.objects.select_for_update(of=("self",))
+        .select_related("active_cycle", "card")
+        .filter(Q(card_number_key__in=card_keys) | Q(card__public_id__in=public_ids))
+    )
+    by_card_key = {m.card_number_key: m for m in memberships}
+    by_public_id = {m.card.public_id: m for m in memberships if getattr(m, "card", None)}
+
+    receipts = [data["pos_receipt_number"] for data in parsed if data and data["pos_receipt_number"]]
+    # Served by the unique_receipt_number_when_present index in one round trip.
+    taken_receipts = taken_receipts | set(
+        Stamp.objects.filter(pos_receipt_number__in=receipts).values_list("pos_receipt_number", flat=True)
+    )
+
+    cycles = _load_cycles_for_ingest(memberships)
+    new_cycles = []
+    touched_cycles = {}
+    touched_memberships = {}
+    stamps = []
+
+    for result, data in zip(results, parsed):
+        if data is None:
+            continue
+        card_key = normalize_card_number(data["card_number"]) if data["card_number"] else None
+        membership = by_card_key.get(card_key) or by_public_id.get(data["public_id"])
+        if membership is None:
+            result.update(status=IngestStatus.NOT_FOUND, detail="Membership not found")
+            continue
+        receipt = data["pos_receipt_number"]
+        if receipt and receipt in taken_receipts:
+            result.update(status=IngestStatus.DUPLICATE, detail="pos_receipt_number already used")
+            continue
+        if not membership.is_active or data["transaction_amount"] < min_amount:
+            result.update(status=IngestStatus.NO_STAMP, detail="No stamp awarded")
+            continue
+
+        cycle = cycles.get(membership.pk)
+        if cycle is None or cycle.is_closed or cycle.is_full:
+            if cycle is not None and not cycle.is_closed:
+                cycle.is_closed = True
+                touched_cycles[id(cycle)] = cycle
+            cycle = StampCycle(
+                membership=membership,
+                cycle_number=cycle.cycle_number + 1 if cycle else 1,
+                is_closed=False,
+            )
+            new_cycles.append(cycle)
+            cycles[membership.pk] = cycle
+            touched_memberships[membership.pk] = membership
+
+        cycle.stamp_count += 1
+        if cycle.stamp_count >= STAMPS_PER_CYCLE:
+            cycle.is_closed = True
+        if cycle.pk:
+            touched_cycles[id(cycle)] = cycle
+        if receipt:
+            taken_receipts.add(receipt)
+
+        stamp = Stamp(
+            cycle=cycle,
+            number=cycle.stamp_count,
+            reward_type=reward_for_stamp_number(cycle.stamp_count, settings),
+            pos_receipt_number=receipt,
+            transaction_amount=data["transaction_amount"],
+        )
+        stamps.append(stamp)
+        result.update(
+            status=IngestStatus.AWARDED,
+            detail=None,
+            cycle_number=cycle.cycle_number,
+            stamp_number=stamp.number,
+        )
+
+    # New cycles carry their final counters already; existing ones are updated below.
+    StampCycle.objects.bulk_create(new_cycles, batch_size=INGEST_BATCH_SIZE)
+    # A receipt committed by another transaction since the check above is
+    # skipped by the unique constraint instead of failing the batch.
+    Stamp.objects.bulk_create(stamps, batch_size=INGEST_BATCH_SIZE, ignore_conflicts=True)
+    planned = {stamp.pos_receipt_number: (stamp.cycle.pk, stamp.number) for stamp in stamps if stamp.pos_receipt_number}
+    inserted = Stamp.objects.filter(pos_receipt_number__in=planned).values_list(
+        "pos_receipt_number", "cycle_id", "number"
+    )
+    lost = set(planned) - {receipt for receipt, *key in inserted if planned[receipt] == tuple(key)}
+    if lost:
+        raise _ReceiptsTaken(lost)
+
+    StampCycle.objects.bulk_update(
+        touched_cycles.values(),
+        ["stamp_count", "is_closed"],
+        batch_size=INGEST_BATCH_SIZE,
+    )
+    for membership in touched_memberships.values():
+        membership.active_cycle = cycles[membership.pk]
+    Membership.objects.bulk_update(
+        touched_memberships.values(),
+        ["active_cycle"],
+        batch_size=INGEST_BATCH_SIZE,
+    )
+
+    per_day = {}
+    for stamp in stamps:
+        day = timezone.localdate(stamp.created_at)
+        count, amount = per_day.get(day, (0, Decimal(0)))
+        per_day[day] = (count + 1, amount + stamp.transaction_amount)
+    for day, (count, amount) in per_day.items():
+        DailyStampRollup.add(day, count=count, amount=amount)
+
+    invalidate_membership(*{stamp.cycle.membership_id for stamp in stamps})
+    return results
+
+
+@transaction.atomic
+def ingest_transactions(rows: list[dict]) -> list[dict]:
+    """Award stamps for a batch of POS transactions with set-based queries.
+
+    Each row carries ``card_number`` or ``public_id`` plus ``transaction_amount``
+    and an optional ``pos_receipt_number``. Returns one result dict per row, in
+    input order. Cycle rollover follows ``award_stamp_for_transaction`` but is
+    applied in memory, then stamps, cycles and pointers are written in bulk.
+    """
+    settings = ProgramSettings.get_cached()
+
+    results = []
+    parsed = []
+    for index, row in enumerate(rows):
+        data, error = _parse_ingest_row(row)
+        results.append({"row": index, "status": IngestStatus.INVALID if error else None, "detail": error})
+        parsed.append(data)
+
+    taken_receipts = set()
+    while True:
+        try:
+            # Stamp numbers depend on which rows are awarded, so a receipt taken
+            # concurrently rolls the batch back to the savepoint and replans it.
+            with transaction.atomic():
+                return _award_ingest_rows(parsed, [dict(result) for result in results], taken_receipts, settings)
+        except _ReceiptsTaken as conflict:
+            taken_receipts |= conflict.receipts
+
+
+def cards_for_sheets(
+    count: int | None = None,
+    start_id: int | None = None,
+    end_id: int | None = None,
+    limit: int | None = None,
+):
+    """``(public_id, card_number)`` pairs to print.
+
+    With ``count`` new cards are created; otherwise unassigned cards whose id
+    falls in ``start_id..end_id`` are returned in id order, at most ``limit``.
+    """
+    if count:
+        cards = MembershipCard.provision(count)
+        return [(str(card.public_id), card.card_number) for card in cards]
+
+    cards = MembershipCard.objects.filter(is_assigned=False)
+    if start_id is not None:
+        cards = cards.filter(id__gte=start_id)
+    if end_id is not None:
+        cards = cards.filter(id__lte=end_id)
+    rows = cards.order_by("id").values_list("public_id", "card_number")
+    if limit is not None:
+        rows = rows[:limit]
+    return [(str(public_id), card_number) for public_id, card_number in rows]
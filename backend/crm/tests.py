@@ -1,18 +1,54 @@
 from decimal import Decimal
-from datetime import timedelta
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import gzip
+import io
+import json
+import multiprocessing
+import tempfile
+from unittest import mock, skipUnless
+import uuid
+import zipfile
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, transaction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
 from users.models import UserRole
 
-from .models import AuditAction, AuditLog, Customer, Membership, MembershipCard, ProgramSettings, RewardType, Stamp, StampCycle
+from . import async_views, audit, audit_partitions, qr
+from . import cache as membership_cache
+from .exports import export_rows
+from .identifiers import is_valid_card_number, normalize_phone
+from .management.commands import load_test
+from .models import AuditAction, AuditLog, Customer, DailyStampRollup, Membership, MembershipCard, MembershipStatus, ProgramSettings, RewardType, ScanStat, Stamp, StampCycle, ThrottleBucket
+from .reports import build_dashboard_data, build_rewards_data, build_summary_data
+from .routers import ReplicaRouter, reporting_database
 from .serializers import MembershipSerializer
-from .services import award_stamp_for_transaction
+from .throttles import CacheBucketStore, DatabaseBucketStore, FileBucketStore
+from .views import MAX_SHEET_CARDS
+from .services import _identifier_queries, award_stamp_for_transaction, find_membership_by_identifier, ingest_transactions
+
+# Buckets live in the cache, which tests clear, rather than in a file shared by
+# every test and every run. ThrottleTests covers the file store.
+_cache_throttles = override_settings(THROTTLE_STORE="cache")
+
+
+def setUpModule():
+    _cache_throttles.enable()
+
+
+def tearDownModule():
+    _cache_throttles.disable()
 
 
 class AwardStampTests(TestCase):
@@ -59,6 +95,78 @@ class AwardStampTests(TestCase):
         stamp = award_stamp_for_transaction(self.membership, Decimal("60000"))
         self.assertIsNone(stamp)
 
+    def test_award_maintains_cycle_counter_and_pointer(self):
+        for _ in range(3):
+            award_stamp_for_transaction(self.membership, Decimal("60000"))
+        self.membership.refresh_from_db()
+        cycle = self.membership.active_cycle
+        self.assertEqual(cycle.stamp_count, 3)
+        self.assertEqual(cycle.stamp_count, cycle.stamps.count())
+
+    def test_deleting_stamps_decrements_cycle_counter(self):
+        stamps = [award_stamp_for_transaction(self.membership, Decimal("60000")) for _ in range(4)]
+        stamps[-1].delete()
+        Stamp.objects.filter(pk=stamps[-2].pk).delete()
+        cycle = StampCycle.objects.get(pk=stamps[0].cycle_id)
+        self.assertEqual(cycle.stamp_count, 2)
+        self.assertEqual(cycle.stamp_count, cycle.stamps.count())
+
+    def test_reconcile_stamp_counts_repairs_drifted_cycles(self):
+        for _ in range(3):
+            award_stamp_for_transaction(self.membership, Decimal("60000"))
+        cycle = self.membership.cycles.get()
+        StampCycle.objects.filter(pk=cycle.pk).update(stamp_count=9)
+        empty = StampCycle.objects.create(membership=self.membership, cycle_number=2)
+        StampCycle.objects.filter(pk=empty.pk).update(stamp_count=1)
+
+        call_command("reconcile_stamp_counts", stdout=io.StringIO())
+        cycle.refresh_from_db()
+        empty.refresh_from_db()
+        self.assertEqual(cycle.stamp_count, 3)
+        self.assertEqual(empty.stamp_count, 0)
+        self.assertEqual(StampCycle.reconcile_stamp_counts(), 0)
+
+    def test_award_query_budget(self):
+        award_stamp_for_transaction(self.membership, Decimal("60000"))
+        # savepoint, locked membership + cycle, stamp insert, counter update,
+        # savepoint release; settings are cached and the daily rollup waits
+        # for the commit
+        with self.assertNumQueries(5):
+            award_stamp_for_transaction(self.membership, Decimal("60000"))
+
+    def test_award_query_budget_on_rollover(self):
+        for _ in range(10):
+            award_stamp_for_transaction(self.membership, Decimal("60000"))
+        # rollover adds the new cycle insert and the pointer update
+        with self.assertNumQueries(7):
+            stamp = award_stamp_for_transaction(self.membership, Decimal("60000"))
+        self.assertEqual(stamp.cycle.cycle_number, 2)
+        self.assertEqual(stamp.number, 1)
+
+    def test_expire_due_updates_only_lapsed_active_memberships(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        lapsed = Membership.objects.create(
+            customer=self.customer,
+            card_number="CARD-LAPSED",
+            start_date=yesterday - timedelta(days=90),
+            end_date=yesterday,
+        )
+        blocked = Membership.objects.create(
+            customer=self.customer,
+            card_number="CARD-BLOCKED",
+            start_date=yesterday - timedelta(days=90),
+            end_date=yesterday,
+            status=MembershipStatus.BLOCKED,
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(Membership.expire_due(), 1)
+        lapsed.refresh_from_db()
+        blocked.refresh_from_db()
+        self.membership.refresh_from_db()
+        self.assertEqual(lapsed.status, MembershipStatus.EXPIRED)
+        self.assertEqual(blocked.status, MembershipStatus.BLOCKED)
+        self.assertEqual(self.membership.status, MembershipStatus.ACTIVE)
+
     def test_membership_serializer_sets_default_dates(self):
         serializer = MembershipSerializer(
             data={"customer_id": self.customer.id, "card_number": "CARD999"},
@@ -79,6 +187,64 @@ class AwardStampTests(TestCase):
         self.assertTrue(card.card_number.startswith("CARD-"))
 
 
+class ProgramSettingsCacheTests(TestCase):
+    def setUp(self):
+        ProgramSettings.clear_cache()
+        self.addCleanup(ProgramSettings.clear_cache)
+        user_model = get_user_model()
+        self.admin = user_model.objects.create_user(
+            username="admin-settings",
+            password="pass1234",
+            role=UserRole.ADMIN,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_cached_settings_skip_queries(self):
+        ProgramSettings.get_cached()
+        with self.assertNumQueries(0):
+            ProgramSettings.get_cached()
+
+    def test_save_bumps_version_and_invalidates_cache(self):
+        cached = ProgramSettings.get_cached()
+        settings = ProgramSettings.get_solo()
+        settings.min_amount_for_stamp = 70000
+        settings.save()
+        fresh = ProgramSettings.get_cached()
+        self.assertEqual(fresh.version, cached.version + 1)
+        self.assertEqual(fresh.min_amount_for_stamp, 70000)
+
+    def test_concurrent_saves_get_distinct_versions(self):
+        first = ProgramSettings.get_solo()
+        second = ProgramSettings.get_solo()
+        first.min_amount_for_stamp = 70000
+        first.save()
+        second.min_amount_for_stamp = 80000
+        second.save()
+        self.assertEqual(second.version, first.version + 1)
+        self.assertEqual(ProgramSettings.objects.get(id=1).version, second.version)
+
+    def test_stale_cache_revalidates_by_version(self):
+        cached = ProgramSettings.get_cached()
+        ProgramSettings.objects.filter(id=1).update(min_amount_for_stamp=70000, version=cached.version + 1)
+        with self.settings(PROGRAM_SETTINGS_CACHE_SECONDS=0):
+            self.assertEqual(ProgramSettings.get_cached().min_amount_for_stamp, 70000)
+
+    def test_settings_api_exposes_version_etag(self):
+        response = self.client.get(reverse("settings-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertEqual(etag, f'"settings-v{response.data['version']}"')
+
+        response = self.client.get(reverse("settings-list"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.post(reverse("settings-list"), data={"discount_percent": 15}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["discount_percent"], 15)
+
+
 class MembershipCardApiTests(TestCase):
     def setUp(self):
         user_model = get_user_model()
@@ -89,21 +255,131 @@ class MembershipCardApiTests(TestCase):
         )
         self.client = APIClient()
         self.client.force_authenticate(self.user)
+        cache.clear()
+        qr.clear_qr_cache()
 
     def test_create_card_generates_number(self):
         response = self.client.post(reverse("cards-list"), data={}, format="json")
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(response.data["card_number"].startswith("CARD-"))
 
+    def test_generated_card_numbers_are_unique_and_check_digited(self):
+        numbers = [MembershipCard.objects.create().card_number for _ in range(5)]
+        self.assertEqual(len(set(numbers)), 5)
+        self.assertTrue(all(is_valid_card_number(number) for number in numbers))
+        self.assertFalse(is_valid_card_number(numbers[0][:-1] + str((int(numbers[0][-1]) + 1) % 10)))
+
     def test_card_qr_returns_png(self):
         card = MembershipCard.objects.create()
         response = self.client.get(reverse("cards-qr"), data={"public_id": str(card.public_id)})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response["Content-Type"], "image/png")
 
+    def test_card_qr_svg_and_etag(self):
+        card = MembershipCard.objects.create()
+        response = self.client.get(reverse("cards-qr"), data={"public_id": str(card.public_id), "format": "svg"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertIn(b"<svg", response.content)
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.client.get(
+            reverse("cards-qr"),
+            data={"public_id": str(card.public_id), "format": "svg"},
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_card_qr_rejects_unknown_format(self):
+        card = MembershipCard.objects.create()
+        response = self.client.get(reverse("cards-qr"), data={"public_id": str(card.public_id), "format": "gif"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_card_qr_renders_once(self):
+        card = MembershipCard.objects.create()
+        with tempfile.TemporaryDirectory() as directory, self.settings(QR_CACHE_DIR=directory):
+            with mock.patch("crm.qr._render", wraps=qr._render) as render:
+                first = qr.get_qr_image(card.public_id)
+                self.assertEqual(qr.get_qr_image(card.public_id), first)
+                qr.clear_qr_cache()
+                # The disk store survives a cold in-memory cache.
+                self.assertEqual(qr.get_qr_image(card.public_id), first)
+            self.assertEqual(render.call_count, 1)
+
+
+class CardSheetApiTests(TestCase):
+    def setUp(self):
+        user_model = get_user_model()
+        self.admin = user_model.objects.create_user(
+            username="admin-sheets",
+            password="pass1234",
+            role=UserRole.ADMIN,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_sheets_create_cards_and_render_pdf(self):
+        response = self.client.post(reverse("cards-sheets"), data={"count": 3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        self.assertEqual(MembershipCard.objects.filter(is_assigned=False).count(), 3)
+
+    def test_provision_creates_cards_in_bulk(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("cards-provision"), data={"count": 250}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # One reservation plus batched inserts, not a round trip per card.
+        self.assertLess(len(queries), 15)
+        self.assertEqual(response.data["count"], 250)
+        numbers = set(MembershipCard.objects.values_list("card_number", flat=True))
+        self.assertEqual(len(numbers), 250)
+        self.assertIn(response.data["first_card_number"], numbers)
+        self.assertTrue(all(is_valid_card_number(number) for number in numbers))
+
+    def test_provision_rejects_invalid_count(self):
+        response = self.client.post(reverse("cards-provision"), data={"count": 0}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sheets_zip_of_unassigned_range(self):
+        cards = [MembershipCard.objects.create() for _ in range(3)]
+        response = self.client.post(
+            reverse("cards-sheets"),
+            data={"start_id": cards[1].id, "format": "svg"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f"{card.card_number}.svg" for card in cards[1:]),
+        )
+        self.assertIn(cards[1].card_number.encode(), archive.read(f"{cards[1].card_number}.svg"))
+
+    def test_sheets_reject_large_ranges_without_loading_them(self):
+        MembershipCard.provision(MAX_SHEET_CARDS + 5)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("cards-sheets"), data={"format": "svg"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("print_card_sheets", response.data["detail"])
+        self.assertTrue(any(f"LIMIT {MAX_SHEET_CARDS + 1}" in query["sql"] for query in queries.captured_queries))
+
+    @mock.patch("crm.views.write_card_sheets")
+    def test_sheets_render_in_process(self, write_card_sheets):
+        self.client.post(reverse("cards-sheets"), data={"count": 2}, format="json")
+        self.assertEqual(write_card_sheets.call_args.kwargs["workers"], 1)
+
+    def test_sheets_require_admin(self):
+        cashier = get_user_model().objects.create_user(username="cashier-sheets", password="pass1234")
+        self.client.force_authenticate(cashier)
+        response = self.client.post(reverse("cards-sheets"), data={"count": 1}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
 
 class MembershipHistoryApiTests(TestCase):
     def setUp(self):
+        audit.clear()
+        self.addCleanup(audit.clear)
         user_model = get_user_model()
         self.user = user_model.objects.create_user(
             username="cashier-history",
@@ -187,12 +463,14 @@ class MembershipHistoryApiTests(TestCase):
             membership=self.membership,
             is_assigned=True,
         )
-        response = self.client.post(
-            reverse("memberships-replace-card", kwargs={"pk": self.membership.id}),
-            data={},
-            format="json",
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("memberships-replace-card", kwargs={"pk": self.membership.id}),
+                data={},
+                format="json",
+            )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        audit.flush()
         self.assertTrue(
             AuditLog.objects.filter(
                 action=AuditAction.REPLACE_CARD,
@@ -204,6 +482,550 @@ class MembershipHistoryApiTests(TestCase):
         self.assertFalse(card.is_assigned)
 
 
+class ListPaginationApiTests(TestCase):
+    def setUp(self):
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="cashier-lists",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.memberships = []
+        for index in range(5):
+            customer = Customer.objects.create(name=f"List {index}", phone=f"08100000{index:02d}")
+            card = MembershipCard.objects.create(card_number=f"CARD-LIST{index}")
+            self.memberships.append(Membership.create_new(customer=customer, card=card))
+
+    def test_membership_list_is_lean_and_cursor_paged(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("memberships-list"), data={"page_size": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first_page = response.data["results"]
+        self.assertEqual([row["id"] for row in first_page], [m.id for m in reversed(self.memberships)][:3])
+        self.assertNotIn("cycles", first_page[0])
+        self.assertEqual(first_page[0]["stamp_count"], 1)
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual([row["id"] for row in response.data["results"]], [m.id for m in self.memberships[1::-1]])
+        self.assertIsNone(response.data["next"])
+
+    def test_membership_detail_keeps_cycles(self):
+        response = self.client.get(reverse("memberships-detail", kwargs={"pk": self.memberships[0].id}))
+        self.assertEqual(len(response.data["cycles"][0]["stamps"]), 1)
+
+    def test_customer_and_card_lists_are_paged(self):
+        for name in ("customers-list", "cards-list"):
+            response = self.client.get(reverse(name), data={"page_size": 2})
+            self.assertEqual(len(response.data["results"]), 2)
+            self.assertIsNotNone(response.data["next"])
+
+
+class SparseMembershipApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        audit.clear()
+        self.addCleanup(audit.clear)
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="cashier-sparse",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        customer = Customer.objects.create(name="Sparse Tester", phone="0800000011")
+        self.card = MembershipCard.objects.create(card_number="CARD-SPARSE")
+        self.membership = Membership.create_new(customer=customer, card=self.card)
+        award_stamp_for_transaction(self.membership, Decimal("60000"))
+        self.url = reverse("memberships-detail", kwargs={"pk": self.membership.id})
+
+    def test_fields_skip_unrequested_relations(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, data={"fields": "card_number,status,stamp_count"})
+        self.assertEqual(response.data, {"card_number": "CARD-SPARSE", "status": "active", "stamp_count": 2})
+
+    def test_expand_cycles_without_stamps(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, data={"expand": "cycles"})
+        self.assertEqual(response.data["customer"], self.membership.customer_id)
+        self.assertEqual(response.data["cycles"][0]["stamp_count"], 2)
+        self.assertNotIn("stamps", response.data["cycles"][0])
+
+    @override_settings(MEMBERSHIP_CACHE_SECONDS=60)
+    def test_cached_payload_is_shaped_like_serializer_output(self):
+        params = [
+            {"fields": "id,stamp_count"},
+            {"expand": "customer,cycles"},
+            {"expand": "cycles.stamps", "fields": "id,cycles"},
+        ]
+        scan = {"public_id": str(self.card.public_id)}
+        uncached = [self.client.get(reverse("memberships-scan"), data={**scan, **p}).data for p in params]
+        self.client.get(reverse("memberships-scan"), data=scan)
+        for expected, p in zip(uncached, params):
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse("memberships-scan"), data={**scan, **p})
+            self.assertEqual(json.loads(json.dumps(response.data)), json.loads(json.dumps(expected)))
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, data={"fields": "secret"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, data={"expand": "stamps"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StampHistoryApiTests(TestCase):
+    def setUp(self):
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="cashier-stamps",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        customer = Customer.objects.create(name="History Tester", phone="0800000012")
+        card = MembershipCard.objects.create(card_number="CARD-STAMPS")
+        self.membership = Membership.create_new(customer=customer, card=card)
+        for _ in range(22):
+            award_stamp_for_transaction(self.membership, Decimal("60000"))
+        self.url = reverse("memberships-stamps", kwargs={"pk": self.membership.id})
+
+    def test_pages_stamps_newest_first(self):
+        seen = []
+        url = f"{self.url}?page_size=10"
+        while url:
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend((row["cycle_number"], row["number"]) for row in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(len(seen), 23)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(seen[0], (3, 3))
+
+    def test_cycle_summary_counts_rewards_in_sql(self):
+        stamp = (
+            Stamp.objects.filter(cycle__membership=self.membership, cycle__cycle_number=1)
+            .exclude(reward_type=RewardType.NONE)
+            .first()
+        )
+        stamp.mark_redeemed()
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, data={"summary": "cycles"})
+        rows = {row["cycle_number"]: row for row in response.data["results"]}
+        self.assertEqual([row["cycle_number"] for row in response.data["results"]], [3, 2, 1])
+        self.assertEqual(rows[1]["stamp_count"], 10)
+        self.assertEqual(rows[3]["stamp_count"], 3)
+        self.assertEqual(rows[1]["redeemed_count"], 1)
+        self.assertEqual(
+            rows[1]["free_drink_count"] + rows[1]["voucher_count"],
+            rows[1]["redeemed_count"] + rows[1]["unredeemed_count"],
+        )
+
+
+def _drain_bucket(path, attempts, results):
+    store = FileBucketStore(path)
+    results.put(sum(store.consume("shared", 20, 0.0001)[0] for _ in range(attempts)))
+
+
+@override_settings(THROTTLE_DEVICE_IDS=["till-1", "till-2"])
+class ThrottleTests(TestCase):
+    def setUp(self):
+        audit.clear()
+        self.addCleanup(audit.clear)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="cashier-throttle",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        customer = Customer.objects.create(name="Throttle Tester", phone="0800000013")
+        self.card = MembershipCard.objects.create(card_number="CARD-THROTTLE")
+        Membership.create_new(customer=customer, card=self.card)
+
+    def _scan(self, **headers):
+        return self.client.get(reverse("memberships-scan"), data={"public_id": str(self.card.public_id)}, **headers)
+
+    def test_bucket_refills_over_time(self):
+        store = DatabaseBucketStore()
+        self.assertEqual(store.consume("k", 2, 1, now=100), (True, 1))
+        self.assertEqual(store.consume("k", 2, 1, now=100), (True, 0))
+        self.assertEqual(store.consume("k", 2, 1, now=100)[0], False)
+        self.assertEqual(store.consume("k", 2, 1, now=101.5), (True, 0.5))
+        # Refill never exceeds capacity.
+        self.assertEqual(store.consume("k", 2, 1, now=1000), (True, 1))
+        store.refund("k", 2, 1)
+        self.assertEqual(store.consume("k", 2, 1, now=1000), (True, 1))
+
+    def test_cache_bucket_slides_over_the_previous_window(self):
+        store = CacheBucketStore()
+        self.assertEqual(store.consume("k", 2, 1, now=100), (True, 1))
+        self.assertEqual(store.consume("k", 2, 1, now=100), (True, 0))
+        self.assertEqual(store.consume("k", 2, 1, now=100)[0], False)
+        # The full previous window still counts at the start of the next one...
+        self.assertEqual(store.consume("k", 2, 1, now=102)[0], False)
+        # ...and half of it once half the window has passed.
+        self.assertEqual(store.consume("k", 2, 1, now=103), (True, 0))
+
+    def test_cache_bucket_tolerates_expired_window(self):
+        store = CacheBucketStore()
+        store.consume("k", 1, 1, now=100)
+        with mock.patch("crm.throttles.cache.decr", side_effect=ValueError):
+            self.assertEqual(store.consume("k", 1, 1, now=100)[0], False)
+            store.refund("k", 1, 1, now=100)
+
+    def test_file_store_limits_scans(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(THROTTLE_STORE="file", THROTTLE_STORE_PATH=f"{directory}/buckets.sqlite3"):
+                statuses = [self._scan().status_code for _ in range(31)]
+        self.assertEqual(statuses, [status.HTTP_200_OK] * 30 + [status.HTTP_429_TOO_MANY_REQUESTS])
+
+    def test_purge_drops_idle_buckets(self):
+        store = DatabaseBucketStore()
+        store.consume("idle", 2, 1, now=100)
+        store.consume("busy", 2, 1, now=5000)
+        self.assertEqual(store.purge(1000), 1)
+        self.assertEqual(list(ThrottleBucket.objects.values_list("key", flat=True)), ["busy"])
+
+    def test_scan_limit_returns_429_with_retry_after(self):
+        for _ in range(30):
+            self.assertEqual(self._scan().status_code, status.HTTP_200_OK)
+        response = self._scan()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+    def test_device_bucket_is_shared_by_cashiers(self):
+        for _ in range(30):
+            self._scan(HTTP_X_DEVICE_ID="till-1")
+        other = get_user_model().objects.create_user(
+            username="cashier-throttle-2",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client.force_authenticate(other)
+        self.assertEqual(self._scan(HTTP_X_DEVICE_ID="till-1").status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self._scan(HTTP_X_DEVICE_ID="till-2").status_code, status.HTTP_200_OK)
+
+    def test_denied_request_does_not_drain_other_buckets(self):
+        other = get_user_model().objects.create_user(
+            username="cashier-throttle-2",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client.force_authenticate(other)
+        for _ in range(30):
+            self._scan(HTTP_X_DEVICE_ID="till-1")
+        self.client.force_authenticate(self.user)
+        for _ in range(5):
+            self.assertEqual(self._scan(HTTP_X_DEVICE_ID="till-1").status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # The cashier's own bucket is still full.
+        for _ in range(30):
+            self.assertEqual(self._scan(HTTP_X_DEVICE_ID="till-2").status_code, status.HTTP_200_OK)
+
+    def test_unregistered_device_gets_no_bucket(self):
+        for _ in range(30):
+            self._scan(HTTP_X_DEVICE_ID="rogue")
+        other = get_user_model().objects.create_user(
+            username="cashier-throttle-2",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client.force_authenticate(other)
+        self.assertEqual(self._scan(HTTP_X_DEVICE_ID="rogue").status_code, status.HTTP_200_OK)
+
+    def test_file_bucket_holds_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/buckets.sqlite3"
+            FileBucketStore(path).reset()
+            context = multiprocessing.get_context("fork")
+            results = context.Queue()
+            workers = [context.Process(target=_drain_bucket, args=(path, 15, results)) for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            allowed = sum(results.get(timeout=60) for _ in workers)
+            for worker in workers:
+                worker.join(timeout=60)
+        # 60 attempts from 4 processes against a 20-token bucket.
+        self.assertEqual(allowed, 20)
+
+
+class MembershipLookupApiTests(TestCase):
+    def setUp(self):
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="cashier-lookup",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = Customer.objects.create(name="Lookup Tester", phone="0812-3456-789")
+        self.card = MembershipCard.objects.create(card_number="CARD-Look1")
+        self.membership = Membership.create_new(customer=self.customer, card=self.card)
+
+    def _lookup(self, identifier):
+        return self.client.get(reverse("memberships-lookup"), data={"q": identifier})
+
+    def test_lookup_by_card_number_is_case_insensitive(self):
+        response = self._lookup("card-look1/ ")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], self.membership.id)
+
+    def test_lookup_by_phone_in_any_format(self):
+        for identifier in ["081234567 89", "+6281234567 89", "6281234567-89"]:
+            response = self._lookup(identifier)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, identifier)
+            self.assertEqual(response.data["id"], self.membership.id)
+
+    def test_lookup_by_public_id(self):
+        response = self._lookup(str(self.card.public_id))
+        self.assertEqual(response.data["id"], self.membership.id)
+
+    def test_lookup_prefers_numeric_card_number_over_phone(self):
+        other_customer = Customer.objects.create(name="Numeric Card", phone="0899999999")
+        numeric_card = MembershipCard.objects.create(card_number="081234567")
+        numeric_membership = Membership.create_new(customer=other_customer, card=numeric_card)
+        response = self._lookup("081234567")
+        self.assertEqual(response.data["id"], numeric_membership.id)
+
+    def test_lookup_finds_short_stored_phone(self):
+        short_customer = Customer.objects.create(name="Short Phone", phone="5550123")
+        short_card = MembershipCard.objects.create(card_number="CARD-SHORT")
+        short_membership = Membership.create_new(customer=short_customer, card=short_card)
+        for identifier in ["5550123", "555-0123"]:
+            response = self._lookup(identifier)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, identifier)
+            self.assertEqual(response.data["id"], short_membership.id)
+
+    @override_settings(PHONE_COUNTRY_CODE="65")
+    def test_phone_keys_follow_configured_country_code(self):
+        self.assertEqual(normalize_phone("0812 3456"), "+658123456")
+        call_command("refresh_phone_keys", stdout=io.StringIO())
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.phone_key, "+658123456789")
+        self.assertEqual(self._lookup("0812-3456-789").data["id"], self.membership.id)
+
+    def test_lookup_runs_one_query_per_key(self):
+        # Phone-shaped input tries the card key first, then the phone key.
+        for identifier, queries in [("card-look1", 1), (str(self.card.public_id), 1), ("+62812345678 9", 2)]:
+            with self.assertNumQueries(queries):
+                self.assertEqual(find_membership_by_identifier(identifier), self.membership)
+
+    def test_lookup_queries_never_scan_memberships(self):
+        for identifier in ["card-look1", str(self.card.public_id), "0812-3456-789"]:
+            for queryset in _identifier_queries(identifier, Membership.objects.all()):
+                plan = queryset.explain()
+                self.assertNotRegex(plan, r"\bSCAN crm_membership\b|Seq Scan on crm_membership\b", identifier)
+
+    def test_lookup_reports_expiry_without_writing(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        Membership.objects.filter(pk=self.membership.pk).update(end_date=yesterday)
+        response = self._lookup("CARD-LOOK1")
+        self.assertEqual(response.data["status"], "expired")
+        self.membership.refresh_from_db()
+        self.assertEqual(self.membership.status, "active")
+
+    def test_lookup_missing_returns_404(self):
+        response = self._lookup("CARD-NOPE")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(MEMBERSHIP_CACHE_SECONDS=60)
+class MembershipPayloadCacheTests(TestCase):
+    def setUp(self):
+        audit.clear()
+        self.addCleanup(audit.clear)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="cashier-cache",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = Customer.objects.create(name="Cache Tester", phone="0800000004")
+        self.card = MembershipCard.objects.create(card_number="CARD-CACHE")
+        self.membership = Membership.create_new(customer=self.customer, card=self.card)
+
+    def _scan(self, card=None):
+        card = card or self.card
+        return self.client.get(reverse("memberships-scan"), data={"public_id": str(card.public_id)})
+
+    def _stamp_count(self, payload):
+        return sum(len(cycle["stamps"]) for cycle in payload["cycles"])
+
+    def test_invalidation_reaches_other_workers_through_shared_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            shared = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location}}
+            with override_settings(CACHES=shared):
+                # Two workers, each with its own connection to the same cache.
+                reader, writer = caches.create_connection("default"), caches.create_connection("default")
+                with mock.patch.object(membership_cache, "cache", reader):
+                    membership_cache.set_membership_payload(self.membership.pk, {"id": self.membership.pk})
+                    self.assertIsNotNone(membership_cache.get_membership_payload(self.membership.pk))
+                with mock.patch.object(membership_cache, "cache", writer):
+                    award_stamp_for_transaction(self.membership, Decimal("60000"))
+                with mock.patch.object(membership_cache, "cache", reader):
+                    self.assertIsNone(membership_cache.get_membership_payload(self.membership.pk))
+
+    @override_settings(MEMBERSHIP_CACHE_SECONDS=0)
+    def test_payloads_are_not_cached_without_a_shared_cache(self):
+        self._scan()
+        self.assertIsNone(cache.get(membership_cache._payload_key(self.membership.pk)))
+        self.assertIsNone(membership_cache.get_card_entry(self.card.public_id))
+
+    def test_repeat_scan_is_served_without_queries(self):
+        self._scan()
+        with self.assertNumQueries(0):
+            response = self._scan()
+        self.assertEqual(response.data["id"], self.membership.id)
+        audit.flush()
+        self.assertFalse(AuditLog.objects.filter(action=AuditAction.SCAN).exists())
+        self.assertEqual(ScanStat.objects.get(card=self.card, user=self.user).count, 2)
+
+    def test_scan_stats_accumulate_across_flushes(self):
+        self._scan()
+        audit.flush()
+        self._scan()
+        self._scan()
+        audit.flush()
+        stat = ScanStat.objects.get(card=self.card, user=self.user)
+        self.assertEqual(stat.count, 3)
+        self.assertEqual(stat.hour.minute, 0)
+
+    @override_settings(AUDIT_SCAN_MODE="full")
+    def test_full_scan_mode_writes_audit_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._scan()
+        audit.flush()
+        self.assertEqual(AuditLog.objects.filter(action=AuditAction.SCAN, card=self.card).count(), 1)
+        self.assertFalse(ScanStat.objects.exists())
+
+    def test_award_invalidates_cached_scan(self):
+        self.assertEqual(self._stamp_count(self._scan().data), 1)
+        award_stamp_for_transaction(self.membership, Decimal("60000"))
+        self.assertEqual(self._stamp_count(self._scan().data), 2)
+
+    def test_redeem_invalidates_cached_history(self):
+        url = reverse("memberships-history", kwargs={"pk": self.membership.id})
+        self.client.get(url)
+        self.client.post(
+            reverse("memberships-redeem-reward", kwargs={"pk": self.membership.id}),
+            data={"reward_type": RewardType.FREE_DRINK},
+            format="json",
+        )
+        stamp = self.client.get(url).data["cycles"][0]["stamps"][0]
+        self.assertIsNotNone(stamp["redeemed_at"])
+
+    def test_cached_history_still_resolves_membership(self):
+        url = reverse("memberships-history", kwargs={"pk": self.membership.id})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(membership_cache.get_membership_payload(self.membership.id))
+
+        response = self.client.get(url, data={"status": MembershipStatus.BLOCKED})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        Membership.objects.filter(pk=self.membership.id).delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_replace_card_invalidates_old_card(self):
+        self._scan()
+        response = self.client.post(
+            reverse("memberships-replace-card", kwargs={"pk": self.membership.id}),
+            data={},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._scan().status_code, status.HTTP_404_NOT_FOUND)
+        lookup = self.client.get(reverse("memberships-lookup"), data={"q": response.data["card_number"]})
+        self.assertEqual(lookup.data["card_number"], response.data["card_number"])
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        audit.clear()
+        self.addCleanup(audit.clear)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="cashier-async",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.factory = AsyncRequestFactory()
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        customer = Customer.objects.create(name="Async Tester", phone="0800000021")
+        self.card = MembershipCard.objects.create(card_number="CARD-ASYNC")
+        self.membership = Membership.create_new(customer=customer, card=self.card)
+
+    async def _call(self, view, path, **params):
+        return await view(self.factory.get(path, params, headers=self.headers))
+
+    async def test_scan_matches_sync_view(self):
+        public_id = str(self.card.public_id)
+        response = await self._call(async_views.scan, "/api/memberships/scan/", public_id=public_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Second scan is served from the cache the first one filled.
+        cached = await self._call(async_views.scan, "/api/memberships/scan/", public_id=public_id)
+        expected = await sync_to_async(self.client.get)(reverse("memberships-scan"), data={"public_id": public_id})
+        self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(json.loads(cached.content), expected.json())
+
+    async def test_scan_errors_match_sync_view(self):
+        response = await self._call(async_views.scan, "/api/memberships/scan/", public_id="nope")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content), {"detail": "Invalid public_id"})
+        response = await self._call(async_views.scan, "/api/memberships/scan/", public_id=str(uuid.uuid4()))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await async_views.scan(self.factory.get("/api/memberships/scan/"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("WWW-Authenticate", response)
+
+    async def test_scan_is_throttled(self):
+        public_id = str(self.card.public_id)
+        for _ in range(30):
+            await self._call(async_views.scan, "/api/memberships/scan/", public_id=public_id)
+        response = await self._call(async_views.scan, "/api/memberships/scan/", public_id=public_id)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+    async def test_lookup_supports_sparse_fields(self):
+        response = await self._call(async_views.lookup, "/api/memberships/lookup/", q="card-async", fields="id,status")
+        self.assertEqual(json.loads(response.content), {"id": self.membership.id, "status": "active"})
+        response = await self._call(async_views.lookup, "/api/memberships/lookup/", q="card-async", fields="nope")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sparse_lookup_loads_only_requested_relations(self):
+        lookup = async_to_sync(self._call)
+        with CaptureQueriesContext(connection) as queries:
+            response = lookup(async_views.lookup, "/api/memberships/lookup/", q="card-async", fields="id,status")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query["sql"] for query in queries.captured_queries if 'FROM "crm_stamp"' in query["sql"]])
+
+    async def test_non_get_is_rejected_after_authentication(self):
+        response = await async_views.lookup(self.factory.post("/api/memberships/lookup/", headers=self.headers))
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        response = await async_views.lookup(self.factory.post("/api/memberships/lookup/"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_history_summary_matches_sync_view(self):
+        params = {"card_number": "CARD-ASYNC"}
+        response = await self._call(async_views.history_summary, "/api/memberships/history-summary/", **params)
+        expected = await sync_to_async(self.client.get)(reverse("memberships-history-summary-lookup"), data=params)
+        self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(json.loads(response.content)["stamp_count"], 1)
+
+
 class SummaryReportApiTests(TestCase):
     def setUp(self):
         user_model = get_user_model()
@@ -230,6 +1052,58 @@ class SummaryReportApiTests(TestCase):
         self.assertEqual(response["Content-Type"], "text/csv")
 
 
+class DashboardReportApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="admin-dashboard",
+            password="pass1234",
+            role=UserRole.ADMIN,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        customer = Customer.objects.create(name="Dashboard Tester", phone="0800000005")
+        card = MembershipCard.objects.create(card_number="CARD-DASH")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.membership = Membership.create_new(customer=customer, card=card)
+            award_stamp_for_transaction(self.membership, Decimal("60000"), "POS-DASH")
+        Stamp.objects.get(number=1).mark_redeemed()
+
+    def test_dashboard_combines_reports(self):
+        response = self.client.get(reverse("reports-dashboard"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["summary"],
+            {"active_members": 1, "expired_members": 0, "free_drink_used": 1, "voucher_used": 0},
+        )
+        self.assertEqual(
+            response.data["rewards"],
+            {"free_drink_used": 1, "free_drink_unused": 0, "voucher_used": 0, "voucher_unused": 0},
+        )
+        self.assertEqual(response.data["transactions"]["eligible_stamp_count"], 2)
+
+    def test_summary_counts_lapsed_members_as_expired(self):
+        Membership.objects.filter(pk=self.membership.pk).update(end_date=timezone.localdate() - timedelta(days=1))
+        data = build_summary_data()
+        self.assertEqual((data["active_members"], data["expired_members"]), (0, 1))
+
+    def test_report_query_counts(self):
+        with self.assertNumQueries(2):
+            build_summary_data()
+        with self.assertNumQueries(1):
+            build_rewards_data()
+        with self.assertNumQueries(3):
+            build_dashboard_data()
+
+    def test_dashboard_respects_date_range(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        response = self.client.get(reverse("reports-dashboard"), data={"from": tomorrow.isoformat()})
+        self.assertEqual(response.data["summary"]["active_members"], 0)
+        self.assertEqual(response.data["rewards"]["free_drink_used"], 0)
+        self.assertEqual(response.data["transactions"]["eligible_stamp_count"], 0)
+
+
 class RewardReportApiTests(TestCase):
     def setUp(self):
         user_model = get_user_model()
@@ -266,6 +1140,8 @@ class TransactionReportApiTests(TestCase):
         )
         self.client = APIClient()
         self.client.force_authenticate(self.user)
+        # Report throttling history lives in the cache.
+        cache.clear()
 
     def test_transaction_report_returns_counts(self):
         response = self.client.get(reverse("reports-transactions"))
@@ -282,14 +1158,118 @@ class TransactionReportApiTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsInstance(response.data, list)
 
+    def _stamp(self, amount, receipt):
+        customer = Customer.objects.create(name=f"Report {receipt}", phone=f"0811{receipt[-4:]}0000")
+        card = MembershipCard.objects.create(card_number=f"CARD-{receipt}")
+        membership = Membership.create_new(customer=customer, card=card)
+        return award_stamp_for_transaction(membership, Decimal(amount), receipt)
+
+    def test_transaction_reports_read_daily_rollup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._stamp("60000", "R-0001")
+            self._stamp("75000", "R-0002")
+        today = timezone.localdate()
+        rollup = DailyStampRollup.objects.get(day=today)
+        # Each activation issues a welcome stamp without an amount.
+        self.assertEqual(rollup.stamp_count, 4)
+        self.assertEqual(rollup.total_transaction_amount, Decimal("135000"))
+
+        response = self.client.get(reverse("reports-transactions"))
+        self.assertEqual(response.data["eligible_stamp_count"], 4)
+        self.assertEqual(response.data["total_transaction_amount"], Decimal("135000"))
+
+        response = self.client.get(reverse("reports-transactions-daily"), data={"from": today.isoformat()})
+        self.assertEqual(response.data[0]["date"], today.isoformat())
+
+        response = self.client.get(reverse("reports-transactions-period"), data={"period": "month"})
+        self.assertEqual(response.data[0]["eligible_stamp_count"], 4)
+        self.assertTrue(response.data[0]["period"].startswith(today.replace(day=1).isoformat()))
+
+    def test_rollup_is_applied_after_commit_and_undone_on_delete(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            stamp = self._stamp("60000", "R-0004")
+        self.assertFalse(DailyStampRollup.objects.exists())
+        for callback in callbacks:
+            callback()
+        rollup = DailyStampRollup.objects.get()
+        self.assertEqual((rollup.stamp_count, rollup.total_transaction_amount), (2, Decimal("60000")))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stamp.delete()
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.stamp_count, rollup.total_transaction_amount), (1, Decimal("0")))
+
+    def test_rollup_rebuild_matches_stamps(self):
+        self._stamp("60000", "R-0003")
+        DailyStampRollup.objects.all().delete()
+        self.assertEqual(DailyStampRollup.rebuild(), 1)
+        rollup = DailyStampRollup.objects.get()
+        self.assertEqual(rollup.stamp_count, Stamp.objects.count())
+        self.assertEqual(rollup.total_transaction_amount, Decimal("60000"))
+
     def test_transaction_csv_report_returns_csv(self):
         response = self.client.get(reverse("reports-transactions-csv"))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response["Content-Type"], "text/csv")
 
 
+class ReportReplicaRoutingTests(TestCase):
+    def setUp(self):
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="cashier-replica-report",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.today = timezone.localdate()
+
+    def test_without_replica_everything_uses_primary(self):
+        self.assertEqual(reporting_database(date(2020, 1, 1), date(2020, 1, 31)), "default")
+
+    def test_ranges_that_include_today_stay_on_primary(self):
+        with mock.patch("crm.routers.replica_configured", return_value=True):
+            self.assertEqual(reporting_database(), "default")
+            self.assertEqual(reporting_database(date(2020, 1, 1), None), "default")
+            self.assertEqual(reporting_database(None, self.today), "default")
+            self.assertEqual(reporting_database(None, self.today - timedelta(days=1)), "replica")
+
+    def test_report_views_read_closed_ranges_from_replica(self):
+        yesterday = (self.today - timedelta(days=1)).isoformat()
+        with mock.patch("crm.routers.replica_configured", return_value=True), mock.patch(
+            "crm.views.build_summary_data", return_value={}
+        ) as build:
+            self.client.get(reverse("reports-summary"), data={"to": yesterday})
+            self.client.get(reverse("reports-summary"))
+        self.assertEqual([call.kwargs["using"] for call in build.call_args_list], ["replica", "default"])
+
+    def test_router_keeps_writes_and_migrations_on_primary(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_write(Stamp), "default")
+        self.assertEqual(router.db_for_read(Stamp), "default")
+        self.assertFalse(router.allow_migrate("replica", "crm"))
+        self.assertTrue(router.allow_migrate("default", "crm"))
+
+
+class LoadTestCommandTests(TestCase):
+    def test_rejects_unknown_workflow_before_touching_the_database(self):
+        with self.assertRaisesMessage(CommandError, "Unknown workflow 'checkout'"):
+            call_command("load_test", mix="scan=1,checkout=2")
+        with self.assertRaisesMessage(CommandError, "at least one positive weight"):
+            call_command("load_test", mix="scan=0")
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(load_test._percentile(values, 50), 50)
+        self.assertEqual(load_test._percentile(values, 99), 99)
+        self.assertEqual(load_test._percentile([7], 95), 7)
+
+
 class AuditLogApiTests(TestCase):
     def setUp(self):
+        audit.clear()
+        self.addCleanup(audit.clear)
         user_model = get_user_model()
         self.user = user_model.objects.create_user(
             username="cashier-audit",
@@ -309,16 +1289,18 @@ class AuditLogApiTests(TestCase):
 
     def test_activate_card_creates_audit_log(self):
         card = MembershipCard.objects.create(card_number="CARD-ACT")
-        response = self.client.post(
-            reverse("memberships-activate-card"),
-            data={
-                "card_number": card.card_number,
-                "name": "Audit Tester",
-                "phone": "0800000002",
-            },
-            format="json",
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("memberships-activate-card"),
+                data={
+                    "card_number": card.card_number,
+                    "name": "Audit Tester",
+                    "phone": "0800000002",
+                },
+                format="json",
+            )
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        audit.flush()
         self.assertTrue(
             AuditLog.objects.filter(
                 action=AuditAction.ACTIVATE_CARD,
@@ -352,3 +1334,399 @@ class AuditLogApiTests(TestCase):
                 metadata__stamp_id=stamp.id,
             ).exists()
         )
+
+    def test_buffered_entries_wait_for_commit_and_batch(self):
+        with override_settings(AUDIT_BUFFER_SIZE=3, AUDIT_FLUSH_SECONDS=60):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                audit.record(AuditAction.SCAN, membership_id=self.membership.id)
+            # Not committed yet, so nothing is buffered.
+            self.assertEqual(len(audit.audit_buffer), 0)
+            for callback in callbacks:
+                callback()
+            self.assertEqual(len(audit.audit_buffer), 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                audit.record(AuditAction.SCAN, membership_id=self.membership.id)
+            self.assertEqual(AuditLog.objects.count(), 0)
+            with self.captureOnCommitCallbacks(execute=True):
+                audit.record(AuditAction.SCAN, membership_id=self.membership.id)
+
+        self.assertEqual(len(audit.audit_buffer), 0)
+        self.assertEqual(AuditLog.objects.filter(action=AuditAction.SCAN).count(), 3)
+
+    def test_rolled_back_action_is_not_logged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    audit.record(AuditAction.SCAN, membership_id=self.membership.id)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(len(audit.audit_buffer), 0)
+        audit.flush()
+        self.assertFalse(AuditLog.objects.exists())
+
+
+class AuditFlushFailureTests(TransactionTestCase):
+    # Foreign keys are only checked on commit, so these tests really commit.
+
+    def setUp(self):
+        audit.clear()
+        self.addCleanup(audit.clear)
+        self.card = MembershipCard.objects.create(card_number="CARD-AUDIT-GONE")
+        self.kept = MembershipCard.objects.create(card_number="CARD-AUDIT-KEPT")
+
+    def test_entry_for_deleted_card_is_dropped_not_requeued(self):
+        audit.audit_buffer.add(AuditLog(action=AuditAction.SCAN, card_id=self.card.id, created_at=timezone.now()))
+        audit.audit_buffer.add(AuditLog(action=AuditAction.SCAN, card_id=self.kept.id, created_at=timezone.now()))
+        MembershipCard.objects.filter(pk=self.card.pk).delete()
+        with self.assertLogs("crm.audit", level="ERROR"):
+            self.assertEqual(audit.audit_buffer.flush(), 1)
+        self.assertEqual(len(audit.audit_buffer), 0)
+        self.assertEqual(list(AuditLog.objects.values_list("card_id", flat=True)), [self.kept.id])
+
+    def test_scan_counts_for_deleted_card_are_dropped_not_requeued(self):
+        user = get_user_model().objects.create_user(username="cashier-audit-gone", password="pass1234")
+        audit.scan_counter.add(self.card.id, user.pk)
+        audit.scan_counter.add(self.kept.id, user.pk)
+        audit.scan_counter.add(self.kept.id, user.pk)
+        MembershipCard.objects.filter(pk=self.card.pk).delete()
+        with self.assertLogs("crm.audit", level="ERROR"):
+            self.assertEqual(audit.scan_counter.flush(), 2)
+        self.assertEqual(len(audit.scan_counter), 0)
+        self.assertEqual(list(ScanStat.objects.values_list("card_id", "count")), [(self.kept.id, 2)])
+
+    def test_transient_errors_are_retried(self):
+        audit.audit_buffer.add(AuditLog(action=AuditAction.SCAN, card_id=self.kept.id, created_at=timezone.now()))
+        with mock.patch.object(AuditLog.objects, "bulk_create", side_effect=OperationalError("connection lost")):
+            with self.assertLogs("crm.audit", level="ERROR"):
+                self.assertEqual(audit.audit_buffer.flush(), 0)
+        self.assertEqual(len(audit.audit_buffer), 1)
+        self.assertEqual(audit.audit_buffer.flush(), 1)
+
+
+class AuditLogQueryApiTests(TestCase):
+    def setUp(self):
+        user_model = get_user_model()
+        self.admin = user_model.objects.create_user(
+            username="admin-audit-query",
+            password="pass1234",
+            role=UserRole.ADMIN,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        customer = Customer.objects.create(name="Query Tester", phone="0800000009")
+        today = timezone.localdate()
+        self.membership = Membership.objects.create(
+            customer=customer,
+            card_number="CARD-QUERY",
+            start_date=today,
+            end_date=today + timedelta(days=90),
+        )
+        now = timezone.now()
+        self.logs = [
+            AuditLog.objects.create(
+                action=AuditAction.SCAN,
+                membership=self.membership if index % 2 else None,
+                metadata={"stamp_id": index},
+                created_at=now - timedelta(minutes=index // 2),
+            )
+            for index in range(5)
+        ]
+
+    def test_pages_newest_first_without_gaps(self):
+        seen = []
+        url = reverse("audit-logs-list") + "?page_size=2"
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen.extend(row["id"] for row in response.data["results"])
+            url = response.data["next"]
+        expected = sorted(self.logs, key=lambda log: (log.created_at, log.id), reverse=True)
+        self.assertEqual(seen, [log.id for log in expected])
+
+    def test_filters_by_membership_and_metadata(self):
+        response = self.client.get(reverse("audit-logs-list"), data={"membership": self.membership.id})
+        self.assertEqual(len(response.data["results"]), 2)
+
+        response = self.client.get(reverse("audit-logs-list"), data={"metadata": json.dumps({"stamp_id": 3})})
+        self.assertEqual([row["id"] for row in response.data["results"]], [self.logs[3].id])
+
+    def test_rejects_bad_parameters(self):
+        url = reverse("audit-logs-list")
+        self.assertEqual(self.client.get(url, data={"cursor": "nope"}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(url, data={"user": "x"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, data={"metadata": "[1]"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AuditPartitionTests(TestCase):
+    def test_month_arithmetic_and_names(self):
+        month = audit_partitions.month_start(date(2025, 11, 17))
+        self.assertEqual(month, date(2025, 11, 1))
+        self.assertEqual(audit_partitions.add_months(month, 2), date(2026, 1, 1))
+        self.assertEqual(audit_partitions.add_months(month, -11), date(2024, 12, 1))
+        name = audit_partitions.partition_name(month)
+        self.assertEqual(name, "crm_auditlog_202511")
+        self.assertEqual(audit_partitions.partition_month(name), month)
+        self.assertIsNone(audit_partitions.partition_month(audit_partitions.DEFAULT_PARTITION))
+
+    def test_jsonl_archive_is_gzipped_json_lines(self):
+        AuditLog.objects.create(action=AuditAction.SCAN, metadata={"public_id": "abc"})
+        rows = AuditLog.objects.values_list(*audit_partitions.ARCHIVE_COLUMNS)
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/archive.jsonl.gz"
+            self.assertEqual(audit_partitions.write_jsonl_archive(rows, path), 1)
+            with gzip.open(path, "rt") as archive:
+                record = json.loads(archive.readline())
+        self.assertEqual(record["action"], AuditAction.SCAN)
+        self.assertEqual(record["metadata"], {"public_id": "abc"})
+
+    def test_archive_command_requires_postgresql(self):
+        with self.assertRaises(CommandError):
+            call_command("archive_audit_logs", "--output-dir", tempfile.gettempdir(), "--dry-run")
+
+    def _archive(self, attached=(), detached=(), **overrides):
+        patches = {
+            "connection": mock.Mock(vendor="postgresql"),
+            "ensure_audit_partitions": mock.Mock(return_value=[]),
+            "audit_partitions": mock.Mock(return_value=[(name, date(2020, 1, 1)) for name in attached]),
+            "detached_audit_partitions": mock.Mock(return_value=[(name, date(2020, 2, 1)) for name in detached]),
+            "archive_partition": mock.Mock(return_value=("archive.jsonl.gz", 0)),
+            "detach_partition": mock.Mock(),
+            "drop_partition": mock.Mock(),
+            **overrides,
+        }
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            mock.patch.multiple("crm.management.commands.archive_audit_logs", **patches),
+        ):
+            call_command("archive_audit_logs", "--output-dir", directory, stdout=io.StringIO())
+        return patches
+
+    def test_archive_failure_leaves_partition_attached(self):
+        failing = mock.Mock(side_effect=OSError("disk full"))
+        detach = mock.Mock()
+        with self.assertRaises(OSError):
+            self._archive(attached=["crm_auditlog_202001"], archive_partition=failing, detach_partition=detach)
+        failing.assert_called_once()
+        detach.assert_not_called()
+
+    def test_archive_picks_up_stranded_detached_partitions(self):
+        patches = self._archive(attached=["crm_auditlog_202001"], detached=["crm_auditlog_202002"])
+        archived = [call.args[0] for call in patches["archive_partition"].call_args_list]
+        self.assertEqual(archived, ["crm_auditlog_202001", "crm_auditlog_202002"])
+        patches["detach_partition"].assert_called_once_with("crm_auditlog_202001")
+        self.assertEqual(patches["drop_partition"].call_count, 2)
+
+
+DEFAULT_PARTITION = audit_partitions.DEFAULT_PARTITION
+
+
+@skipUnless(connection.vendor == "postgresql", "audit log partitions need PostgreSQL")
+class AuditPartitionPostgresTests(TestCase):
+    def _rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def _remove_partition(self, month):
+        name = audit_partitions.partition_name(month)
+        audit_partitions.detach_partition(name)
+        audit_partitions.drop_partition(name)
+        return name
+
+    def test_rows_in_default_partition_move_to_new_month(self):
+        current = audit_partitions.month_start(timezone.now().date())
+        # The job missed its runs: this month and the next have no partition.
+        current_name = self._remove_partition(current)
+        next_month = audit_partitions.add_months(current, 1)
+        next_name = self._remove_partition(next_month)
+        now_entry = AuditLog.objects.create(action=AuditAction.SCAN)
+        later_entry = AuditLog.objects.create(action=AuditAction.SCAN)
+        AuditLog.objects.filter(pk=later_entry.pk).update(
+            created_at=datetime(next_month.year, next_month.month, 2, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(self._rows(DEFAULT_PARTITION), 2)
+
+        created = audit_partitions.ensure_audit_partitions(months_ahead=0)
+
+        self.assertEqual(created, [current_name, next_name])
+        self.assertEqual(self._rows(DEFAULT_PARTITION), 0)
+        self.assertEqual(self._rows(current_name), 1)
+        self.assertEqual(self._rows(next_name), 1)
+        self.assertEqual(AuditLog.objects.count(), 2)
+        self.assertTrue(AuditLog.objects.filter(pk=now_entry.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relispartition FROM pg_class WHERE relname = %s", [DEFAULT_PARTITION])
+            self.assertTrue(cursor.fetchone()[0])
+
+
+class TransactionIngestApiTests(TestCase):
+    def setUp(self):
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="cashier-ingest",
+            password="pass1234",
+            role=UserRole.CASHIER,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.customer = Customer.objects.create(name="Ingest Tester", phone="0800000003")
+        self.card = MembershipCard.objects.create(card_number="CARD-INGEST")
+        self.membership = Membership.create_new(customer=self.customer, card=self.card)
+
+    def test_ingest_awards_stamps_with_rollover(self):
+        rows = [
+            {"card_number": "CARD-INGEST", "transaction_amount": "60000", "pos_receipt_number": f"POS-{i}"}
+            for i in range(10)
+        ]
+        rows.append({"public_id": str(self.card.public_id), "transaction_amount": "60000"})
+        response = self.client.post(reverse("transactions-ingest"), data={"transactions": rows}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["counts"], {"awarded": 11})
+
+        # create_new already issued stamp 1, so the ninth row closes cycle 1.
+        results = response.data["results"]
+        self.assertEqual(results[8]["stamp_number"], 10)
+        self.assertEqual(results[9]["cycle_number"], 2)
+        self.assertEqual(results[10]["stamp_number"], 2)
+
+        first, second = self.membership.cycles.order_by("cycle_number")
+        self.assertTrue(first.is_closed)
+        self.assertEqual(first.stamp_count, first.stamps.count())
+        self.assertEqual(second.stamp_count, 2)
+        self.membership.refresh_from_db()
+        self.assertEqual(self.membership.active_cycle, second)
+        stamp_ten = first.stamps.get(number=10)
+        self.assertEqual(stamp_ten.reward_type, ProgramSettings.get_solo().reward_stamp_10_type)
+
+    def test_ingest_reports_rows_individually(self):
+        award_stamp_for_transaction(self.membership, Decimal("60000"), "POS-USED")
+        rows = [
+            {"card_number": "CARD-INGEST", "transaction_amount": "60000", "pos_receipt_number": "POS-USED"},
+            {"card_number": "CARD-INGEST", "transaction_amount": "60000", "pos_receipt_number": "POS-NEW"},
+            {"card_number": "CARD-INGEST", "transaction_amount": "60000", "pos_receipt_number": "POS-NEW"},
+            {"card_number": "CARD-MISSING", "transaction_amount": "60000"},
+            {"card_number": "CARD-INGEST", "transaction_amount": "abc"},
+            {"card_number": "CARD-INGEST", "transaction_amount": "1000"},
+        ]
+        response = self.client.post(reverse("transactions-ingest"), data={"transactions": rows}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["duplicate", "awarded", "duplicate", "not_found", "invalid", "no_stamp"],
+        )
+
+    def test_ingest_rejects_unstorable_amounts_per_row(self):
+        amounts = ["NaN", "Infinity", "-sNaN", "-60000", "60000.001", "12345678901.00", "60000"]
+        rows = [{"card_number": "CARD-INGEST", "transaction_amount": amount} for amount in amounts]
+        response = self.client.post(reverse("transactions-ingest"), data={"transactions": rows}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["invalid"] * 6 + ["awarded"],
+        )
+
+    def test_ingest_matches_card_numbers_like_lookup(self):
+        rows = [{"card_number": " card-ingest ", "transaction_amount": "60000"}]
+        response = self.client.post(reverse("transactions-ingest"), data={"transactions": rows}, format="json")
+        self.assertEqual(response.data["results"][0]["status"], "awarded")
+
+    def test_ingest_query_count_does_not_grow_with_rows(self):
+        rows = [
+            {"card_number": "CARD-INGEST", "transaction_amount": "60000", "pos_receipt_number": f"POS-{i}"}
+            for i in range(30)
+        ]
+        ingest_transactions([])
+        # two savepoints, memberships, receipts, cycle insert, stamp insert,
+        # inserted receipts, cycle counters, membership pointers, two
+        # releases; the daily rollup is applied after commit
+        with self.assertNumQueries(11):
+            ingest_transactions(rows)
+
+    def test_ingest_reports_receipts_taken_concurrently_as_duplicates(self):
+        other = Membership.create_new(
+            customer=Customer.objects.create(name="Ingest Racer", phone="0800000033"),
+            card=MembershipCard.objects.create(card_number="CARD-INGEST-RACE"),
+        )
+        bulk_create = Stamp.objects.bulk_create
+
+        def race(stamps, **kwargs):
+            # Another till commits POS-RACE after the receipt check.
+            if not Stamp.objects.filter(pos_receipt_number="POS-RACE").exists():
+                award_stamp_for_transaction(other, Decimal("60000"), "POS-RACE")
+            return bulk_create(stamps, **kwargs)
+
+        rows = [
+            {"card_number": "CARD-INGEST", "transaction_amount": "60000", "pos_receipt_number": "POS-RACE"},
+            {"card_number": "CARD-INGEST", "transaction_amount": "60000", "pos_receipt_number": "POS-AFTER"},
+        ]
+        with mock.patch.object(Stamp.objects, "bulk_create", side_effect=race):
+            results = ingest_transactions(rows)
+        self.assertEqual([result["status"] for result in results], ["duplicate", "awarded"])
+        # The welcome stamp is 1, so the surviving row takes number 2 with no gap.
+        self.assertEqual(results[1]["stamp_number"], 2)
+        numbers = Stamp.objects.filter(cycle__membership=self.membership).order_by("number")
+        self.assertEqual(list(numbers.values_list("number", flat=True)), [1, 2])
+
+    def test_ingest_rejects_empty_payload(self):
+        response = self.client.post(reverse("transactions-ingest"), data={"transactions": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExportApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_model = get_user_model()
+        self.user = user_model.objects.create_user(
+            username="admin-export",
+            password="pass1234",
+            role=UserRole.ADMIN,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        customer = Customer.objects.create(name="Export Tester", phone="0800000006")
+        card = MembershipCard.objects.create(card_number="CARD-EXPORT")
+        self.membership = Membership.create_new(customer=customer, card=card)
+        award_stamp_for_transaction(self.membership, Decimal("60000"), "POS-EXPORT")
+
+    def _export(self, dataset, extension, **params):
+        return self.client.get(reverse("exports", kwargs={"dataset": dataset, "extension": extension}), data=params)
+
+    def test_stamp_csv_export_streams_rows(self):
+        response = self._export("stamps", "csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith("id,membership_id,card_number"))
+        self.assertEqual(len(lines), 3)
+        self.assertIn("POS-EXPORT", lines[2])
+
+    def test_ndjson_export_emits_one_object_per_line(self):
+        response = self._export("memberships", "ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["card_number"] for row in rows], ["CARD-EXPORT"])
+
+    def test_export_date_filter(self):
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        response = self._export("customers", "csv", **{"from": tomorrow})
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 1)
+        response = self._export("customers", "csv", **{"from": "bad"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_date_range_compares_the_bare_column(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        # The welcome stamp and POS-EXPORT.
+        for start, end, expected in [(today, today, 2), (yesterday, yesterday, 0)]:
+            with CaptureQueriesContext(connection) as queries:
+                rows = list(export_rows("stamps", start_date=start, end_date=end)[1])
+            self.assertEqual(len(rows), expected)
+            # No cast to date, which would hide created_at from its index.
+            self.assertNotRegex(queries.captured_queries[-1]["sql"], r"cast_date|::date")
+
+    def test_unknown_export_returns_404(self):
+        self.assertEqual(self._export("payroll", "csv").status_code, status.HTTP_404_NOT_FOUND)
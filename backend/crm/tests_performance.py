@@ -0,0 +1,188 @@
+"""Query budgets for the API endpoints.
+
+Every request runs against a membership with many closed cycles and stamps,
+so a query per cycle, stamp or row shows up as a budget overrun rather than as
+a slow till in production. Budgets are upper bounds: lower one when an
+endpoint gets cheaper, and explain any increase in review.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from users.models import UserRole
+
+from . import audit
+from .models import Customer, Membership, MembershipCard, ProgramSettings, RewardType, STAMPS_PER_CYCLE
+from .services import award_stamp_for_transaction
+
+SEEDED_CYCLES = 6
+SEEDED_MEMBERSHIPS = 12
+
+# endpoint -> maximum queries per request. Authentication is forced, so these
+# count only the work the view itself does. Throttle buckets live in the cache.
+QUERY_BUDGETS = {
+    "lookup": 3,
+    "lookup (cached)": 1,
+    # card, cycles, stamps
+    "scan": 3,
+    "scan (cached)": 0,
+    # one page, customer and active cycle joined
+    "list": 1,
+    "retrieve": 3,
+    "history": 3,
+    # the membership is still resolved before the cached payload is served
+    "history (cached)": 1,
+    "stamps": 2,
+    "stamps (cycle summaries)": 2,
+    "history-summary": 3,
+    "history-summary lookup": 3,
+    # lock, cycle rollover, stamp and counters inside a savepoint, then the
+    # daily rollup after commit
+    "add-stamp": 10,
+    "redeem": 6,
+    # customer and membership inserts, welcome stamp, then the full payload
+    "activate-card": 16,
+    "replace-card": 8,
+    # report endpoints: one aggregate per table
+    "reports/dashboard": 3,
+    "reports/summary": 2,
+    "reports/summary/csv": 2,
+    "reports/rewards": 1,
+    "reports/rewards/csv": 1,
+    "reports/transactions": 1,
+    "reports/transactions/daily": 1,
+    "reports/transactions/period": 1,
+    "reports/transactions/csv": 1,
+    "exports/stamps.csv": 2,
+}
+
+
+@override_settings(MEMBERSHIP_CACHE_SECONDS=60, THROTTLE_STORE="cache")
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user_model = get_user_model()
+        cls.admin = user_model.objects.create_user(username="admin-budget", password="pass1234", role=UserRole.ADMIN)
+        cls.memberships = []
+        for index in range(SEEDED_MEMBERSHIPS):
+            customer = Customer.objects.create(name=f"Budget {index}", phone=f"08111{index:05d}")
+            card = MembershipCard.objects.create(card_number=f"CARD-BUDGET-{index}")
+            cls.memberships.append(Membership.create_new(customer=customer, card=card))
+        cls.membership = cls.memberships[0]
+        cls.card = cls.membership.card
+        # The welcome stamp plus enough purchases to close several cycles.
+        with cls.captureOnCommitCallbacks(execute=True):
+            for number in range(SEEDED_CYCLES * STAMPS_PER_CYCLE - 1):
+                award_stamp_for_transaction(cls.membership, Decimal("60000"), f"POS-BUDGET-{number}")
+        cls.spare_card = MembershipCard.objects.create(card_number="CARD-BUDGET-SPARE")
+
+    def setUp(self):
+        audit.clear()
+        self.addCleanup(audit.clear)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # Hot paths run with the settings row already cached.
+        ProgramSettings.clear_cache()
+        ProgramSettings.get_cached()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def assertWithinBudget(self, name, method, url, data=None, expected_status=200):
+        # Work deferred to on_commit still runs once per request in production.
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data=data, format="json" if method == "post" else None)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, expected_status, getattr(response, "data", None))
+        budget = QUERY_BUDGETS[name]
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f"{name} ran {len(queries)} queries, budget is {budget}:\n"
+            + "\n".join(query["sql"] for query in queries.captured_queries),
+        )
+        return response
+
+    def _detail(self, action):
+        return reverse(f"memberships-{action}", kwargs={"pk": self.membership.pk})
+
+    def test_budget_lookup(self):
+        url = reverse("memberships-lookup")
+        self.assertWithinBudget("lookup", "get", url, {"q": self.card.card_number})
+        self.assertWithinBudget("lookup (cached)", "get", url, {"q": self.card.card_number})
+
+    def test_budget_scan(self):
+        url = reverse("memberships-scan")
+        self.assertWithinBudget("scan", "get", url, {"public_id": str(self.card.public_id)})
+        self.assertWithinBudget("scan (cached)", "get", url, {"public_id": str(self.card.public_id)})
+
+    def test_budget_list_and_retrieve(self):
+        self.assertWithinBudget("list", "get", reverse("memberships-list"))
+        self.assertWithinBudget("retrieve", "get", self._detail("detail"))
+
+    def test_budget_history(self):
+        self.assertWithinBudget("history", "get", self._detail("history"))
+        self.assertWithinBudget("history (cached)", "get", self._detail("history"))
+        self.assertWithinBudget("stamps", "get", self._detail("stamps"))
+        self.assertWithinBudget("stamps (cycle summaries)", "get", self._detail("stamps"), {"summary": "cycles"})
+
+    def test_budget_history_summary(self):
+        self.assertWithinBudget("history-summary", "get", self._detail("history-summary"))
+        self.assertWithinBudget(
+            "history-summary lookup",
+            "get",
+            reverse("memberships-history-summary-lookup"),
+            {"card_number": self.card.card_number},
+        )
+
+    def test_budget_add_stamp(self):
+        self.assertWithinBudget(
+            "add-stamp",
+            "post",
+            self._detail("add-stamp"),
+            {"transaction_amount": "60000", "pos_receipt_number": "POS-BUDGET-NEW"},
+            expected_status=201,
+        )
+
+    def test_budget_redeem(self):
+        self.assertWithinBudget("redeem", "post", self._detail("redeem-reward"), {"reward_type": RewardType.FREE_DRINK})
+
+    def test_budget_activate_card(self):
+        self.assertWithinBudget(
+            "activate-card",
+            "post",
+            reverse("memberships-activate-card"),
+            {"card_number": self.spare_card.card_number, "name": "New Member", "phone": "0812999000"},
+            expected_status=201,
+        )
+
+    def test_budget_replace_card(self):
+        self.assertWithinBudget(
+            "replace-card", "post", self._detail("replace-card"), {"card_number": self.spare_card.card_number}
+        )
+
+    def test_budget_reports(self):
+        for name, url_name in [
+            ("reports/dashboard", "reports-dashboard"),
+            ("reports/summary", "reports-summary"),
+            ("reports/summary/csv", "reports-summary-csv"),
+            ("reports/rewards", "reports-rewards"),
+            ("reports/rewards/csv", "reports-rewards-csv"),
+            ("reports/transactions", "reports-transactions"),
+            ("reports/transactions/daily", "reports-transactions-daily"),
+            ("reports/transactions/period", "reports-transactions-period"),
+            ("reports/transactions/csv", "reports-transactions-csv"),
+        ]:
+            with self.subTest(name):
+                self.assertWithinBudget(name, "get", reverse(url_name))
+
+    def test_budget_exports(self):
+        self.assertWithinBudget(
+            "exports/stamps.csv", "get", reverse("exports", kwargs={"dataset": "stamps", "extension": "csv"})
+        )
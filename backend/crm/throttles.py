@@ -1,7 +1,202 @@
+"""Rate-limit buckets shared by every worker.
+
+Each bucket holds up to ``num_requests`` tokens and refills at
+``num_requests / duration`` tokens per second, so "30/min" allows a burst of
+30 and then one request every two seconds. A request spends one token from
+every bucket it belongs to; when any of them is empty, the tokens already
+taken are handed back.
+
+``THROTTLE_STORE`` picks where buckets live:
+
+- ``"cache"`` (default with ``REDIS_URL``) keeps sliding-window counters in
+  the default cache, bumped with atomic ``incr``. Only a shared cache makes
+  the limits hold across workers.
+- ``"file"`` (default otherwise) uses a SQLite file at ``THROTTLE_STORE_PATH``
+  shared by the workers of one host, without touching the main database.
+- ``"db"`` uses the ``crm_throttlebucket`` table and works across hosts, but
+  costs a write on the primary for every throttled request.
+
+In the file and db stores a single upsert both refills and takes a token, so
+concurrent workers can never overspend a bucket. Run ``purge_throttle_buckets``
+to drop rows of idle buckets.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from rest_framework.throttling import SimpleRateThrottle
 
+DEVICE_HEADER = "X-Device-ID"
+
+_TABLE = "crm_throttlebucket"
+_CREATE_TABLE = (
+    f"CREATE TABLE IF NOT EXISTS {_TABLE} ("
+    "id INTEGER PRIMARY KEY, key VARCHAR(200) NOT NULL UNIQUE, "
+    "tokens REAL NOT NULL, updated_at REAL NOT NULL, allowed BOOL NOT NULL)"
+)
+
+
+def _consume_sql(vendor: str, placeholder: str) -> str:
+    least, greatest = ("LEAST", "GREATEST") if vendor == "postgresql" else ("MIN", "MAX")
+    p = placeholder
+    refilled = (
+        f"{least}({p}, {_TABLE}.tokens + {greatest}(0, EXCLUDED.updated_at - {_TABLE}.updated_at) * {p})"
+    )
+    return (
+        f"INSERT INTO {_TABLE} (key, tokens, updated_at, allowed) VALUES ({p}, {p}, {p}, {p}) "
+        f"ON CONFLICT (key) DO UPDATE SET "
+        f"tokens = CASE WHEN {refilled} >= 1 THEN {refilled} - 1 ELSE {refilled} END, "
+        f"allowed = {refilled} >= 1, "
+        f"updated_at = EXCLUDED.updated_at "
+        f"RETURNING allowed, tokens"
+    )
+
+
+def _consume_params(key, capacity, rate, now):
+    # The refill expression appears four times in the statement.
+    return [key, capacity - 1, now, True, *[capacity, rate] * 4]
+
+
+def _refund_sql(vendor: str, placeholder: str) -> str:
+    least = "LEAST" if vendor == "postgresql" else "MIN"
+    p = placeholder
+    return f"UPDATE {_TABLE} SET tokens = {least}({p}, tokens + 1) WHERE key = {p}"
+
+
+def _purge_sql(placeholder: str) -> str:
+    return f"DELETE FROM {_TABLE} WHERE updated_at < {placeholder}"
+
+
+class CacheBucketStore:
+    """Sliding-window counters: the previous window, weighted by how much of it
+    still overlaps the last ``duration`` seconds, plus the current one."""
+
+    def _window_key(self, key, window):
+        return f"{key}:{window}"
+
+    def _window(self, capacity, rate, now):
+        duration = capacity / rate
+        window, offset = divmod(now, duration)
+        return duration, int(window), offset / duration
+
+    def consume(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        duration, window, elapsed = self._window(capacity, rate, now)
+        current = self._window_key(key, window)
+        # Kept for two windows: the next window still reads this one.
+        timeout = int(2 * duration) + 1
+        cache.add(current, 0, timeout)
+        try:
+            count = cache.incr(current)
+        except ValueError:
+            # Expired between add() and incr().
+            cache.set(current, 1, timeout)
+            count = 1
+        previous = cache.get(self._window_key(key, window - 1), 0)
+        used = previous * (1 - elapsed) + count
+        if used > capacity:
+            # A denied request does not count against the window.
+            self._release(current)
+            return False, capacity - used + 1
+        return True, capacity - used
+
+    def refund(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        _duration, window, _elapsed = self._window(capacity, rate, now)
+        self._release(self._window_key(key, window))
+
+    def _release(self, window_key):
+        try:
+            cache.decr(window_key)
+        except ValueError:
+            # The window expired in the meantime; there is nothing to give back.
+            pass
+
+    def purge(self, before):
+        """Cache entries expire on their own."""
+        return 0
+
+
+class DatabaseBucketStore:
+    def consume(self, key, capacity, rate, now=None):
+        """Take one token; returns ``(allowed, tokens left)``."""
+        now = time.time() if now is None else now
+        with connection.cursor() as cursor:
+            cursor.execute(_consume_sql(connection.vendor, "%s"), _consume_params(key, capacity, rate, now))
+            allowed, tokens = cursor.fetchone()
+        return bool(allowed), tokens
+
+    def refund(self, key, capacity, rate, now=None):
+        """Give back a token taken by ``consume``."""
+        with connection.cursor() as cursor:
+            cursor.execute(_refund_sql(connection.vendor, "%s"), [capacity, key])
+
+    def purge(self, before):
+        """Delete buckets last touched before ``before``; returns the number deleted."""
+        with connection.cursor() as cursor:
+            cursor.execute(_purge_sql("%s"), [before])
+            return cursor.rowcount
+
+    def reset(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {_TABLE}")
+
+
+class FileBucketStore:
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # SQLite connections must not cross a fork.
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_CREATE_TABLE)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def consume(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        row = self._connection().execute(
+            _consume_sql("sqlite", "?"), _consume_params(key, capacity, rate, now)
+        ).fetchone()
+        return bool(row[0]), row[1]
+
+    def refund(self, key, capacity, rate, now=None):
+        self._connection().execute(_refund_sql("sqlite", "?"), [capacity, key])
+
+    def purge(self, before):
+        return self._connection().execute(_purge_sql("?"), [before]).rowcount
+
+    def reset(self):
+        self._connection().execute(f"DELETE FROM {_TABLE}")
+
+
+_file_stores = {}
+
+
+def get_bucket_store():
+    store = getattr(settings, "THROTTLE_STORE", "file")
+    if store == "db":
+        return DatabaseBucketStore()
+    if store != "file":
+        return CacheBucketStore()
+    path = settings.THROTTLE_STORE_PATH
+    if path not in _file_stores:
+        _file_stores[path] = FileBucketStore(path)
+    return _file_stores[path]
+
 
 class BaseUserRateThrottle(SimpleRateThrottle):
+    """Bucket per cashier, plus one per device when it sends a registered ``X-Device-ID``."""
+
     def get_cache_key(self, request, view):
         if request.user and request.user.is_authenticated:
             ident = request.user.pk
@@ -9,6 +204,37 @@ class BaseUserRateThrottle(SimpleRateThrottle):
             ident = self.get_ident(request)
         return self.cache_format % {"scope": self.scope, "ident": ident}
 
+    def get_bucket_keys(self, request, view) -> list[str]:
+        keys = [self.get_cache_key(request, view)]
+        device = request.headers.get(DEVICE_HEADER, "").strip()
+        # Only registered devices get a bucket, so clients cannot mint new keys.
+        if device and device in getattr(settings, "THROTTLE_DEVICE_IDS", ()):
+            keys.append(f"throttle_{self.scope}_device_{device}")
+        return keys
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        capacity, duration = self.num_requests, self.duration
+        self.refill_rate = capacity / duration
+        store = get_bucket_store()
+        now = time.time()
+        self.tokens = capacity
+        taken = []
+        for key in self.get_bucket_keys(request, view):
+            allowed, tokens = store.consume(key, capacity, self.refill_rate, now)
+            self.tokens = min(self.tokens, tokens)
+            if not allowed:
+                # A denied request must not drain the buckets that did allow it.
+                for spent in taken:
+                    store.refund(spent, capacity, self.refill_rate, now)
+                return False
+            taken.append(key)
+        return True
+
+    def wait(self):
+        return max(0.0, (1 - self.tokens) / self.refill_rate)
+
 
 class ScanRateThrottle(BaseUserRateThrottle):
     scope = "scan"
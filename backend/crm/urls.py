@@ -1,8 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
 from .views import (
+    AuditLogViewSet,
     CustomerViewSet,
+    DashboardReportView,
+    ExportView,
     MembershipCardViewSet,
     MembershipViewSet,
     ProgramSettingsViewSet,
@@ -11,6 +16,7 @@ from .views import (
     SummaryReportView,
     SummaryReportCsvView,
     TransactionDailyReportView,
+    TransactionIngestView,
     TransactionPeriodReportView,
     TransactionReportCsvView,
     TransactionReportView,
@@ -21,9 +27,13 @@ router.register(r"customers", CustomerViewSet, basename="customers")
 router.register(r"memberships", MembershipViewSet, basename="memberships")
 router.register(r"cards", MembershipCardViewSet, basename="cards")
 router.register(r"settings", ProgramSettingsViewSet, basename="settings")
+router.register(r"audit-logs", AuditLogViewSet, basename="audit-logs")
 
 urlpatterns = [
     *router.urls,
+    path("transactions/ingest/", TransactionIngestView.as_view(), name="transactions-ingest"),
+    path("exports/<str:dataset>.<str:extension>", ExportView.as_view(), name="exports"),
+    path("reports/dashboard/", DashboardReportView.as_view(), name="reports-dashboard"),
     path("reports/summary/", SummaryReportView.as_view(), name="reports-summary"),
     path("reports/summary/csv/", SummaryReportCsvView.as_view(), name="reports-summary-csv"),
     path("reports/rewards/", RewardReportView.as_view(), name="reports-rewards"),
@@ -45,3 +55,12 @@ urlpatterns = [
         name="reports-transactions-csv",
     ),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    # Native async versions shadow the DRF actions at the same URLs.
+    urlpatterns = [
+        path("memberships/scan/", async_views.scan),
+        path("memberships/lookup/", async_views.lookup),
+        path("memberships/history-summary/", async_views.history_summary),
+        *urlpatterns,
+    ]
@@ -1,37 +1,76 @@
+from datetime import datetime, time, timedelta
 from decimal import Decimal
-import io
+import json
+import tempfile
 import uuid
 
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from django.http import HttpResponse
-from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.db import connection, transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 
-import qrcode
-
+from . import audit
+from . import cache as membership_cache
+from .card_sheets import SHEET_FORMATS, write_card_sheets
+from .exports import EXPORT_CONTENT_TYPES, EXPORT_DATASETS, export_rows, stream_csv, stream_ndjson
 from .models import (
     AuditAction,
     AuditLog,
     Customer,
     Membership,
     MembershipCard,
-    MembershipStatus,
     ProgramSettings,
     RewardType,
     Stamp,
 )
-from .serializers import CustomerSerializer, MembershipCardSerializer, MembershipSerializer, StampSerializer
-from .services import award_stamp_for_transaction
+from .qr import QR_FORMATS, get_qr_image, qr_etag
+from .reports import (
+    build_dashboard_data,
+    build_rewards_data,
+    build_summary_data,
+    build_transaction_totals,
+    rollup_rows,
+)
+from .routers import reporting_database
+from .pagination import AuditLogPagination, CycleSummaryPagination, StampHistoryPagination
+from .serializers import (
+    MEMBERSHIP_EXPANSIONS,
+    AuditLogSerializer,
+    CustomerSerializer,
+    CycleSummarySerializer,
+    MembershipCardSerializer,
+    MembershipListSerializer,
+    MembershipSerializer,
+    StampHistorySerializer,
+    StampSerializer,
+    parse_sparse_params,
+    shape_membership_payload,
+)
+from .services import (
+    award_stamp_for_transaction,
+    cards_for_sheets,
+    cycle_summaries,
+    find_membership_by_identifier,
+    ingest_transactions,
+    stamp_history,
+)
 from .throttles import QrRateThrottle, ReportsRateThrottle, ScanRateThrottle
 from users.permissions import IsAdminUserRole, IsCashierOrAdminRole
 
 
+MAX_INGEST_ROWS = 5000
+# Sheets rendered inside a request, serially; print_card_sheets handles bulk runs.
+MAX_SHEET_CARDS = 120
+MAX_PROVISION_CARDS = 50000
+
+
 def _parse_date_range(request):
     start_param = request.query_params.get("from")
     end_param = request.query_params.get("to")
@@ -59,53 +98,55 @@ def _parse_public_id(value):
         return None, Response({"detail": "Invalid public_id"}, status=status.HTTP_400_BAD_REQUEST)
 
 
-def _log_audit(action, request, membership=None, card=None, metadata=None):
-    AuditLog.objects.create(
-        action=action,
-        user=request.user if request.user and request.user.is_authenticated else None,
-        membership=membership,
-        card=card,
-        metadata=metadata or {},
-    )
-
-
-def _build_summary_data(start_date=None, end_date=None):
-    memberships = Membership.objects.all()
-    if start_date:
-        memberships = memberships.filter(created_at__date__gte=start_date)
-    if end_date:
-        memberships = memberships.filter(created_at__date__lte=end_date)
-
-    redeemed_stamps = Stamp.objects.filter(redeemed_at__isnull=False)
-    if start_date:
-        redeemed_stamps = redeemed_stamps.filter(redeemed_at__date__gte=start_date)
-    if end_date:
-        redeemed_stamps = redeemed_stamps.filter(redeemed_at__date__lte=end_date)
-
+def history_summary_data(membership_id, cycle) -> dict:
+    if cycle is None:
+        return {
+            "membership_id": membership_id,
+            "cycle_number": None,
+            "stamp_count": 0,
+            "is_full": False,
+        }
     return {
-        "active_members": memberships.filter(status=MembershipStatus.ACTIVE).count(),
-        "expired_members": memberships.filter(status=MembershipStatus.EXPIRED).count(),
-        "free_drink_used": redeemed_stamps.filter(reward_type=RewardType.FREE_DRINK).count(),
-        "voucher_used": redeemed_stamps.filter(reward_type=RewardType.VOUCHER_50K).count(),
+        "membership_id": membership_id,
+        "cycle_number": cycle.cycle_number,
+        "stamp_count": cycle.stamp_count,
+        "is_full": cycle.is_full,
     }
 
 
-def _build_rewards_data(start_date=None, end_date=None):
-    used = Stamp.objects.filter(redeemed_at__isnull=False)
-    unused = Stamp.objects.filter(redeemed_at__isnull=True)
-    if start_date:
-        used = used.filter(redeemed_at__date__gte=start_date)
-        unused = unused.filter(created_at__date__gte=start_date)
-    if end_date:
-        used = used.filter(redeemed_at__date__lte=end_date)
-        unused = unused.filter(created_at__date__lte=end_date)
+def _log_audit(
+    action,
+    request,
+    membership=None,
+    card=None,
+    metadata=None,
+    membership_id=None,
+    card_id=None,
+    strict=False,
+):
+    audit.record(
+        action,
+        user=request.user if request.user and request.user.is_authenticated else None,
+        membership_id=membership.pk if membership else membership_id,
+        card_id=card.pk if card else card_id,
+        metadata=metadata,
+        strict=strict,
+    )
 
-    return {
-        "free_drink_used": used.filter(reward_type=RewardType.FREE_DRINK).count(),
-        "free_drink_unused": unused.filter(reward_type=RewardType.FREE_DRINK).count(),
-        "voucher_used": used.filter(reward_type=RewardType.VOUCHER_50K).count(),
-        "voucher_unused": unused.filter(reward_type=RewardType.VOUCHER_50K).count(),
-    }
+
+def _membership_queryset(fields=None, expand=None):
+    """Memberships with only the relations a ``fields``/``expand`` request will serialize."""
+    expand = set(MEMBERSHIP_EXPANSIONS) if expand is None else expand
+    if fields is not None:
+        expand = {name for name in expand if name.split(".")[0] in fields}
+    qs = Membership.objects.select_related("active_cycle")
+    if "customer" in expand:
+        qs = qs.select_related("customer")
+    if "cycles.stamps" in expand:
+        qs = qs.prefetch_related("cycles__stamps")
+    elif "cycles" in expand:
+        qs = qs.prefetch_related("cycles")
+    return qs
 
 
 class CustomerViewSet(viewsets.ModelViewSet):
@@ -113,9 +154,13 @@ class CustomerViewSet(viewsets.ModelViewSet):
     serializer_class = CustomerSerializer
     permission_classes = [IsCashierOrAdminRole]
 
+    def perform_update(self, serializer):
+        customer = serializer.save()
+        membership_cache.invalidate_membership(*customer.memberships.values_list("id", flat=True))
+
 
 class MembershipViewSet(viewsets.ModelViewSet):
-    queryset = Membership.objects.select_related("customer").prefetch_related("cycles__stamps").all()
+    queryset = Membership.objects.select_related("customer", "active_cycle").prefetch_related("cycles__stamps").all()
     serializer_class = MembershipSerializer
 
     def get_permissions(self):
@@ -132,73 +177,86 @@ class MembershipViewSet(viewsets.ModelViewSet):
         active_cycle = cycles.filter(is_closed=False).last()
         latest_cycle = cycles.last()
         cycle = active_cycle if active_only else (active_cycle or latest_cycle)
-
-        if cycle is None:
-            return {
-                "membership_id": membership.id,
-                "cycle_number": None,
-                "stamp_count": 0,
-                "is_full": False,
-            }
-
-        return {
-            "membership_id": membership.id,
-            "cycle_number": cycle.cycle_number,
-            "stamp_count": cycle.stamp_count,
-            "is_full": cycle.is_full,
-        }
+        return history_summary_data(membership.id, cycle)
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        if self.action == "list":
+            # Lists never touch cycles or stamps; detail views keep the full tree.
+            qs = Membership.objects.select_related("customer", "active_cycle")
+        elif self.action == "retrieve":
+            qs = _membership_queryset(*self._sparse_params())
+        elif self.action == "history":
+            # The cycle tree is loaded only when the payload is not cached.
+            qs = Membership.objects.select_related("customer", "active_cycle")
+        elif self.action in {"stamps", "history_summary", "add_stamp"}:
+            qs = Membership.objects.all()
+        elif self.action == "redeem_reward":
+            # Nothing here serializes the cycle tree; redeem audits the card.
+            qs = Membership.objects.select_related("card")
+        else:
+            qs = super().get_queryset()
         status_filter = self.request.query_params.get("status")
         if status_filter:
             qs = qs.filter(status=status_filter)
         return qs
 
+    def get_serializer_class(self):
+        if self.action == "list":
+            return MembershipListSerializer
+        return super().get_serializer_class()
+
     def create(self, request, *args, **kwargs):
         return Response(
             {"detail": "Direct membership creation disabled. Use activate-card."},
             status=status.HTTP_403_FORBIDDEN,
         )
 
+    def perform_destroy(self, instance):
+        membership_cache.invalidate_membership(instance.pk)
+        super().perform_destroy(instance)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request is not None and self.request.method == "GET":
+            context["fields"], context["expand"] = self._sparse_params()
+        return context
+
+    def _sparse_params(self):
+        return parse_sparse_params(self.request.query_params)
+
+    def _shaped(self, payload):
+        fields, expand = self._sparse_params()
+        if fields is None and expand is None:
+            return payload
+        return shape_membership_payload(payload, fields, expand)
+
+    def _cached_payload(self, membership):
+        payload = membership_cache.get_membership_payload(membership.pk)
+        if payload is not None:
+            return self._shaped(payload)
+        fields, expand = self._sparse_params()
+        if fields is None and expand is None:
+            # Lookups arrive without the cycle tree; load it in two queries, not one per cycle.
+            prefetch_related_objects([membership], "cycles__stamps")
+            payload = self.get_serializer(membership).data
+            membership_cache.set_membership_payload(membership.pk, payload)
+            return payload
+        # Partial payloads are not cached; only the requested relations are loaded.
+        membership = _membership_queryset(fields, expand).get(pk=membership.pk)
+        return self.get_serializer(membership).data
+
     @action(detail=False, methods=["get"], url_path="lookup")
     def lookup(self, request):
         identifier = request.query_params.get("q")
         if not identifier:
             return Response({"detail": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
-        # normalize common typos such as trailing slashes/spaces
-        identifier = identifier.strip().strip("/")
-
-        membership = (
-            Membership.objects.select_related("customer")
-            .prefetch_related("cycles__stamps")
-            .filter(card_number__iexact=identifier)
-            .first()
+        membership = find_membership_by_identifier(
+            identifier, Membership.objects.select_related("customer", "active_cycle")
         )
-        if membership is None:
-            membership = (
-                Membership.objects.select_related("customer")
-                .prefetch_related("cycles__stamps")
-                .filter(customer__phone__iexact=identifier)
-                .order_by("-start_date")
-                .first()
-            )
-        if membership is None:
-            try:
-                card = (
-                    MembershipCard.objects.select_related("membership__customer")
-                    .prefetch_related("membership__cycles__stamps")
-                    .get(public_id=identifier)
-                )
-                membership = card.membership
-            except (MembershipCard.DoesNotExist, ValueError, ValidationError):
-                membership = None
         if membership is None:
             return Response({"detail": "Membership not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        membership.refresh_status_by_date()
-        serializer = self.get_serializer(membership)
-        return Response(serializer.data)
+        return Response(self._cached_payload(membership))
 
     @action(detail=False, methods=["post"], url_path="activate-card")
     def activate_card(self, request):
@@ -242,6 +300,7 @@ class MembershipViewSet(viewsets.ModelViewSet):
             customer=customer,
             card=card,
         )
+        membership_cache.invalidate_card(card.public_id)
         _log_audit(
             AuditAction.ACTIVATE_CARD,
             request,
@@ -284,27 +343,44 @@ class MembershipViewSet(viewsets.ModelViewSet):
                 reward_type=reward_type,
                 redeemed_at__isnull=True,
             )
+            .select_related("cycle")
             .order_by("cycle__cycle_number", "number")
             .first()
         )
         if not stamp:
             return Response({"detail": "No reward available"}, status=status.HTTP_400_BAD_REQUEST)
 
-        stamp.mark_redeemed()
-        _log_audit(
-            AuditAction.REDEEM,
-            request,
-            membership=membership,
-            card=membership.card if hasattr(membership, "card") else None,
-            metadata={"reward_type": reward_type, "stamp_id": stamp.id},
-        )
+        # Redemptions are always audited: the entry commits with the redemption.
+        with transaction.atomic():
+            stamp.mark_redeemed()
+            _log_audit(
+                AuditAction.REDEEM,
+                request,
+                membership=membership,
+                card=membership.card if hasattr(membership, "card") else None,
+                metadata={"reward_type": reward_type, "stamp_id": stamp.id},
+                strict=True,
+            )
         return Response(StampSerializer(stamp).data)
 
     @action(detail=True, methods=["get"], url_path="history")
     def history(self, request, pk=None):
+        # Resolve first so filters, 404s and object permissions apply to cached payloads too.
         membership = self.get_object()
-        serializer = self.get_serializer(membership)
-        return Response(serializer.data)
+        return Response(self._cached_payload(membership))
+
+    @action(detail=True, methods=["get"], url_path="stamps")
+    def stamps(self, request, pk=None):
+        """Stamp history, newest first; ``?summary=cycles`` pages per-cycle totals instead."""
+        membership = self.get_object()
+        if request.query_params.get("summary") == "cycles":
+            paginator = CycleSummaryPagination()
+            page = paginator.paginate_queryset(cycle_summaries(membership.pk), request, view=self)
+            return paginator.get_paginated_response(CycleSummarySerializer(page, many=True).data)
+
+        paginator = StampHistoryPagination()
+        page = paginator.paginate_queryset(stamp_history(membership.pk), request, view=self)
+        return paginator.get_paginated_response(StampHistorySerializer(page, many=True).data)
 
     @action(detail=True, methods=["get"], url_path="history-summary")
     def history_summary(self, request, pk=None):
@@ -327,12 +403,12 @@ class MembershipViewSet(viewsets.ModelViewSet):
 
         card = None
         if card_number:
-            card = MembershipCard.objects.filter(card_number=card_number).first()
+            card = MembershipCard.objects.select_related("membership").filter(card_number=card_number).first()
         if card is None and public_id:
             public_uuid, error_response = _parse_public_id(public_id)
             if error_response:
                 return error_response
-            card = MembershipCard.objects.filter(public_id=public_uuid).first()
+            card = MembershipCard.objects.select_related("membership").filter(public_id=public_uuid).first()
         if card is None or card.membership is None:
             return Response({"detail": "Membership not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -346,23 +422,26 @@ class MembershipViewSet(viewsets.ModelViewSet):
         if error_response:
             return error_response
 
+        metadata = {"public_id": str(public_uuid)}
+        entry = membership_cache.get_card_entry(public_uuid)
+        if entry is not None:
+            card_id, membership_id = entry
+            payload = membership_cache.get_membership_payload(membership_id)
+            if payload is not None:
+                audit.record_scan(request, card_id, membership_id, metadata=metadata)
+                return Response(self._shaped(payload))
+
         card = (
-            MembershipCard.objects.select_related("membership__customer")
+            MembershipCard.objects.select_related("membership__customer", "membership__active_cycle")
             .filter(public_id=public_uuid)
             .first()
         )
         if card is None or card.membership is None:
             return Response({"detail": "Membership not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        _log_audit(
-            AuditAction.SCAN,
-            request,
-            membership=card.membership,
-            card=card,
-            metadata={"public_id": str(card.public_id)},
-        )
-        serializer = self.get_serializer(card.membership)
-        return Response(serializer.data)
+        audit.record_scan(request, card.pk, card.membership_id, metadata=metadata)
+        membership_cache.set_card_entry(public_uuid, card.pk, card.membership_id)
+        return Response(self._cached_payload(card.membership))
 
     @action(detail=True, methods=["post"], url_path="replace-card")
     def replace_card(self, request, pk=None):
@@ -402,6 +481,7 @@ class MembershipViewSet(viewsets.ModelViewSet):
 
         membership.card_number = new_card.card_number
         membership.save(update_fields=["card_number"])
+        membership_cache.invalidate_card(old_card.public_id if old_card else None, new_card.public_id)
 
         _log_audit(
             AuditAction.REPLACE_CARD,
@@ -423,37 +503,120 @@ class MembershipCardViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewS
     serializer_class = MembershipCardSerializer
     permission_classes = [IsCashierOrAdminRole]
 
+    def perform_content_negotiation(self, request, force=False):
+        # On the qr action ?format= picks the image type rather than a renderer.
+        return super().perform_content_negotiation(request, force=force or self.action == "qr")
+
     @action(detail=False, methods=["get"], url_path="qr", throttle_classes=[QrRateThrottle])
     def qr(self, request):
         public_id = request.query_params.get("public_id")
         public_uuid, error_response = _parse_public_id(public_id)
         if error_response:
             return error_response
+        fmt = request.query_params.get("format", "png")
+        if fmt not in QR_FORMATS:
+            return Response({"detail": "Invalid format, use 'png' or 'svg'"}, status=status.HTTP_400_BAD_REQUEST)
 
-        card = MembershipCard.objects.filter(public_id=public_uuid).first()
-        if card is None:
+        if not MembershipCard.objects.filter(public_id=public_uuid).exists():
             return Response({"detail": "Card not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        img = qrcode.make(str(card.public_id))
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        return HttpResponse(buffer.getvalue(), content_type="image/png")
+        etag = qr_etag(public_uuid, fmt)
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(get_qr_image(public_uuid, fmt), content_type=QR_FORMATS[fmt])
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, max-age=31536000, immutable"
+        return response
+
+    @action(detail=False, methods=["post"], url_path="provision", permission_classes=[IsAdminUserRole])
+    def provision(self, request):
+        try:
+            count = int(request.data.get("count"))
+        except (TypeError, ValueError):
+            return Response({"detail": "count must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < count <= MAX_PROVISION_CARDS:
+            return Response(
+                {"detail": f"count must be between 1 and {MAX_PROVISION_CARDS}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cards = MembershipCard.provision(count)
+        return Response(
+            {
+                "count": len(cards),
+                "first_card_number": cards[0].card_number,
+                "last_card_number": cards[-1].card_number,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=False, methods=["post"], url_path="sheets", permission_classes=[IsAdminUserRole])
+    def sheets(self, request):
+        fmt = request.data.get("format", "pdf")
+        if fmt not in SHEET_FORMATS:
+            return Response({"detail": "Invalid format, use pdf, png or svg"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            count, start_id, end_id = (
+                int(request.data[key]) if request.data.get(key) not in (None, "") else None
+                for key in ("count", "start_id", "end_id")
+            )
+        except (TypeError, ValueError):
+            return Response(
+                {"detail": "count, start_id and end_id must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if count is not None and not 0 < count <= MAX_SHEET_CARDS:
+            return Response(
+                {"detail": f"count must be between 1 and {MAX_SHEET_CARDS}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # One row past the cap is enough to tell the range is too large.
+        cards = cards_for_sheets(count=count, start_id=start_id, end_id=end_id, limit=MAX_SHEET_CARDS + 1)
+        if not cards:
+            return Response({"detail": "No cards to print"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(cards) > MAX_SHEET_CARDS:
+            return Response(
+                {"detail": f"At most {MAX_SHEET_CARDS} cards per request; use print_card_sheets"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        output = tempfile.TemporaryFile()
+        write_card_sheets(cards, output, fmt=fmt, workers=1)
+        output.seek(0)
+        extension = "pdf" if fmt == "pdf" else "zip"
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename=f"card_sheets.{extension}",
+            content_type=SHEET_FORMATS[fmt],
+        )
 
 
 class ProgramSettingsViewSet(viewsets.ViewSet):
     permission_classes = [IsAdminUserRole]
 
     def list(self, request):
-        settings = ProgramSettings.get_solo()
-        data = {
-            "membership_fee": settings.membership_fee,
-            "membership_duration_months": settings.membership_duration_months,
-            "discount_percent": settings.discount_percent,
-            "min_amount_for_stamp": settings.min_amount_for_stamp,
-            "reward_stamp_1_type": settings.reward_stamp_1_type,
-            "reward_stamp_10_type": settings.reward_stamp_10_type,
-        }
-        return Response(data)
+        settings = ProgramSettings.get_cached()
+        etag = f'"settings-v{settings.version}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(
+                {
+                    "version": settings.version,
+                    "membership_fee": settings.membership_fee,
+                    "membership_duration_months": settings.membership_duration_months,
+                    "discount_percent": settings.discount_percent,
+                    "min_amount_for_stamp": settings.min_amount_for_stamp,
+                    "reward_stamp_1_type": settings.reward_stamp_1_type,
+                    "reward_stamp_10_type": settings.reward_stamp_10_type,
+                }
+            )
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
 
     def create(self, request):
         settings = ProgramSettings.get_solo()
@@ -471,6 +634,90 @@ class ProgramSettingsViewSet(viewsets.ViewSet):
         return self.list(request)
 
 
+class TransactionIngestView(APIView):
+    permission_classes = [IsCashierOrAdminRole]
+
+    def post(self, request):
+        rows = request.data.get("transactions") if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({"detail": "transactions must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > MAX_INGEST_ROWS:
+            return Response(
+                {"detail": f"At most {MAX_INGEST_ROWS} transactions per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not all(isinstance(row, dict) for row in rows):
+            return Response({"detail": "Each transaction must be an object"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = ingest_transactions(rows)
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        return Response({"counts": counts, "results": results})
+
+
+class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = AuditLog.objects.all()
+    serializer_class = AuditLogSerializer
+    permission_classes = [IsAdminUserRole]
+    pagination_class = AuditLogPagination
+    filter_fields = ("action", "user", "membership", "card")
+
+    def filter_queryset(self, queryset):
+        params = self.request.query_params
+        for field in self.filter_fields:
+            value = params.get(field)
+            if not value:
+                continue
+            if field != "action" and not value.isdigit():
+                raise ParseError(f"Invalid {field}")
+            queryset = queryset.filter(**{field if field == "action" else f"{field}_id": value})
+
+        start_date, end_date, error_response = _parse_date_range(self.request)
+        if error_response:
+            raise ParseError(error_response.data["detail"])
+        # Whole-day bounds on created_at itself so the (…, created_at) indexes apply.
+        if start_date:
+            queryset = queryset.filter(created_at__gte=timezone.make_aware(datetime.combine(start_date, time.min)))
+        if end_date:
+            end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+            queryset = queryset.filter(created_at__lt=end)
+
+        metadata = params.get("metadata")
+        if metadata:
+            try:
+                metadata = json.loads(metadata)
+            except ValueError:
+                metadata = None
+            if not isinstance(metadata, dict) or not metadata:
+                raise ParseError("metadata must be a JSON object")
+            if connection.vendor == "postgresql":
+                # Containment is what the GIN index on metadata serves.
+                queryset = queryset.filter(metadata__contains=metadata)
+            else:
+                queryset = queryset.filter(**{f"metadata__{key}": value for key, value in metadata.items()})
+        return queryset
+
+
+class ExportView(APIView):
+    permission_classes = [IsAdminUserRole]
+    throttle_classes = [ReportsRateThrottle]
+
+    def get(self, request, dataset, extension):
+        if dataset not in EXPORT_DATASETS or extension not in EXPORT_CONTENT_TYPES:
+            return Response({"detail": "Unknown export"}, status=status.HTTP_404_NOT_FOUND)
+        start_date, end_date, error_response = _parse_date_range(request)
+        if error_response:
+            return error_response
+        using = reporting_database(start_date, end_date)
+
+        columns, rows = export_rows(dataset, start_date=start_date, end_date=end_date, using=using)
+        stream = stream_csv(columns, rows) if extension == "csv" else stream_ndjson(columns, rows)
+        response = StreamingHttpResponse(stream, content_type=EXPORT_CONTENT_TYPES[extension])
+        response["Content-Disposition"] = f"attachment; filename=\"{dataset}.{extension}\""
+        return response
+
+
 class SummaryReportView(APIView):
     permission_classes = [IsCashierOrAdminRole]
     throttle_classes = [ReportsRateThrottle]
@@ -479,11 +726,25 @@ class SummaryReportView(APIView):
         start_date, end_date, error_response = _parse_date_range(request)
         if error_response:
             return error_response
+        using = reporting_database(start_date, end_date)
 
-        data = _build_summary_data(start_date=start_date, end_date=end_date)
+        data = build_summary_data(start_date=start_date, end_date=end_date, using=using)
         return Response(data)
 
 
+class DashboardReportView(APIView):
+    permission_classes = [IsCashierOrAdminRole]
+    throttle_classes = [ReportsRateThrottle]
+
+    def get(self, request):
+        start_date, end_date, error_response = _parse_date_range(request)
+        if error_response:
+            return error_response
+        using = reporting_database(start_date, end_date)
+
+        return Response(build_dashboard_data(start_date=start_date, end_date=end_date, using=using))
+
+
 class SummaryReportCsvView(APIView):
     permission_classes = [IsCashierOrAdminRole]
     throttle_classes = [ReportsRateThrottle]
@@ -492,8 +753,9 @@ class SummaryReportCsvView(APIView):
         start_date, end_date, error_response = _parse_date_range(request)
         if error_response:
             return error_response
+        using = reporting_database(start_date, end_date)
 
-        data = _build_summary_data(start_date=start_date, end_date=end_date)
+        data = build_summary_data(start_date=start_date, end_date=end_date, using=using)
         lines = ["active_members,expired_members,free_drink_used,voucher_used"]
         lines.append(
             f"{data['active_members']},{data['expired_members']},"
@@ -513,8 +775,9 @@ class RewardReportView(APIView):
         start_date, end_date, error_response = _parse_date_range(request)
         if error_response:
             return error_response
+        using = reporting_database(start_date, end_date)
 
-        data = _build_rewards_data(start_date=start_date, end_date=end_date)
+        data = build_rewards_data(start_date=start_date, end_date=end_date, using=using)
         return Response(data)
 
 
@@ -526,8 +789,9 @@ class RewardReportCsvView(APIView):
         start_date, end_date, error_response = _parse_date_range(request)
         if error_response:
             return error_response
+        using = reporting_database(start_date, end_date)
 
-        data = _build_rewards_data(start_date=start_date, end_date=end_date)
+        data = build_rewards_data(start_date=start_date, end_date=end_date, using=using)
         lines = [
             "free_drink_used,free_drink_unused,voucher_used,voucher_unused",
             f"{data['free_drink_used']},{data['free_drink_unused']},"
@@ -539,6 +803,15 @@ class RewardReportCsvView(APIView):
         return response
 
 
+def _period_start(day, period):
+    if period == "week":
+        start = day - timedelta(days=day.weekday())
+    else:
+        start = day.replace(day=1)
+    # Match the datetime values TruncWeek/TruncMonth used to return.
+    return timezone.make_aware(datetime.combine(start, time.min))
+
+
 class TransactionReportView(APIView):
     permission_classes = [IsCashierOrAdminRole]
     throttle_classes = [ReportsRateThrottle]
@@ -547,21 +820,9 @@ class TransactionReportView(APIView):
         start_date, end_date, error_response = _parse_date_range(request)
         if error_response:
             return error_response
+        using = reporting_database(start_date, end_date)
 
-        stamps = Stamp.objects.all()
-        if start_date:
-            stamps = stamps.filter(created_at__date__gte=start_date)
-        if end_date:
-            stamps = stamps.filter(created_at__date__lte=end_date)
-
-        data = {
-            "eligible_stamp_count": stamps.count(),
-            "total_transaction_amount": stamps.aggregate(
-                total=models.Sum("transaction_amount")
-            )["total"]
-            or 0,
-        }
-        return Response(data)
+        return Response(build_transaction_totals(start_date, end_date, using=using))
 
 
 class TransactionDailyReportView(APIView):
@@ -572,29 +833,15 @@ class TransactionDailyReportView(APIView):
         start_date, end_date, error_response = _parse_date_range(request)
         if error_response:
             return error_response
+        using = reporting_database(start_date, end_date)
 
-        stamps = Stamp.objects.all()
-        if start_date:
-            stamps = stamps.filter(created_at__date__gte=start_date)
-        if end_date:
-            stamps = stamps.filter(created_at__date__lte=end_date)
-
-        rows = (
-            stamps.annotate(day=TruncDate("created_at"))
-            .values("day")
-            .annotate(
-                eligible_stamp_count=models.Count("id"),
-                total_transaction_amount=models.Sum("transaction_amount"),
-            )
-            .order_by("day")
-        )
         data = [
             {
-                "date": row["day"].isoformat() if row["day"] else None,
-                "eligible_stamp_count": row["eligible_stamp_count"],
-                "total_transaction_amount": row["total_transaction_amount"] or 0,
+                "date": row.day.isoformat(),
+                "eligible_stamp_count": row.stamp_count,
+                "total_transaction_amount": row.total_transaction_amount,
             }
-            for row in rows
+            for row in rollup_rows(start_date, end_date, using=using)
         ]
         return Response(data)
 
@@ -607,6 +854,7 @@ class TransactionPeriodReportView(APIView):
         start_date, end_date, error_response = _parse_date_range(request)
         if error_response:
             return error_response
+        using = reporting_database(start_date, end_date)
 
         period = request.query_params.get("period", "month")
         if period not in {"week", "month"}:
@@ -615,30 +863,16 @@ class TransactionPeriodReportView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        stamps = Stamp.objects.all()
-        if start_date:
-            stamps = stamps.filter(created_at__date__gte=start_date)
-        if end_date:
-            stamps = stamps.filter(created_at__date__lte=end_date)
-
-        trunc = TruncWeek("created_at") if period == "week" else TruncMonth("created_at")
-        rows = (
-            stamps.annotate(period=trunc)
-            .values("period")
-            .annotate(
-                eligible_stamp_count=models.Count("id"),
-                total_transaction_amount=models.Sum("transaction_amount"),
+        # Rows arrive ordered by day, so periods come out in order too.
+        periods = {}
+        for row in rollup_rows(start_date, end_date, using=using):
+            bucket = periods.setdefault(
+                _period_start(row.day, period),
+                {"eligible_stamp_count": 0, "total_transaction_amount": Decimal(0)},
             )
-            .order_by("period")
-        )
-        data = [
-            {
-                "period": row["period"].isoformat() if row["period"] else None,
-                "eligible_stamp_count": row["eligible_stamp_count"],
-                "total_transaction_amount": row["total_transaction_amount"] or 0,
-            }
-            for row in rows
-        ]
+            bucket["eligible_stamp_count"] += row.stamp_count
+            bucket["total_transaction_amount"] += row.total_transaction_amount
+        data = [{"period": start.isoformat(), **totals} for start, totals in periods.items()]
         return Response(data)
 
 
@@ -650,28 +884,11 @@ class TransactionReportCsvView(APIView):
         start_date, end_date, error_response = _parse_date_range(request)
         if error_response:
             return error_response
-
-        stamps = Stamp.objects.all()
-        if start_date:
-            stamps = stamps.filter(created_at__date__gte=start_date)
-        if end_date:
-            stamps = stamps.filter(created_at__date__lte=end_date)
-
-        rows = (
-            stamps.annotate(day=TruncDate("created_at"))
-            .values("day")
-            .annotate(
-                eligible_stamp_count=models.Count("id"),
-                total_transaction_amount=models.Sum("transaction_amount"),
-            )
-            .order_by("day")
-        )
+        using = reporting_database(start_date, end_date)
 
         lines = ["date,eligible_stamp_count,total_transaction_amount"]
-        for row in rows:
-            day = row["day"].isoformat() if row["day"] else ""
-            total = row["total_transaction_amount"] or 0
-            lines.append(f"{day},{row['eligible_stamp_count']},{total}")
+        for row in rollup_rows(start_date, end_date, using=using):
+            lines.append(f"{row.day.isoformat()},{row.stamp_count},{row.total_transaction_amount}")
         content = "\n".join(lines)
         response = HttpResponse(content, content_type="text/csv")
         response["Content-Disposition"] = "attachment; filename=\"transaction_report.csv\""
@@ -8,40 +8,52 @@ import { apiFetch } from "@/lib/api";
 
 type Stamp = {
   id: number;
+  cycle_number: number;
   number: number;
   reward_type: string;
   redeemed_at: string | null;
 };
 
-type Cycle = {
-  id: number;
-  cycle_number: number;
-  is_closed: boolean;
-  stamps: Stamp[];
-};
-
 type Membership = {
   id: number;
   card_number: string;
   status: string;
   start_date: string;
   end_date: string;
+  stamp_count: number;
   customer: { name: string; phone: string };
-  cycles: Cycle[];
 };
 
+type StampPage = {
+  next: string | null;
+  results: Stamp[];
+};
+
+const MEMBER_FIELDS = "id,customer,card_number,status,start_date,end_date,stamp_count";
+
 export default function MemberDetailPage() {
   const params = useParams<{ identifier: string }>();
   const [data, setData] = useState<Membership | null>(null);
+  const [stamps, setStamps] = useState<Stamp[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
+  const loadStamps = async (membershipId: number, cursor: string | null) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+    const page = await apiFetch<StampPage>(`/memberships/${membershipId}/stamps/${query}`);
+    setStamps((current) => (cursor ? [...current, ...page.results] : page.results));
+    setNextCursor(page.next ? new URL(page.next).searchParams.get("cursor") : null);
+  };
+
   useEffect(() => {
     const load = async () => {
       try {
         const membership = await apiFetch<Membership>(
-          `/memberships/lookup?q=${encodeURIComponent(params.identifier)}`
+          `/memberships/lookup?q=${encodeURIComponent(params.identifier)}&fields=${MEMBER_FIELDS}&expand=customer`
         );
         setData(membership);
+        await loadStamps(membership.id, null);
       } catch (err) {
         setError(err instanceof Error ? err.message : "Member tidak ditemukan");
       }
@@ -52,11 +64,24 @@ export default function MemberDetailPage() {
     }
   }, [params.identifier]);
 
-  const latestCycle = data?.cycles?.[data.cycles.length - 1];
-  const stampCount = latestCycle?.stamps.length ?? 0;
-  const rewards = data
-    ? data.cycles.flatMap((cycle) => cycle.stamps).filter((stamp) => stamp.reward_type !== "none")
-    : [];
+  const loadMore = async () => {
+    if (!data || !nextCursor) {
+      return;
+    }
+    setLoadingMore(true);
+    try {
+      await loadStamps(data.id, nextCursor);
+    } catch (err) {
+      setError(err instanceof Error ? err.message : "Gagal memuat stamp");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Stamps arrive newest first, so the first one belongs to the current cycle.
+  const currentCycleNumber = stamps[0]?.cycle_number;
+  const stampCount = data?.stamp_count ?? 0;
+  const rewards = stamps.filter((stamp) => stamp.reward_type !== "none");
 
   return (
     <main className="space-y-8">
@@ -86,7 +111,7 @@ export default function MemberDetailPage() {
       <section className="grid gap-6 lg:grid-cols-2">
         <div className="rounded-2xl border border-white/15 bg-white/5 p-6 shadow-panel">
           <h2 className="text-lg font-semibold">Current Cycle</h2>
-          <p className="text-sm text-slate-300">Cycle #{latestCycle?.cycle_number ?? "-"}</p>
+          <p className="text-sm text-slate-300">Cycle #{currentCycleNumber ?? "-"}</p>
           <p className="text-sm text-slate-300">Stamp count: {stampCount}/10</p>
         </div>
         <div className="rounded-2xl border border-white/15 bg-white/5 p-6 shadow-panel">
@@ -94,9 +119,20 @@ export default function MemberDetailPage() {
           {!rewards.length && <p className="text-sm text-slate-300">No rewards yet.</p>}
           {rewards.map((reward) => (
             <p key={reward.id} className="text-sm text-slate-300">
-              Stamp #{reward.number} - {reward.reward_type} - {reward.redeemed_at ? "Redeemed" : "Available"}
+              Cycle #{reward.cycle_number} Stamp #{reward.number} - {reward.reward_type} -{" "}
+              {reward.redeemed_at ? "Redeemed" : "Available"}
             </p>
           ))}
+          {nextCursor && (
+            <button
+              type="button"
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="mt-3 rounded-full border border-white/20 px-4 py-1 text-xs text-slate-200 disabled:opacity-50"
+            >
+              {loadingMore ? "Memuat..." : "Load more"}
+            </button>
+          )}
         </div>
       </section>
     </main>